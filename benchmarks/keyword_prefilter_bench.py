@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the parser keyword prefilter.
+
+Compares the previous `any(word in text.lower() for word in KEYWORDS)` loop
+with every KeywordPrefilter engine on a synthetic multilingual corpus, for the
+default keyword set and for a large (300+) configured set.
+
+Usage: python -m benchmarks.keyword_prefilter_bench [n_messages]
+"""
+import sys
+import time
+import random
+
+from services.tg.keyword_prefilter import KeywordPrefilter, DEFAULT_KEYWORDS
+
+
+VOCABULARY = (
+    "привет всем подскажите пожалуйста где можно найти хорошего врача документы термин "
+    "вітаю друзі хто знає де купити квиток потяг зустріч сьогодні ввечері "
+    "hello everyone does anybody know a good doctor near the station tomorrow "
+    "hallo zusammen kennt jemand einen guten arzt termin bahnhof morgen bitte danke "
+    "Сдаю Квартира аренда жильё комната здаю оренда житло кімната apartment house room rent "
+    "Wohnung Miete Zimmer Unterkunft Haus"
+).split()
+
+
+def make_corpus(n: int, seed: int = 42, keyword_rate: float = .1) -> list:
+    rnd = random.Random(seed)
+    plain = [w for w in VOCABULARY if not KeywordPrefilter().matches(w)]
+    corpus = []
+    for _ in range(n):
+        words = rnd.choices(plain, k=rnd.randint(5, 120))
+        if rnd.random() < keyword_rate:
+            words.insert(rnd.randrange(len(words) + 1), rnd.choice(VOCABULARY))
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def bench(name: str, fn, corpus: list) -> int:
+    started = time.perf_counter()
+    hits = sum(1 for text in corpus if fn(text))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {elapsed * 1000:8.1f} ms  {len(corpus) / elapsed:12,.0f} msg/s  hits={hits}")
+    return hits
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    corpus = make_corpus(n)
+    keywords = [w for words in DEFAULT_KEYWORDS.values() for w in words]
+
+    print(f"{n} synthetic messages, {len(set(keywords))} keywords")
+    def previous(text: str) -> bool:
+        text = text.lower()
+        return any(word in text for word in keywords)
+
+    baseline = bench("any(word in text.lower())", previous, corpus)
+    for engine in ("substring", "regex", "aho-corasick"):
+        try:
+            prefilter = KeywordPrefilter(engine=engine)
+        except ImportError as e:
+            print(f"{engine:<28} skipped: {e}")
+            continue
+        hits = bench(f"KeywordPrefilter[{engine}]", prefilter.matches, corpus)
+        assert hits == baseline, f"{engine} prefilter disagrees with the baseline"
+
+    # большой набор ключевых слов (например, несколько языков и словоформ из конфига)
+    rnd = random.Random(7)
+    alphabet = "абвгдежзиклмнопрстуфхцчшщэюяabcdefghijklmnopqrstuvwxyzäöü"
+    large = keywords + ["".join(rnd.choices(alphabet, k=rnd.randint(4, 9))) for _ in range(300)]
+    print(f"\n{len(set(large))} keywords")
+
+    def previous_large(text: str) -> bool:
+        text = text.lower()
+        return any(word in text for word in large)
+
+    baseline = bench("any(word in text.lower())", previous_large, corpus)
+    for engine in ("regex", "aho-corasick"):
+        try:
+            prefilter = KeywordPrefilter(large, engine=engine)
+        except ImportError as e:
+            print(f"{engine:<28} skipped: {e}")
+            continue
+        hits = bench(f"KeywordPrefilter[{engine}]", prefilter.matches, corpus)
+        assert hits == baseline, f"{engine} prefilter disagrees with the baseline"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark of per-step snapshotting in the Orchestrator.
+
+Compares the previous `copy.deepcopy(container)` + `json.dumps(..., indent=4)` on
+the event loop with SessionManager.save_snapshot (per-channel encoding in a worker
+thread, streamed to disk) in the readable JSON format. Each variant runs in a fresh
+process, so `ru_maxrss` measures its own peak; a heartbeat task on the event loop
+records the longest stall. Then compares write/read time and size of every
+available snapshot format against `Container.from_json` of the JSON snapshot.
+
+Usage: python -m benchmarks.snapshot_bench [n_messages]
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import asyncio
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import aiofiles
+
+from models import Container, TelegramChannel, TelegramMessage
+from session_manager import DataclassJSONEncoder, SessionManager
+from snapshot_codec import CODECS, read_container, write_container
+
+
+WORDS = "сдаю квартиру комната аренда Wohnung Miete Zimmer warm kalt Nebenkosten центр вокзал свободна с".split()
+
+
+def make_container(n_messages: int, n_channels: int = 300, seed: int = 42) -> Container:
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    channels = [
+        TelegramChannel(city=f"City {i % 60}", name=f"Channel {i}", url=f"https://t.me/channel_{i}", messages=[])
+        for i in range(n_channels)
+    ]
+    for i in range(n_messages):
+        channels[rnd.randrange(n_channels)].messages.append(TelegramMessage(
+            text=" ".join(rnd.choices(WORDS, k=rnd.randint(20, 150))),
+            sender=f"@user_{rnd.randrange(10_000)}",
+            date=start + timedelta(minutes=i),
+        ))
+    return Container(channels=channels)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss — в килобайтах на Linux, в байтах на macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+async def previous(session: SessionManager, container: Container) -> None:
+    data = copy.deepcopy(container)
+    json_data = json.dumps(data, indent=4, cls=DataclassJSONEncoder, ensure_ascii=False)
+    async with aiofiles.open(os.path.join(session.session_path, "bench_snapshot.json"), "w", encoding="utf-8") as f:
+        await f.write(json_data)
+
+
+async def current(session: SessionManager, container: Container) -> None:
+    await session.save_snapshot("bench", container)
+
+
+async def measure(variant, container: Container, session: SessionManager) -> dict:
+    longest_stall = 0.0
+    interval = .005
+    finished = False
+
+    async def heartbeat():
+        nonlocal longest_stall
+        while not finished:
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            longest_stall = max(longest_stall, time.perf_counter() - before - interval)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(interval * 2)
+    started = time.perf_counter()
+    await variant(session, container)
+    elapsed = time.perf_counter() - started
+    finished = True
+    await beat
+    return {"elapsed": elapsed, "stall": longest_stall}
+
+
+def run_variant(name: str, n: int) -> None:
+    container = make_container(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        session = SessionManager(tmp, snapshot_format="json")
+        baseline = peak_rss_mb()
+        result = asyncio.run(measure({"previous": previous, "current": current}[name], container, session))
+        result["peak_delta"] = peak_rss_mb() - baseline
+        result["size"] = os.path.getsize(os.path.join(session.session_path, "bench_snapshot.json")) / 2 ** 20
+    print(json.dumps(result))
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--variant":
+        run_variant(sys.argv[2], int(sys.argv[3]))
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{n} synthetic messages in 300 channels")
+    for name in ("previous", "current"):
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.snapshot_bench", "--variant", name, str(n)],
+            capture_output=True, text=True, check=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{name:<10} {result['elapsed']:7.2f} s  peak RSS +{result['peak_delta']:7.1f} MB  "
+              f"longest loop stall {result['stall'] * 1000:8.1f} ms  snapshot {result['size']:.1f} MB")
+
+    print("\nsnapshot formats")
+    container = make_container(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, codec in CODECS.items():
+            path = os.path.join(tmp, f"bench_snapshot.{codec.extension}")
+            try:
+                started = time.perf_counter()
+                write_container(path, container, codec)
+                written = time.perf_counter() - started
+            except ImportError as e:
+                print(f"{name:<10} skipped: {e}")
+                continue
+
+            started = time.perf_counter()
+            assert read_container(path) == container
+            read = time.perf_counter() - started
+            print(f"{name:<10} write {written:6.2f} s  read {read:6.2f} s  {os.path.getsize(path) / 2 ** 20:7.1f} MB")
+
+            if name == "json":
+                started = time.perf_counter()
+                with open(path, "r", encoding="utf-8") as f:
+                    Container.from_json(f.read())
+                print(f"{'':<10} read via Container.from_json {time.perf_counter() - started:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
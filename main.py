@@ -1,4 +1,5 @@
 import asyncio
+import argparse
 import json
 
 from models import Container
@@ -7,14 +8,23 @@ from session_manager import SessionManager
 
 from utils import load_channels
 
-async def main():
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Запуск пайплайна сервисов по конфигурации.")
+    parser.add_argument("--config", default="config-tg-parser.json", help="путь к конфигурации пайплайна")
+    parser.add_argument("--profile", action="store_true",
+                        help="дамп cProfile на каждый шаг (profile_<шаг>.prof в директории сессии)")
+    parser.add_argument("--prometheus", action="store_true",
+                        help="дополнительно записать метрики в формате Prometheus (metrics.prom)")
+    return parser.parse_args()
+
+async def main(args: argparse.Namespace):
     """
     Главная точка входа в приложение.
     Загружает конфигурацию, инициализирует сервисы и запускает оркестратор.
     """
     # 1. Загружаем конфигурацию пайплайна
     try:
-        with open('config-tg-parser.json', 'r', encoding='utf-8') as f:
+        with open(args.config, 'r', encoding='utf-8') as f:
             config = json.load(f)
     except FileNotFoundError:
         print("[ERROR] config.json not found! Please create a configuration file.")
@@ -23,13 +33,24 @@ async def main():
         print("[ERROR] Could not parse config.json. Please check for syntax errors.")
         return
 
+    # флаги командной строки дополняют run_config
+    run_config = config.setdefault('run_config', {})
+    if args.profile:
+        run_config['profile'] = True
+    if args.prometheus:
+        run_config['prometheus'] = True
+
     # 2. Инициализируем менеджер сессий для этого конкретного запуска
-    session_manager = SessionManager()
+    session_manager = SessionManager(snapshot_format=run_config.get('snapshot_format', 'jsonl.gz'))
 
     # 3. Загружаем начальные данные для пайплайна.
     # В нашем случае, это список каналов из предыдущего этапа.
+    # Снепшот ищется в любом формате: новые сессии пишут .jsonl.gz, старые — .json
     try:
-        initial_data = await load_channels("data/SessionResults/2025-12-23_23-45-59/WebFilterService_snapshot.json") # load_channels("data/ParserService/2025-09-28_23-18-50.json") # 
+        snapshot_path = SessionManager.find_snapshot("data/SessionResults/2025-12-23_23-45-59", "WebFilterService")
+        if snapshot_path is None:
+            raise FileNotFoundError("WebFilterService snapshot")
+        initial_data = await load_channels(snapshot_path) # load_channels("data/ParserService/2025-09-28_23-18-50.json") # 
     except FileNotFoundError:
         print("[WARN] Initial data file not found. Starting with an empty container.")
         initial_data = Container(channels=[], messages=[])
@@ -39,7 +60,7 @@ async def main():
     await orchestrator.run(initial_data)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
 
 # 1. Нарисовать sequence диаграммку.
 # ++ 2. Модифицировать WebFilterService так, чтобы он лучше распознавал какие каналы принадлежат Баварии (сделать расширяемым на другие земли).
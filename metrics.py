@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from models import Container
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS процесса (МБ) или None, если платформа не позволяет его узнать."""
+    if resource is not None:
+        # ru_maxrss — в килобайтах на Linux, в байтах на macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2 ** 20
+    return None
+
+
+def rss_mb() -> Optional[float]:
+    """Текущий RSS процесса (МБ) или None."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def container_counts(container: Optional[Container]) -> Dict[str, int]:
+    if container is None:
+        return {"channels": 0, "messages": 0}
+    return {
+        "channels": len(container.channels),
+        "messages": sum(len(channel.messages or []) for channel in container.channels),
+    }
+
+
+class StepMetrics:
+    """Метрики одного шага пайплайна; заполняются Orchestrator'ом по ходу шага."""
+
+    def __init__(self, index: int, service: str):
+        self.index = index
+        self.service = service
+        self.cache: Optional[str] = None  # "snapshot" / "stage_cache" / None — шаг выполнялся
+        self.input: Dict[str, int] = {}
+        self.output: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+        self.wall_seconds = 0.0
+        self.cpu_seconds: Optional[float] = 0.0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.rss_mb: Optional[float] = None
+        self.peak_rss_delta_mb: Optional[float] = None
+        self.profile_path: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "service": self.service,
+            "cache": self.cache,
+            "started_at": round(self.started_at, 3),
+            "finished_at": round(self.finished_at, 3),
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": None if self.cpu_seconds is None else round(self.cpu_seconds, 3),
+            "rss_mb": None if self.rss_mb is None else round(self.rss_mb, 1),
+            "peak_rss_delta_mb": None if self.peak_rss_delta_mb is None else round(self.peak_rss_delta_mb, 1),
+            "input": self.input,
+            "output": self.output,
+            "counters": self.counters,
+            "profile": self.profile_path,
+        }
+
+
+class RunMetrics:
+    """
+    Метрики запуска пайплайна: по шагу — время (wall / CPU), прирост пикового RSS,
+    число каналов и сообщений на входе и выходе, попадание в кэш и счетчики сервиса
+    (Service.metrics: вызовы LLM, токены, RPC Telegram, секунды FloodWait, эмбеддинги...).
+
+    Пишутся в `metrics.json` директории сессии, при `prometheus=True` — еще и в `metrics.prom`
+    (текстовый формат Prometheus, подходит для textfile collector node_exporter).
+    При `profile=True` каждый шаг профилируется cProfile, дамп — `profile_<шаг>.prof`
+    (формат pstats: `python -m pstats`, snakeviz, gprof2dot). cProfile видит только поток
+    event loop; работу в asyncio.to_thread покажет внешний сэмплер (`py-spy record -- python main.py`).
+    CPU-время — процессное: в него входит работа фоновых потоков шага.
+    """
+
+    def __init__(self, session_path: str, execution: str = "batch", prometheus: bool = False, profile: bool = False):
+        self.session_path = session_path
+        self.execution = execution
+        self.prometheus = prometheus
+        self.profile = profile
+        self.steps: List[StepMetrics] = []
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    def add_step(self, service: str) -> StepMetrics:
+        step = StepMetrics(len(self.steps), service)
+        self.steps.append(step)
+        return step
+
+    @contextmanager
+    def profiling(self, label: str) -> Iterator[Optional[str]]:
+        """Профилирует блок cProfile при `profile`; отдает путь будущего дампа (или None)."""
+        if not self.profile:
+            yield None
+            return
+
+        path = os.path.join(self.session_path, f"profile_{label}.prof")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            pstats.Stats(profiler).dump_stats(path)
+
+    @contextmanager
+    def measure(self, step: StepMetrics) -> Iterator[StepMetrics]:
+        """Замеряет время, CPU и память шага (и профилирует его при `profile`)."""
+        peak_before = peak_rss_mb()
+        cpu_before = time.process_time()
+        step.started_at = time.perf_counter() - self._started
+        try:
+            with self.profiling(f"{step.index:02d}_{step.service}") as step.profile_path:
+                yield step
+        finally:
+            step.finished_at = time.perf_counter() - self._started
+            step.wall_seconds = step.finished_at - step.started_at
+            step.cpu_seconds = time.process_time() - cpu_before
+            step.rss_mb = rss_mb()
+            peak_after = peak_rss_mb()
+            if peak_before is not None and peak_after is not None:
+                step.peak_rss_delta_mb = peak_after - peak_before
+
+    def elapsed(self) -> float:
+        """Секунды с начала запуска."""
+        return time.perf_counter() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        peak = peak_rss_mb()
+        return {
+            "session": os.path.basename(os.path.normpath(self.session_path)),
+            "execution": self.execution,
+            "wall_seconds": round(time.perf_counter() - self._started, 3),
+            "cpu_seconds": round(time.process_time() - self._cpu_started, 3),
+            "peak_rss_mb": None if peak is None else round(peak, 1),
+            "steps": [step.to_dict() for step in self.steps],
+        }
+
+    def save(self) -> None:
+        report = self.to_dict()
+        with open(os.path.join(self.session_path, "metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        if self.prometheus:
+            with open(os.path.join(self.session_path, "metrics.prom"), "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus(report))
+        print(f"[INFO] Run metrics saved to {os.path.join(self.session_path, 'metrics.json')}")
+
+    @staticmethod
+    def to_prometheus(report: Dict[str, Any]) -> str:
+        """Отчет в текстовом формате Prometheus (exposition format 0.0.4)."""
+        def label(value: Any) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def metric_name(counter: str) -> str:
+            return re.sub(r"[^a-zA-Z0-9_]", "_", counter)
+
+        lines: List[str] = []
+        families: Dict[str, List[str]] = {}
+
+        def add(name: str, help_text: str, labels: Dict[str, Any], value: Any) -> None:
+            if value is None:
+                return
+            if name not in families:
+                families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            rendered = ",".join(f'{k}="{label(v)}"' for k, v in labels.items())
+            families[name].append(f"{name}{{{rendered}}} {float(value):g}")
+
+        run = {"session": report["session"], "execution": report["execution"]}
+        add("pipeline_run_wall_seconds", "Wall time of the pipeline run", run, report["wall_seconds"])
+        add("pipeline_run_cpu_seconds", "Process CPU time of the pipeline run", run, report["cpu_seconds"])
+        add("pipeline_run_peak_rss_megabytes", "Peak resident memory of the process", run, report["peak_rss_mb"])
+
+        for step in report["steps"]:
+            labels = {**run, "step": step["index"], "service": step["service"]}
+            add("pipeline_step_wall_seconds", "Wall time of a pipeline step", labels, step["wall_seconds"])
+            add("pipeline_step_cpu_seconds", "Process CPU time during a pipeline step", labels, step["cpu_seconds"])
+            add("pipeline_step_peak_rss_delta_megabytes", "Growth of peak resident memory during a step",
+                labels, step["peak_rss_delta_mb"])
+            add("pipeline_step_cache_hit", "1 if the step result came from a cache",
+                labels, 1 if step["cache"] else 0)
+            for direction in ("input", "output"):
+                for unit, value in step[direction].items():
+                    add(f"pipeline_step_{direction}_{unit}", f"Number of {unit} in the step {direction}", labels, value)
+            for counter, value in step["counters"].items():
+                add(f"pipeline_service_{metric_name(counter)}", f"Service counter {counter}", labels, value)
+
+        for family in families.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
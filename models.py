@@ -20,6 +20,9 @@ class TelegramMessage:
         )
     )
 
+    # URL других каналов, где встречалась копия этого сообщения (заполняет TgDedupService)
+    duplicates: Optional[List[str]] = None
+
 
 @dataclass_json
 @dataclass
@@ -1,9 +1,14 @@
-import copy
-from typing import Dict
-from models import Container
+import time
+import asyncio
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, List, Optional
+from models import Container, TelegramChannel
 
+from metrics import RunMetrics, container_counts
 from service_factory import ServiceFactory
 from session_manager import SessionManager
+from stage_cache import StageCache
+from streaming import ChunkStream
 
 from models import Container
 
@@ -12,6 +17,20 @@ class Orchestrator:
     Управляет выполнением пайплайна сервисов на основе конфигурационного файла.
     Поддерживает опциональное переиспользование артефактов (кэша)
     из предыдущих запусков (сессий).
+
+    Кроме того, результаты детерминированных стадий (Service.STAGE_CACHEABLE или
+    "stage_cache": true в шаге) кэшируются по отпечатку входа, параметров и артефактов:
+    неизменная стадия пропускается, измененная — всегда выполняется заново.
+    Размер кэша стадий ограничивают run_config.stage_cache_max_entries (на сервис)
+    и run_config.stage_cache_max_age_days.
+
+    run_config.execution = "streaming" запускает все стадии одновременно: они обмениваются
+    чанками через ограниченные очереди (ChunkStream), и следующая стадия начинает работу,
+    не дожидаясь конца предыдущей (см. Service.run_stream).
+
+    Метрики шагов (время, CPU, память, объем данных, кэш, счетчики сервисов) пишутся
+    в `metrics.json` сессии; run_config.prometheus — еще и `metrics.prom`,
+    run_config.profile — дамп cProfile на каждый шаг (см. RunMetrics).
     """
     def __init__(self, config: Dict, session_manager: SessionManager):
         """
@@ -21,6 +40,17 @@ class Orchestrator:
         self.run_config = config.get('run_config', {})
         self.session_manager = session_manager
         self.service_factory = ServiceFactory()
+        self.stage_cache = StageCache(
+            self.run_config.get('stage_cache_dir', 'data/StageCache'), snapshot_format=session_manager.codec.name,
+            max_entries=self.run_config.get('stage_cache_max_entries', 50),
+            max_age_days=self.run_config.get('stage_cache_max_age_days', 30),
+        )
+        self.metrics = RunMetrics(
+            session_manager.session_path,
+            execution=self.run_config.get('execution', 'batch'),
+            prometheus=self.run_config.get('prometheus', False),
+            profile=self.run_config.get('profile', False),
+        )
         print("[INFO] Orchestrator is initialized with config-driven pipeline.")
 
     async def run(self, initial_input: Container) -> None:
@@ -37,42 +67,207 @@ class Orchestrator:
         else:
             print(f"[WARN] Source session '{source_session_id}' not found. Cache will not be used.")
 
+        try:
+            if self.run_config.get('execution', 'batch') == 'streaming':
+                await self._run_streaming(current_data, source_session_path)
+            else:
+                await self._run_batch(current_data, source_session_path)
+        finally:
+            # метрики пишутся и для упавшего запуска — по ним видно, где он остановился
+            self.metrics.save()
+
+    async def _run_batch(self, current_data: Container, source_session_path: Optional[str]) -> None:
+        """Стадии по очереди: каждая получает весь результат предыдущей."""
         for step_config in self.pipeline_config:
             service_name = step_config['service']
             params = step_config.get('params', {})
             use_cache = step_config.get('use_cache', False)
             
-            cached_data = None
-            if use_cache and source_session_path:
-                print(f"[INFO] Attempting to load cached snapshot for '{service_name}'...")
-                cached_data = await self.session_manager.load_snapshot(source_session_path, service_name)
-
-            if cached_data:
-                print(f"[INFO] >>> Cache HIT for '{service_name}'. Skipping execution.")
-                current_data = cached_data
-            else:
-                if use_cache:
-                    print(f"[INFO] >>> Cache MISS for '{service_name}'. Running service.")
+            step = self.metrics.add_step(service_name)
+            step.input = container_counts(current_data)
+            with self.metrics.measure(step):
+                cached_data = None
+                if use_cache and source_session_path:
+                    print(f"[INFO] Attempting to load cached snapshot for '{service_name}'...")
+                    cached_data = await self.session_manager.load_snapshot(source_session_path, service_name)
+                    if cached_data:
+                        step.cache = "snapshot"
+
+                # Кэш стадий: результат с тем же входом, параметрами и артефактами
+                service_cls = self.service_factory.get_service_class(service_name)
+                fingerprint = None
+                if cached_data is None and step_config.get('stage_cache', service_cls.STAGE_CACHEABLE):
+                    fingerprint = await self.stage_cache.fingerprint(service_name, service_cls, params, current_data)
+                    cached_data = await self.stage_cache.load(service_name, fingerprint)
+                    if cached_data:
+                        step.cache = "stage_cache"
+                        print(f"[INFO] Stage cache entry {fingerprint[:12]} matches the current input and config.")
+                        fingerprint = None  # уже в кэше — сохранять повторно не нужно
+
+                if cached_data:
+                    print(f"[INFO] >>> Cache HIT for '{service_name}'. Skipping execution.")
+                    current_data = cached_data
+                else:
+                    if use_cache:
+                        print(f"[INFO] >>> Cache MISS for '{service_name}'. Running service.")
                 
-                # Создаем сервис с параметрами из конфига
-                service = await self.service_factory.create_service(
-                    name=service_name, 
-                    params=params
-                )
-
-                # Запускаем реальную логику сервиса
-                if hasattr(service, "__aenter__") and hasattr(service, "__aexit__"):    
-                    print(f"[INFO] Orchestrator is running '{service_name}' within context...")
-                    async with service:
-                        current_data = await service.run(current_data)
+                    # Создаем сервис с параметрами из конфига
+                    service = await self.service_factory.create_service(
+                        name=service_name, 
+                        params=params
+                    )
+
+                    # Запускаем реальную логику сервиса
+                    if hasattr(service, "__aenter__") and hasattr(service, "__aexit__"):    
+                        print(f"[INFO] Orchestrator is running '{service_name}' within context...")
+                        async with service:
+                            current_data = await service.run(current_data)
                     
-                else:
-                    # Сервис не требует управления жизненным циклом
-                    print(f"[INFO] Orchestrator is running '{service_name}'...")
-                    current_data = await service.run(current_data)
+                    else:
+                        # Сервис не требует управления жизненным циклом
+                        print(f"[INFO] Orchestrator is running '{service_name}'...")
+                        current_data = await service.run(current_data)
+
+                    step.counters = service.report_metrics()
+                    if fingerprint is not None:
+                        if service.result_cacheable():
+                            await self.stage_cache.save(service_name, fingerprint, current_data)
+                        else:
+                            print(f"[WARN] '{service_name}' had failed external calls; its result is not cached.")
+
+            step.output = container_counts(current_data)
             
-            # Сохраняем результат (новый или из кэша) как артефакт ТЕКУЩЕЙ сессии
-            await self.session_manager.save_snapshot(service_name, copy.deepcopy(current_data))
+            # Сохраняем результат (новый или из кэша) как артефакт ТЕКУЩЕЙ сессии.
+            # Копия не нужна: следующий шаг начнется только после записи снепшота
+            await self.session_manager.save_snapshot(service_name, current_data)
+
+        print("\n[INFO] Pipeline finished successfully.")
+        print(f"[INFO] All artifacts for this run are saved in: {self.session_manager.session_path}")
+
+    async def _run_streaming(self, initial_input: Container, source_session_path: Optional[str]) -> None:
+        """
+        Потоковое выполнение пайплайна. Каждая стадия — отдельная задача, стадии связаны
+        очередями на `run_config.stream_queue_size` чанков. Снепшот стадии пишется на диск
+        по мере того, как она отдает чанки.
+
+        Кэш: выполнение начинается после последнего шага с `use_cache`, для которого нашелся
+        снепшот в исходной сессии. Кэш стадий в этом режиме не используется — отпечаток
+        требует весь вход стадии целиком.
+
+        Метрики: стадии работают одновременно, поэтому для шага пишется интервал
+        (started_at / finished_at), а CPU-время и профиль — общие на весь пайплайн.
+        """
+        steps = self.pipeline_config
+        cached_service = None
+        start = 0
+
+        if source_session_path:
+            for i in reversed(range(len(steps))):
+                if not steps[i].get('use_cache', False):
+                    continue
+                if self.session_manager.find_snapshot(source_session_path, steps[i]['service']):
+                    print(f"[INFO] >>> Cache HIT for '{steps[i]['service']}'. Streaming starts after this step.")
+                    cached_service, start = steps[i]['service'], i + 1
+                    break
+
+        cached_step = self.metrics.add_step(cached_service) if cached_service else None
+        if cached_step:
+            cached_step.cache = "snapshot"
+            cached_step.output = container_counts(None)
+            cached_step.cpu_seconds = None
+
+        async def source() -> AsyncIterator[TelegramChannel]:
+            """Каналы для первой стадии: из снепшота кэша (лениво, с копией в текущую сессию) или из входа."""
+            if cached_service is None:
+                for channel in initial_input.channels:
+                    yield channel
+                return
+
+            cached_step.started_at = self.metrics.elapsed()
+            snapshot = self.session_manager.open_snapshot(cached_service)
+            async for batch in self.session_manager.iter_snapshot(source_session_path, cached_service):
+                await snapshot.write(batch)
+                for channel in batch:
+                    cached_step.output["channels"] += 1
+                    cached_step.output["messages"] += len(channel.messages or [])
+                    yield channel
+            await snapshot.close()
+            cached_step.finished_at = self.metrics.elapsed()
+            cached_step.wall_seconds = cached_step.finished_at - cached_step.started_at
+
+        steps = steps[start:]
+        if not steps:
+            async for _ in source():
+                pass
+            print("\n[INFO] Pipeline finished successfully.")
+            return
+
+        step_metrics = [self.metrics.add_step(step_config['service']) for step_config in steps]
+        # стадии изменяют каналы на месте — объем входа считается до запуска
+        source_counts = cached_step.output if cached_step else container_counts(initial_input)
+        services = []
+        for step_config in steps:
+            services.append(await self.service_factory.create_service(
+                name=step_config['service'],
+                params=step_config.get('params', {})
+            ))
+
+        queue_size = self.run_config.get('stream_queue_size', 16)
+        streams: List[ChunkStream] = [
+            ChunkStream(queue_size, step_config.get('stream_batch_messages')) for step_config in steps
+        ]
+        streams.append(ChunkStream(queue_size))
+        started = time.monotonic()
+
+        async def feed() -> None:
+            # каждый канал — отдельный чанк, чтобы первая стадия могла начать сразу
+            async for channel in source():
+                await streams[0].put(Container(channels=[channel]))
+            await streams[0].close()
+
+        async def stage(i: int) -> None:
+            service_name, service, step = steps[i]['service'], services[i], step_metrics[i]
+            step.started_at = self.metrics.elapsed()
+            step.cpu_seconds = None
+            step.output = container_counts(None)
+            snapshot = self.session_manager.open_snapshot(service_name)
+            async with AsyncExitStack() as stack:
+                if hasattr(service, "__aenter__") and hasattr(service, "__aexit__"):
+                    await stack.enter_async_context(service)
+                print(f"[INFO] Orchestrator is streaming through '{service_name}'...")
+
+                async for chunk in service.run_stream(streams[i]):
+                    # следующие стадии изменяют каналы на месте — чанк попадает в снепшот до передачи дальше
+                    await snapshot.write(chunk.channels)
+                    for unit, value in container_counts(chunk).items():
+                        step.output[unit] += value
+                    await streams[i + 1].put(chunk)
+                await streams[i + 1].close()
+
+            await snapshot.close()
+            step.finished_at = self.metrics.elapsed()
+            step.wall_seconds = step.finished_at - step.started_at
+            step.counters = service.report_metrics()
+            step.input = step_metrics[i - 1].output if i else source_counts
+            print(f"[INFO] '{service_name}' finished after {time.monotonic() - started:.1f}s. "
+                  f"Snapshot saved to {snapshot.file_path}")
+
+        async def drain() -> None:
+            async for _ in streams[-1]:
+                pass
+
+        tasks = [asyncio.ensure_future(coro) for coro in (feed(), *(stage(i) for i in range(len(steps))), drain())]
+        with self.metrics.profiling("pipeline") as profile_path:
+            for step in step_metrics:
+                step.profile_path = profile_path
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # упавшая стадия не должна оставить остальные ждать на очередях
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
 
         print("\n[INFO] Pipeline finished successfully.")
         print(f"[INFO] All artifacts for this run are saved in: {self.session_manager.session_path}")
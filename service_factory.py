@@ -1,11 +1,13 @@
 import os
-from typing import Dict, Any, Callable, Awaitable
+from typing import Dict, Any, Callable, Awaitable, Type
 from dotenv import load_dotenv
 
 from services.base import Service
 from services.tg.parser_service import TgParserService
 from services.tg.filter_service import TgFilterService
 from services.tg.publisher_service import TgPublisherService
+from services.tg.dedup_service import TgDedupService
+from services.tg.realtime_service import TgRealtimeService
 from services.web.filter_service import WebFilterService
 from services.web.parser_service import WebParserService
 
@@ -30,10 +32,29 @@ class ServiceFactory:
             "TgParserService": self._build_tg_parser_service,
             "TgFilterService": self._build_tg_filter_service,
             "TgPublisherService": self._build_publisher_service,
+            "TgDedupService": self._build_tg_dedup_service,
+            "TgRealtimeService": self._build_tg_realtime_service,
             "WebFilterService": self._build_web_filter_service,
             "WebParserService": self._build_web_parser_service,
         }
+        # Классы сервисов — чтобы узнать их свойства (например, STAGE_CACHEABLE), не создавая экземпляр
+        self._classes: Dict[str, Type[Service]] = {
+            "TgParserService": TgParserService,
+            "TgFilterService": TgFilterService,
+            "TgPublisherService": TgPublisherService,
+            "TgDedupService": TgDedupService,
+            "TgRealtimeService": TgRealtimeService,
+            "WebFilterService": WebFilterService,
+            "WebParserService": WebParserService,
+        }
+
 
+    def get_service_class(self, name: str) -> Type[Service]:
+        """Возвращает класс сервиса по его имени."""
+        service_cls = self._classes.get(name)
+        if not service_cls:
+            raise ValueError(f"Unknown service name: {name}")
+        return service_cls
 
     async def create_service(self, name: str, params: Dict[str, Any]) -> Service:
         """
@@ -74,6 +95,11 @@ class ServiceFactory:
         # Параметры из конфига передаются, если они есть
         if 'session_name' in params:
             init_args['session_name'] = params['session_name']
+        for key in ('incremental', 'state_path', 'return_window', 'max_concurrency', 'sender_cache_path',
+                    'keywords', 'keyword_engine', 'channel_registry_path', 'dead_channel_retry_days',
+                    'flood_sleep_threshold'):
+            if key in params:
+                init_args[key] = params[key]
         
         return TgParserService(**init_args)
 
@@ -94,15 +120,64 @@ class ServiceFactory:
             create_args['ml_model_name'] = params['ml_model_name']
         if 'confidence_threshold' in params:
             create_args['confidence_threshold'] = params['confidence_threshold']
+        if 'embedding_device' in params:
+            create_args['embedding_device'] = params['embedding_device']
+        if 'embedding_batch_size' in params:
+            create_args['embedding_batch_size'] = params['embedding_batch_size']
+        if 'warm_up' in params:
+            create_args['warm_up'] = params['warm_up']
+        if 'embedding_cache_dir' in params:
+            create_args['embedding_cache_dir'] = params['embedding_cache_dir']
+        if 'embedding_cache_max_entries' in params:
+            create_args['embedding_cache_max_entries'] = params['embedding_cache_max_entries']
+        if 'batch_mode' in params:
+            create_args['batch_mode'] = params['batch_mode']
+        for key in ('llm_max_concurrency', 'llm_requests_per_minute', 'llm_tokens_per_minute',
+                    'verdict_cache_path', 'verdict_cache_ttl_days', 'published_ledger_path', 'published_ledger_ttl_days'):
+            if key in params:
+                create_args[key] = params[key]
         
         return await TgFilterService.create(**create_args)
 
+    async def _build_tg_dedup_service(self, params: Dict[str, Any]) -> Service:
+        """Строитель для TgDedupService."""
+        init_args = {}
+
+        # Необязательные параметры из config.json
+        for key in ('threshold', 'shingle_size', 'num_perm', 'bands'):
+            if key in params:
+                init_args[key] = params[key]
+
+        return TgDedupService(**init_args)
+
+    async def _build_tg_realtime_service(self, params: Dict[str, Any]) -> Service:
+        """
+        Строитель для TgRealtimeService.
+        Вложенные сервисы создаются своими строителями из секций 'parser', 'filter' и 'publisher'.
+        """
+        init_args = {
+            'parser': await self._build_tg_parser_service(params['parser']),
+            'filter_service': await self._build_tg_filter_service(params['filter']),
+            'publisher': await self._build_publisher_service(params['publisher']),
+        }
+
+        # Необязательные параметры из config.json
+        for key in ('batch_size', 'flush_interval'):
+            if key in params:
+                init_args[key] = params[key]
+
+        return TgRealtimeService(**init_args)
+
     async def _build_publisher_service(self, params: Dict[str, Any]) -> Service:
         """Строитель для TgPublisherService."""
         init_args = {
             'bot_token': os.getenv("TG_BOT_TOKEN"),
             'channel_username': params['channel_username']
         }
+        for key in ('outbox_path', 'messages_per_minute', 'burst', 'max_attempts', 'mode', 'digest_max_length',
+                    'ledger_path', 'ledger_ttl_days', 'requeue_uncertain_hours'):
+            if key in params:
+                init_args[key] = params[key]
         
         return TgPublisherService(**init_args)
     
@@ -118,6 +193,13 @@ class ServiceFactory:
         # Необязательные параметры из config.json
         if 'model' in params:
             create_args['model'] = params['model']
+        for key in ('llm_max_concurrency', 'llm_requests_per_minute', 'llm_tokens_per_minute',
+                    'verdict_cache_path', 'verdict_cache_ttl_days', 'country', 'language',
+                    'geocode_cache_path', 'geocode_cache_ttl_days', 'geocode_negative_ttl_days',
+                    'gazetteer_path', 'gazetteer_min_confidence', 'gazetteer_fuzzy_min_confidence',
+                    'gazetteer_fallback'):
+            if key in params:
+                create_args[key] = params[key]
         
         return WebFilterService(**create_args)
     
@@ -125,5 +207,8 @@ class ServiceFactory:
         """Строитель для WebParserService."""
         init_args = {
         }
+        for key in ('backend', 'page_url', 'source_path', 'root_block_id', 'timeout'):
+            if key in params:
+                init_args[key] = params[key]
         
         return WebParserService(**init_args)
\ No newline at end of file
@@ -1,9 +1,54 @@
 from abc import ABC, abstractmethod
+from collections import Counter
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from models import Container
+from streaming import ChunkStream
 
 class Service(ABC):
+    # Результат зависит только от входного Container, параметров и артефактов —
+    # Orchestrator может переиспользовать его из кэша стадий (см. StageCache)
+    STAGE_CACHEABLE: bool = False
+    # Параметры конфига с путями к файлам, содержимое которых влияет на результат (модель, справочник)
+    CACHE_ARTIFACT_PARAMS: Tuple[str, ...] = ()
+    # Файлы (относительно корня репозитория), от которых результат зависит всегда (промты, данные).
+    # Код сервиса и импортируемых им модулей репозитория StageCache учитывает сам
+    CACHE_ARTIFACTS: Tuple[str, ...] = ()
+    # Увеличить, если результат изменился без изменения кода и артефактов (например, сменилась
+    # внешняя зависимость) — старые записи кэша стадий перестанут совпадать
+    CACHE_VERSION: int = 1
+    # Потоковый режим: run() можно применять к части каналов, по батчам примерно такого
+    # размера (в сообщениях). None — сервису нужен весь Container сразу (барьер)
+    STREAM_BATCH_MESSAGES: Optional[int] = None
+
     def __init__(self):
-        pass
+        # Счетчики работы сервиса (вызовы LLM, токены, RPC Telegram, ...) — попадают в metrics.json
+        self.metrics: Counter = Counter()
+
+    def result_cacheable(self) -> bool:
+        """
+        Можно ли положить результат последнего run() в кэш стадий. Сервисы с внешними
+        вызовами возвращают False, если часть из них упала и результат неполон.
+        """
+        return True
+
+    def report_metrics(self) -> Dict[str, float]:
+        """Счетчики для отчета о запуске; сервисы с вложенными компонентами добавляют их счетчики."""
+        return dict(self.metrics)
 
     @abstractmethod
     async def run():
-        pass
\ No newline at end of file
+        pass
+
+    async def run_stream(self, chunks: ChunkStream) -> AsyncIterator[Container]:
+        """
+        Потоковый режим (run_config.execution = "streaming"): принимает чанки предыдущей
+        стадии и отдает свои по мере готовности. По умолчанию — адаптер над run():
+        по батчам, если задан STREAM_BATCH_MESSAGES, иначе один вызов на весь поток.
+        """
+        if self.STREAM_BATCH_MESSAGES is None:
+            yield await self.run(await chunks.collect())
+            return
+
+        async for batch in chunks.batches(self.STREAM_BATCH_MESSAGES):
+            yield await self.run(batch)
@@ -0,0 +1,110 @@
+import random
+import asyncio
+from collections import Counter
+from typing import Any, List, Optional, Sequence, Union
+
+import httpx
+from google import genai
+from google.genai.errors import APIError
+
+from services.rate_limit import TokenBucket
+
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# сетевые сбои: aio-клиент SDK работает через httpx, его ошибки не наследуют ConnectionError
+RETRYABLE_EXCEPTIONS = (asyncio.TimeoutError, ConnectionError, httpx.TransportError)
+
+
+class LLMExecutor:
+    """
+    Исполнитель запросов к Gemini с ограничением параллелизма и частоты.
+
+    - semaphore ограничивает число одновременных запросов;
+    - два token bucket'а ограничивают запросы/минуту и токены/минуту;
+    - ответы 429/5xx и сетевые сбои повторяются с экспоненциальной задержкой и jitter.
+
+    Использует нативный асинхронный клиент SDK (`client.aio`), без
+    перекладывания блокирующих вызовов в потоки.
+
+    В `metrics` считаются запросы (llm_calls, llm_retries) и токены из usage_metadata ответов.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        model: str,
+        max_concurrency: int = 4,
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 250_000,
+        max_retries: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        metrics: Optional[Counter] = None,
+    ):
+        self.client = client
+        self.model = model
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.metrics = metrics if metrics is not None else Counter()
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+
+    @staticmethod
+    def estimate_tokens(contents: Sequence[str]) -> int:
+        """Грубая оценка: ~4 символа на токен, плюс запас на ответ."""
+        return sum(len(c) for c in contents) // 4 + 256
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def generate(self, contents: List[str]) -> Any:
+        """Выполняет один запрос generate_content с учетом лимитов и ретраев."""
+        tokens = self.estimate_tokens(contents)
+
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire()
+            await self._tokens.acquire(tokens)
+
+            try:
+                async with self._semaphore:
+                    self.metrics["llm_calls"] += 1
+                    response = await self.client.aio.models.generate_content(
+                        model=self.model,
+                        contents=contents,
+                    )
+                usage = getattr(response, "usage_metadata", None)
+                if usage is not None:
+                    self.metrics["llm_prompt_tokens"] += usage.prompt_token_count or 0
+                    self.metrics["llm_output_tokens"] += usage.candidates_token_count or 0
+                return response
+
+            except APIError as e:
+                if e.code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                self.metrics["llm_retries"] += 1
+                print(f"[WARN] Gemini returned {e.code}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})...")
+                if e.code == 429:
+                    # квота общая для всех воркеров — притормаживаем всех
+                    self._requests.pause(delay)
+                await asyncio.sleep(delay)
+
+            except RETRYABLE_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                self.metrics["llm_retries"] += 1
+                print(f"[WARN] Gemini request failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def map(self, requests: List[List[str]]) -> List[Union[Any, BaseException]]:
+        """
+        Выполняет пачку запросов параллельно.
+        Возвращает ответы в исходном порядке; неудачный запрос представлен исключением.
+        """
+        return await asyncio.gather(*(self.generate(c) for c in requests), return_exceptions=True)
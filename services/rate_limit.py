@@ -0,0 +1,52 @@
+import time
+import asyncio
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket.
+
+    Пополняется со скоростью `rate_per_minute` токенов в минуту до `capacity`.
+    `acquire` ждет, пока в ведре не накопится нужное количество токенов.
+    `pause` глобально останавливает выдачу токенов (например, на время
+    Retry-After / FloodWait) — ждать будут все потребители ведра.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # запрос больше емкости ведра никогда не выполнится — ограничиваем его емкостью
+        amount = min(amount, self.capacity)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу токенов на `seconds` секунд для всех ожидающих."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
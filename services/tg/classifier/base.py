@@ -1,52 +1,88 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 import asyncio
-import torch
-from sentence_transformers import SentenceTransformer
+from collections import Counter
 
 from models import TelegramMessage
 from .message_processor import FeatureExtractor
+from .embedding import EmbeddingModelRegistry, DEFAULT_EMBEDDING_MODEL
+from .embedding_cache import EmbeddingCache
 
 class Classifier(ABC):
-    def __init__(self):
+    def __init__(self, embedding_model: str = DEFAULT_EMBEDDING_MODEL, device: Optional[str] = None, batch_size: int = 32,
+                 embedding_cache: Optional[EmbeddingCache] = None):
+        """
+        :param embedding_model: имя SentenceTransformer-модели для метода "bge-m3"
+        :param device: 'cuda' / 'cpu' / None (автовыбор)
+        :param batch_size: размер батча при кодировании (обычно 32 или 64 в зависимости от памяти GPU)
+        :param embedding_cache: опциональный дисковый кэш эмбеддингов
+        """
         self.extractor = FeatureExtractor()
-
-    def _features_vectorize_impl(self, messages, extractor: FeatureExtractor) -> np.ndarray:
-        """Helper: extract numeric features for a list of messages using extractor."""
-        return np.array([list(extractor.extract(msg).values()) for msg in messages])
+        self.embedding_model = embedding_model
+        self.device = device
+        self.batch_size = batch_size
+        self.embedding_cache = embedding_cache
+        # embeddings_computed / embedding_cache_hits — для отчета о запуске (Service.report_metrics)
+        self.metrics: Counter = Counter()
+
+    def _features_vectorize_impl(self, messages, extractor: FeatureExtractor, n_jobs: int = 1) -> np.ndarray:
+        """Helper: extract an int32 feature matrix for a list of messages using extractor."""
+        return extractor.extract_batch(messages, n_jobs=n_jobs)
     
     def _gpu_vectorize_sync(self, texts: list[str]) -> np.ndarray:
         """Synchronous GPU/CPU encoding using a SentenceTransformer model.
 
         This method runs on the calling thread (it is intended to be executed
-        inside a thread-pool executor). It loads a BGE model and returns a
-        matrix of normalized embeddings.
+        inside a thread-pool executor). The encoder is taken from the
+        process-wide registry, so it is loaded only once per process.
         """
-
-        print("Loading model to device memory...")
-
-        # choose device
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {device.upper()}")
-        if device == 'cpu':
-            print("Warning: GPU not detected — encoding will be slower on CPU.")
-
-        # Load the model (will be downloaded on first use)
-        model = SentenceTransformer('BAAI/bge-m3', device=device)
+        model = EmbeddingModelRegistry.get(self.embedding_model, self.device)
 
         print(f"Starting encoding of {len(texts)} messages...")
 
-        # Typical batch_size values: 32 or 64 depending on GPU memory
         embeddings = model.encode(
             texts,
-            batch_size=32,
+            batch_size=self.batch_size,
             show_progress_bar=True,
             convert_to_numpy=True,
             normalize_embeddings=True,
         )
+        self.metrics["embeddings_computed"] += len(texts)
         return embeddings
 
+    def _embed_sync(self, texts: list[str]) -> np.ndarray:
+        """Encodes texts, consulting the embedding cache first.
+
+        Only cache misses (deduplicated by content) reach the encoder; the
+        freshly computed vectors are written back to the cache.
+        """
+        if self.embedding_cache is None:
+            return self._gpu_vectorize_sync(texts)
+
+        keys = [self.embedding_cache.key(t) for t in texts]
+        cached = self.embedding_cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        hits = sum(k in cached for k in keys)
+        self.metrics["embedding_cache_hits"] += hits
+        print(f"[INFO] Embedding cache: {hits}/{len(texts)} hits, {len(missing)} to encode.")
+
+        if missing:
+            encoded = self._gpu_vectorize_sync(list(missing.values()))
+            self.embedding_cache.put_many(list(missing.keys()), encoded)
+            cached.update(zip(missing.keys(), encoded))
+
+        return np.stack([cached[k] for k in keys]).astype(np.float32, copy=False)
+
+    def warm_up(self) -> None:
+        """Load the embedding model into device memory ahead of the first call."""
+        EmbeddingModelRegistry.warm_up(self.embedding_model, self.device)
+
     async def _vectorize(self, messages: List[TelegramMessage], method: str = "bge-m3", **kwargs) -> np.ndarray:
         """Asynchronous vectorization of messages.
 
@@ -60,16 +96,19 @@ class Classifier(ABC):
               - "bge-m3": use a local SentenceTransformer BGE model (default)
               - "ollama": use Ollama embeddings (if configured)
         kwargs : dict
-            Additional backend-specific options. For `ollama`, pass `model`.
+            Additional backend-specific options. For `features`, pass `n_jobs`
+            to extract in several processes; for `ollama`, pass `model`.
         """
         loop = asyncio.get_running_loop()
 
         if method == "features":
-            return await loop.run_in_executor(None, self._features_vectorize_impl, messages, self.extractor)
+            return await loop.run_in_executor(
+                None, self._features_vectorize_impl, messages, self.extractor, kwargs.get("n_jobs", 1)
+            )
         
         if method == "bge-m3":
             texts = [m.text if hasattr(m, "text") else str(m) for m in messages]
-            return await loop.run_in_executor(None, self._gpu_vectorize_sync, texts)
+            return await loop.run_in_executor(None, self._embed_sync, texts)
 
         raise ValueError(f"Unknown vectorization method: {method}")
 
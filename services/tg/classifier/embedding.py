@@ -0,0 +1,65 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-m3"
+
+
+def resolve_device(device: Optional[str] = None) -> str:
+    """Return the requested device or pick CUDA when it is available."""
+    if device:
+        return device
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+class EmbeddingModelRegistry:
+    """Process-wide registry of loaded SentenceTransformer encoders.
+
+    Loading bge-m3 takes several seconds and gigabytes of memory, so every
+    encoder is created once per (model name, device) pair and then shared by
+    all classifiers and all calls. Access is guarded by a lock because
+    encoding runs inside thread-pool executors.
+    """
+
+    _models: Dict[Tuple[str, str], SentenceTransformer] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model_name: str = DEFAULT_EMBEDDING_MODEL, device: Optional[str] = None) -> SentenceTransformer:
+        """Return a resident encoder, loading it on first use."""
+        device = resolve_device(device)
+        key = (model_name, device)
+
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+
+        with cls._lock:
+            # другой поток мог загрузить модель, пока мы ждали блокировку
+            model = cls._models.get(key)
+            if model is None:
+                print(f"[INFO] Loading embedding model '{model_name}' to {device.upper()}...")
+                if device == 'cpu':
+                    print("[WARN] GPU not detected — encoding will be slower on CPU.")
+                # Load the model (will be downloaded on first use)
+                model = SentenceTransformer(model_name, device=device)
+                cls._models[key] = model
+        return model
+
+    @classmethod
+    def warm_up(cls, model_name: str = DEFAULT_EMBEDDING_MODEL, device: Optional[str] = None) -> SentenceTransformer:
+        """Load the encoder and run a tiny encode so CUDA kernels are initialised."""
+        model = cls.get(model_name, device)
+        model.encode(["warm-up"], batch_size=1, show_progress_bar=False, convert_to_numpy=True)
+        return model
+
+    @classmethod
+    def release(cls, model_name: Optional[str] = None) -> None:
+        """Drop cached encoders (all of them, or only those of `model_name`)."""
+        with cls._lock:
+            for key in list(cls._models):
+                if model_name is None or key[0] == model_name:
+                    del cls._models[key]
@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils import normalize_text, text_hash
+
+
+class EmbeddingCache:
+    """Persistent content-addressed cache of text embeddings.
+
+    Vectors live in a memory-mapped float32 matrix (`embeddings.f32`), the
+    mapping key -> row is kept in `index.json` next to it. Keys are sha256
+    hashes of the model name and the normalised text, so the same message
+    seen on consecutive days is encoded only once.
+
+    The cache holds at most `max_entries` rows (`max_entries * dim * 4` bytes
+    on disk); when it is full the least recently used rows are evicted and
+    their slots are reused.
+
+    The index is rewritten at most every `index_save_interval` seconds and on
+    `flush()`; a crash in between only loses the newest entries (their rows
+    stay unreferenced). Evictions are persisted before the freed rows are
+    overwritten, so the index on disk never points at another text's vector.
+    """
+
+    INDEX_FILE = "index.json"
+    DATA_FILE = "embeddings.f32"
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 100_000, evict_fraction: float = .1,
+                 index_save_interval: float = 30):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.evict_fraction = evict_fraction
+        self.index_save_interval = index_save_interval
+        self.path = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        # key -> [row, last_used_tick]
+        self._entries: Dict[str, List[int]] = {}
+        # строки, на которые не ссылается ни память, ни индекс на диске
+        self._free: List[int] = []
+        self._tick = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+        self._load_index()
+
+    # --- Keys ---
+
+    def key(self, text: str) -> str:
+        """Content address of a text for the current model."""
+        return text_hash(self.model_name, normalize_text(text))
+
+    # --- Public API ---
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Returns {key: vector} for the keys present in the cache."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            if self._matrix is None:
+                return found
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                self._tick += 1
+                entry[1] = self._tick
+                found[key] = np.array(self._matrix[entry[0]])
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray) -> None:
+        """Stores vectors (one row per key) and persists the index."""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        with self._lock:
+            if self._matrix is None:
+                self._open_matrix(vectors.shape[1])
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension mismatch: cache has {self._dim}, got {vectors.shape[1]}")
+
+            new_keys = [k for k in dict.fromkeys(keys) if k not in self._entries]
+            rows = self._allocate_rows(len(new_keys))
+
+            positions = {k: i for i, k in enumerate(keys)}
+            for key, row in zip(new_keys, rows):
+                self._tick += 1
+                self._matrix[row] = vectors[positions[key]]
+                self._entries[key] = [row, self._tick]
+
+            # векторы на диске раньше индекса, который на них ссылается
+            self._matrix.flush()
+            self._dirty = True
+            if time.monotonic() - self._last_save >= self.index_save_interval:
+                self._save_index()
+
+    def flush(self) -> None:
+        """Persists the index if it has unsaved entries."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- Storage helpers ---
+
+    def _allocate_rows(self, count: int) -> List[int]:
+        """Returns `count` free rows, evicting least recently used entries if needed."""
+        count = min(count, self.max_entries)
+
+        if len(self._free) < count:
+            # выселяем сразу пачку старых записей, чтобы не делать это на каждой вставке
+            to_evict = max(count - len(self._free), int(self.max_entries * self.evict_fraction))
+            oldest = sorted(self._entries.items(), key=lambda kv: kv[1][1])[:to_evict]
+            for key, _ in oldest:
+                del self._entries[key]
+            # индекс без выселенных ключей должен попасть на диск до того, как их строки перезапишут
+            self._matrix.flush()
+            self._save_index()
+            self._free.extend(row for _, (row, _) in oldest)
+
+        rows, self._free = self._free[:count], self._free[count:]
+        return rows
+
+    def _open_matrix(self, dim: int) -> None:
+        data_path = os.path.join(self.path, self.DATA_FILE)
+        mode = "r+" if os.path.exists(data_path) and self._dim == dim else "w+"
+        if mode == "w+":
+            self._entries.clear()
+        self._dim = dim
+        self._matrix = np.memmap(data_path, dtype=np.float32, mode=mode, shape=(self.max_entries, dim))
+        used = {row for row, _ in self._entries.values()}
+        self._free = [r for r in range(self.max_entries) if r not in used]
+
+    def _load_index(self) -> None:
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARN] Embedding cache index is unreadable, starting empty: {e}")
+            return
+
+        if index.get("model") != self.model_name or index.get("capacity") != self.max_entries:
+            # изменилась модель или размер кэша — старые строки не переиспользуем
+            print("[INFO] Embedding cache settings changed, cache will be rebuilt.")
+            return
+
+        self._dim = index["dim"]
+        self._entries = {k: list(v) for k, v in index["entries"].items()}
+        self._tick = max((t for _, t in self._entries.values()), default=0)
+        self._open_matrix(self._dim)
+        print(f"[INFO] Embedding cache loaded: {len(self._entries)} vectors from {self.path}")
+
+    def _save_index(self) -> None:
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self._dim,
+                "capacity": self.max_entries,
+                "entries": self._entries,
+            }, f)
+        os.replace(tmp_path, index_path)
+        self._dirty = False
+        self._last_save = time.monotonic()
@@ -1,5 +1,30 @@
 import re
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# Стабильная схема столбцов матрицы признаков (порядок важен для обученных моделей)
+FEATURE_COLUMNS = (
+    "offer_verb",
+    "apart_word",
+    "search_word",
+    "is_temporary",
+    "is_host_family",
+    "is_commercial",
+    "is_dorm",
+    "is_swap",
+    "is_job_ad",
+    "has_jobcenter",
+    "price",
+    "phone",
+    "question",
+    "len_short",
+    "len_long",
+    "length_val",
+)
+
 
 class FeatureExtractor:
     def __init__(self):
@@ -162,22 +187,73 @@ class FeatureExtractor:
         self._phone_re = re.compile(r"(\+?\d[\d\-\s\(\)]{7,}\d)")
         self._question_re = re.compile(r"\?")
 
+        # Быстрый путь поиска признаков: текст приводится к нижнему регистру
+        # один раз, а паттерны компилируются без re.I — для re это в ~10 раз быстрее,
+        # чем регистронезависимый поиск (все паттерны и так записаны строчными).
+        # Порядок совпадает с порядком столбцов FEATURE_COLUMNS.
+        self._fast_patterns = [
+            (FEATURE_COLUMNS.index(name), re.compile(patterns[0].pattern), patterns[0])
+            for name, patterns in self._re_groups.items()
+        ] + [
+            (FEATURE_COLUMNS.index("price"), re.compile(r"\d{2,6}"), self._price_re),
+            (FEATURE_COLUMNS.index("phone"), self._phone_re, self._phone_re),
+            (FEATURE_COLUMNS.index("question"), self._question_re, self._question_re),
+        ]
+        self._len_short_col = FEATURE_COLUMNS.index("len_short")
+        self._len_long_col = FEATURE_COLUMNS.index("len_long")
+        self._length_col = FEATURE_COLUMNS.index("length_val")
+
+    def _scan(self, text: str, row: np.ndarray) -> None:
+        """Заполняет строку признаков `row` для одного текста."""
+        lowered = text.lower()
+        # редкие символы (например, турецкая İ) меняют длину при lower() —
+        # для таких текстов используем исходные регистронезависимые паттерны
+        exact = len(lowered) == len(text)
+        for col, fast, case_insensitive in self._fast_patterns:
+            if (fast.search(lowered) if exact else case_insensitive.search(text)):
+                row[col] = 1
+
+        length = len(text)
+        row[self._len_short_col] = 1 if length < 50 else 0
+        row[self._len_long_col] = 1 if length > 1000 else 0
+        row[self._length_col] = length
+
     def extract(self, message) -> Dict[str, int]: # Упростил typing
         text = message.text if hasattr(message, 'text') else str(message)
-        
-        features = {key: 0 for key in self._re_groups.keys()}
-        
-        for feature_name, patterns in self._re_groups.items():
-            if any(p.search(text) for p in patterns):
-                features[feature_name] = 1
-
-        features["price"] = int(bool(self._price_re.search(text)))
-        features["phone"] = int(bool(self._phone_re.search(text)))
-        features["question"] = int(bool(self._question_re.search(text)))
-        
-        length = len(text)
-        features["len_short"] = 1 if length < 50 else 0
-        features["len_long"] = 1 if length > 1000 else 0
-        features["length_val"] = length
 
-        return features
\ No newline at end of file
+        row = np.zeros(len(FEATURE_COLUMNS), dtype=np.int32)
+        self._scan(text, row)
+        return {name: int(value) for name, value in zip(FEATURE_COLUMNS, row)}
+
+    def extract_batch(self, messages: Sequence, n_jobs: int = 1, chunk_size: int = 5000) -> np.ndarray:
+        """
+        Извлекает признаки для списка сообщений (или строк) сразу в матрицу
+        int32 формы (len(messages), len(FEATURE_COLUMNS)).
+
+        При n_jobs != 1 и большом корпусе текст делится на чанки и обрабатывается
+        в нескольких процессах (n_jobs=None или -1 — по числу CPU).
+        """
+        texts = [m.text if hasattr(m, 'text') else str(m) for m in messages]
+
+        if n_jobs != 1 and len(texts) > chunk_size:
+            workers = None if n_jobs in (None, -1) else n_jobs
+            chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(_extract_chunk, chunks))
+            return np.vstack(parts) if parts else np.zeros((0, len(FEATURE_COLUMNS)), dtype=np.int32)
+
+        matrix = np.zeros((len(texts), len(FEATURE_COLUMNS)), dtype=np.int32)
+        for i, text in enumerate(texts):
+            self._scan(text, matrix[i])
+        return matrix
+
+
+_worker_extractor: Optional[FeatureExtractor] = None
+
+
+def _extract_chunk(texts: List[str]) -> np.ndarray:
+    """Точка входа для процессов-воркеров extract_batch."""
+    global _worker_extractor
+    if _worker_extractor is None:
+        _worker_extractor = FeatureExtractor()
+    return _worker_extractor.extract_batch(texts)
@@ -10,8 +10,8 @@ from models import TelegramMessage
 
 
 class RandomForestMessageClassifier(Classifier):
-    def __init__(self, n_estimators: int = 100, random_state: int = 42):
-        super().__init__()
+    def __init__(self, n_estimators: int = 100, random_state: int = 42, **embedding_kwargs):
+        super().__init__(**embedding_kwargs)
         
         self.model = RandomForestClassifier(
             n_estimators=n_estimators,
@@ -0,0 +1,132 @@
+import time
+import asyncio
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from telethon.errors.rpcerrorlist import FloodWaitError
+
+
+class FloodWaitGate:
+    """
+    Общая для всех воркеров пауза после FloodWaitError.
+
+    Telegram ограничивает аккаунт целиком, поэтому одна ошибка FloodWait
+    должна притормозить все задачи, а не только ту, что ее получила.
+    """
+
+    def __init__(self):
+        self._resume_at = 0.0
+        self.total_wait = 0.0
+
+    def trigger(self, seconds: float) -> None:
+        resume_at = time.monotonic() + seconds
+        if resume_at > self._resume_at:
+            self.total_wait += resume_at - max(self._resume_at, time.monotonic())
+            self._resume_at = resume_at
+            print(f"[WARN] Flood wait of {seconds:.0f}s — pausing all Telegram workers.")
+
+    async def wait(self) -> None:
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+class CrawlScheduler:
+    """
+    Параллельный обход каналов с ограничением числа одновременных задач.
+
+    Каждая задача перед запуском ждет общий FloodWaitGate; при FloodWaitError
+    пауза включается для всех, а задача повторяется (до `max_attempts` раз).
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_attempts: int = 3, gate: Optional[FloodWaitGate] = None):
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.gate = gate or FloodWaitGate()
+
+    async def run(
+        self,
+        items: Sequence[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        describe: Callable[[Any], str] = str,
+    ) -> List[Any]:
+        """
+        Запускает `worker` для всех элементов и возвращает результаты в исходном порядке.
+        Элемент, обработка которого не удалась, представлен исключением.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        total = len(items)
+        done = 0
+
+        async def process(item: Any) -> Any:
+            nonlocal done
+            started = time.monotonic()
+            result = await self._process(item, worker, semaphore)
+
+            done += 1
+            status = f"failed: {result}" if isinstance(result, BaseException) else "done"
+            print(f"[INFO] [{done}/{total}] {describe(item)} — {status} ({time.monotonic() - started:.1f}s)")
+            return result
+
+        return await asyncio.gather(*(process(item) for item in items))
+
+    async def stream(
+        self,
+        items: AsyncIterable[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        describe: Callable[[Any], str] = str,
+    ) -> AsyncIterator[Tuple[Any, Any]]:
+        """
+        Как `run`, но элементы приходят из асинхронного потока, а пары (элемент, результат)
+        отдаются по мере готовности. Следующий элемент берется из потока, только когда
+        есть свободный воркер, поэтому медленный обход притормаживает источник.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        source = items.__aiter__()
+        running: Dict[asyncio.Task, Tuple[Any, float]] = {}
+        fetch: Optional[asyncio.Future] = None
+        exhausted = False
+        done = 0
+
+        try:
+            while True:
+                if fetch is None and not exhausted and len(running) < self.max_concurrency:
+                    fetch = asyncio.ensure_future(source.__anext__())
+
+                waiting = set(running) | ({fetch} if fetch is not None else set())
+                if not waiting:
+                    return
+                finished, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if fetch in finished:
+                    try:
+                        item = fetch.result()
+                        running[asyncio.ensure_future(self._process(item, worker, semaphore))] = (item, time.monotonic())
+                    except StopAsyncIteration:
+                        exhausted = True
+                    fetch = None
+
+                for task in finished & running.keys():
+                    item, started = running.pop(task)
+                    result = task.result()
+                    done += 1
+                    status = f"failed: {result}" if isinstance(result, BaseException) else "done"
+                    print(f"[INFO] [{done}] {describe(item)} — {status} ({time.monotonic() - started:.1f}s)")
+                    yield item, result
+        finally:
+            for task in [*running, *([fetch] if fetch is not None else [])]:
+                task.cancel()
+
+    async def _process(self, item: Any, worker: Callable[[Any], Awaitable[Any]], semaphore: asyncio.Semaphore) -> Any:
+        """Обрабатывает один элемент с повторами после FloodWait. Ошибка возвращается как исключение."""
+        for attempt in range(1, self.max_attempts + 1):
+            await self.gate.wait()
+            async with semaphore:
+                # пока задача ждала семафор, другой воркер мог поймать FloodWait
+                await self.gate.wait()
+                try:
+                    return await worker(item)
+                except FloodWaitError as e:
+                    self.gate.trigger(e.seconds + 1)  # +1 секунда на всякий случай
+                    if attempt == self.max_attempts:
+                        return e
+                except Exception as e:
+                    return e
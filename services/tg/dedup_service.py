@@ -0,0 +1,223 @@
+import re
+import zlib
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models import Container, TelegramChannel, TelegramMessage
+from services.base import Service
+from streaming import ChunkStream
+
+
+# простое число > 2^32 для универсального хэширования (a * x + b) mod P
+_MERSENNE_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(2 ** 32 - 1)
+
+
+class TgDedupService(Service):
+    """
+    Сервис поиска почти-дубликатов объявлений во всем Container.
+
+    Арендодатели публикуют одно и то же объявление в несколько городских каналов.
+    Сервис строит MinHash-сигнатуры по символьным шинглам текста, группирует
+    кандидатов через LSH (banding), проверяет их по оценке Жаккара и оставляет
+    по одному представителю на кластер. В `TelegramMessage.duplicates`
+    представителя записываются URL остальных каналов, где встречалась копия.
+
+    Сложность ~O(n * num_perm): сравниваются только сообщения из общих LSH-корзин.
+    Тексты короче одного шингла после нормализации (эмодзи, пунктуация, пустые подписи
+    к медиа) не сравниваются и всегда остаются.
+
+    В потоковом режиме (`run_stream`) сигнатуры считаются по мере поступления каналов,
+    а каналы отдаются дальше после конца потока — результат тот же, что у `run`.
+    """
+
+    STAGE_CACHEABLE = True
+
+    def __init__(self, threshold: float = .8, shingle_size: int = 5, num_perm: int = 128, bands: int = 16, seed: int = 42):
+        """
+        :param threshold: минимальная оценка сходства Жаккара, чтобы считать тексты дубликатами
+        :param shingle_size: длина символьного шингла
+        :param num_perm: число хэш-функций MinHash (должно делиться на bands)
+        :param bands: число LSH-полос; rows = num_perm // bands
+        """
+        super().__init__()
+
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 31, size=num_perm, dtype=np.uint64)
+
+    async def run(self, container: Container) -> Container:
+        """
+        Удаляет почти-дубликаты сообщений во всех каналах контейнера.
+        Каналы сохраняются (даже если в них не осталось сообщений).
+        """
+        items: List[Tuple[TelegramChannel, TelegramMessage]] = [
+            (channel, msg) for channel in container.channels if channel.messages for msg in channel.messages
+        ]
+        if not items:
+            return Container(channels=container.channels)
+
+        clusters = await asyncio.to_thread(self._cluster, [msg.text for _, msg in items])
+        dropped = self._collapse(items, clusters, container.channels)
+
+        print(f"[INFO] Dedup: {len(items)} messages -> {len(items) - dropped} unique "
+              f"({dropped} near-duplicates removed).")
+        return Container(channels=container.channels)
+
+    async def run_stream(self, chunks: ChunkStream) -> AsyncIterator[Container]:
+        """
+        Потоковая дедупликация: MinHash-сигнатуры считаются по мере поступления чанков,
+        а кластеризация и отдача чанков дальше — после конца потока.
+
+        Копия может прийти последней, а представителем должна остаться самая ранняя
+        публикация с полным `duplicates` — иначе снепшот стадии и последующие стадии
+        увидят неполный результат. Поэтому стадия — барьер для следующих, но самая
+        дорогая часть (сигнатуры) перекрывается с парсингом, а результат совпадает с `run`.
+        """
+        buffered: List[Container] = []
+        items: List[Tuple[TelegramChannel, TelegramMessage]] = []
+        eligible: List[int] = []
+        signatures: List[np.ndarray] = []
+
+        async for chunk in chunks:
+            buffered.append(chunk)
+            chunk_items = [(channel, msg) for channel in chunk.channels if channel.messages for msg in channel.messages]
+            if not chunk_items:
+                continue
+            chunk_eligible, chunk_signatures = await asyncio.to_thread(
+                self._signatures, [msg.text for _, msg in chunk_items]
+            )
+            eligible.extend(len(items) + i for i in chunk_eligible)
+            if chunk_signatures is not None:
+                signatures.append(chunk_signatures)
+            items.extend(chunk_items)
+
+        dropped = 0
+        if items:
+            clusters = await asyncio.to_thread(
+                self._link, len(items), eligible, np.concatenate(signatures) if signatures else None
+            )
+            dropped = self._collapse(items, clusters, [channel for chunk in buffered for channel in chunk.channels])
+
+        print(f"[INFO] Dedup (streaming): {len(items)} messages -> {len(items) - dropped} unique "
+              f"({dropped} near-duplicates removed).")
+        for chunk in buffered:
+            yield chunk
+
+    def _collapse(
+        self, items: List[Tuple[TelegramChannel, TelegramMessage]], clusters: List[List[int]],
+        channels: List[TelegramChannel]
+    ) -> int:
+        """
+        Оставляет по одному представителю (самая ранняя публикация) на кластер, дописывает ему
+        в `duplicates` каналы копий и убирает копии из `channels`. Возвращает число удаленных.
+        """
+        dropped = set()
+        for members in clusters:
+            if len(members) < 2:
+                continue
+
+            # представитель — самая ранняя публикация
+            rep_idx = min(members, key=lambda i: (self._sort_date(items[i][1]), i))
+            rep_channel, rep_msg = items[rep_idx]
+
+            other_urls = {items[i][0].url for i in members if i != rep_idx} - {rep_channel.url}
+            if other_urls:
+                rep_msg.duplicates = sorted(set(rep_msg.duplicates or []) | other_urls)
+
+            dropped.update(id(items[i][1]) for i in members if i != rep_idx)
+
+        for channel in channels:
+            if channel.messages:
+                channel.messages = [msg for msg in channel.messages if id(msg) not in dropped]
+
+        self.metrics["duplicates_removed"] += len(dropped)
+        return len(dropped)
+
+    # --- MinHash / LSH ---
+
+    @staticmethod
+    def _sort_date(msg: TelegramMessage) -> datetime:
+        if msg.date is None:
+            return datetime.max.replace(tzinfo=timezone.utc)
+        return msg.date if msg.date.tzinfo else msg.date.replace(tzinfo=timezone.utc)
+
+    def _shingles(self, text: str) -> Optional[np.ndarray]:
+        """
+        Множество хэшей символьных шинглов нормализованного текста.
+        None — текст короче одного шингла: сигнатура по нему склеила бы несвязанные сообщения.
+        """
+        normalized = re.sub(r"[\W_]+", " ", (text or "").lower()).strip()
+        k = self.shingle_size
+        if len(normalized) < k:
+            return None
+        grams = {normalized[i:i + k] for i in range(len(normalized) - k + 1)}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def _signature(self, shingles: np.ndarray) -> np.ndarray:
+        hashed = (np.outer(self._a, shingles) + self._b[:, None]) % _MERSENNE_PRIME
+        return np.minimum(hashed, _MAX_HASH).min(axis=1)
+
+    def _signatures(self, texts: List[str]) -> Tuple[List[int], Optional[np.ndarray]]:
+        """
+        Индексы текстов, участвующих в LSH, и их сигнатуры (по строке на индекс).
+        Короткие тексты не участвуют — каждый остается отдельным кластером.
+        """
+        shingles = [self._shingles(t) for t in texts]
+        eligible = [i for i, sh in enumerate(shingles) if sh is not None]
+        if not eligible:
+            return [], None
+        return eligible, np.stack([self._signature(shingles[i]) for i in eligible])
+
+    def _cluster(self, texts: List[str]) -> List[List[int]]:
+        """Возвращает кластеры индексов почти-одинаковых текстов."""
+        return self._link(len(texts), *self._signatures(texts))
+
+    def _link(self, n: int, eligible: List[int], signatures: Optional[np.ndarray]) -> List[List[int]]:
+        """Кластеры индексов 0..n-1 по сигнатурам `signatures` текстов `eligible`."""
+        if not eligible:
+            return [[i] for i in range(n)]
+        parent = list(range(n))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            band_slice = signatures[:, band * self.rows:(band + 1) * self.rows]
+            for pos, row in enumerate(band_slice):
+                buckets[row.tobytes()].append(pos)
+
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                # сравниваем с первым элементом корзины — линейно по размеру корзины
+                anchor = members[0]
+                for other in members[1:]:
+                    i, j = eligible[anchor], eligible[other]
+                    if find(i) == find(j):
+                        continue
+                    similarity = float(np.mean(signatures[anchor] == signatures[other]))
+                    if similarity >= self.threshold:
+                        parent[find(j)] = find(i)
+
+        clusters: Dict[int, List[int]] = defaultdict(list)
+        for idx in range(n):
+            clusters[find(idx)].append(idx)
+        return list(clusters.values())
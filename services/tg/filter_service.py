@@ -2,16 +2,21 @@ import re
 import os
 import json
 import asyncio
-from typing import List, Tuple
+from collections import Counter
+from typing import Dict, List, Tuple, Optional
 
 from google import genai
 
 from models import Container, TelegramChannel, TelegramMessage
-from utils import get_prompt_by_id
+from utils import get_prompt_by_id, normalize_text, text_hash
 
 from services.base import Service
+from services.llm_executor import LLMExecutor
 from services.tg.classifier.base import Classifier
 from services.tg.classifier.random_forest import RandomForestMessageClassifier
+from services.tg.classifier.embedding_cache import EmbeddingCache
+from storage.verdict_store import VerdictStore
+from storage.published_ledger import PublishedLedgerStore, ad_fingerprint
 
 
 class TgFilterService(Service):
@@ -22,28 +27,97 @@ class TgFilterService(Service):
       2. Проверка сомнительных сообщений через внешний AI (например, Google Gemini).
     """
 
-    def __init__(self, api_key: str, ai_model: str, ml_model: Classifier, confidence_threshold: float = .8):
+    BATCH_MODES = ("channel", "global")
+    PROMPT_ID = "1"
+
+    # вердикты Gemini недетерминированы, а упавшие батчи теряют сообщения — кэш стадии
+    # только по явному "stage_cache": true, и то лишь для запусков без ошибок LLM
+    STAGE_CACHEABLE = False
+    # журнал публикаций в ключ не входит — это изменяемая база; издатель сверяется с ним сам
+    CACHE_ARTIFACT_PARAMS = ("ml_model_path",)
+    CACHE_ARTIFACTS = ("promts/tg_filter_service.json",)
+    STREAM_BATCH_MESSAGES = 200
+
+    def __init__(self, api_key: str, ai_model: str, ml_model: Classifier, confidence_threshold: float = .8, batch_mode: str = "channel",
+                 llm_max_concurrency: int = 4, llm_requests_per_minute: float = 15, llm_tokens_per_minute: float = 250_000,
+                 verdict_store: Optional[VerdictStore] = None, published_ledger: Optional[PublishedLedgerStore] = None):
+        """
+        :param batch_mode: "channel" — классификация по каналам;
+                           "global" — все сообщения контейнера обрабатываются одним батчем
+        :param llm_*: лимиты параллелизма и частоты запросов к Gemini
+        :param verdict_store: персистентный кэш вердиктов Gemini (None — без кэша)
+        :param published_ledger: журнал уже опубликованных объявлений — такие сообщения
+                                 отбрасываются до классификации (None — классифицировать все)
+        """
         super().__init__()
         
+        if batch_mode not in self.BATCH_MODES:
+            raise ValueError(f"Unknown batch_mode: {batch_mode}. Expected one of {self.BATCH_MODES}")
+
         self.ai_model = ai_model
         self.client = genai.Client(api_key=api_key)
+        self.llm = LLMExecutor(
+            self.client,
+            ai_model,
+            max_concurrency=llm_max_concurrency,
+            requests_per_minute=llm_requests_per_minute,
+            tokens_per_minute=llm_tokens_per_minute,
+            metrics=self.metrics,
+        )
         self.ml_model = ml_model
         self.confidence_threshold = confidence_threshold
+        self.batch_mode = batch_mode
+        self.verdict_store = verdict_store
+        self._verdicts_checked_version: Optional[str] = None
+        self.published_ledger = published_ledger
 
     @classmethod
-    async def create(cls, api_key: str, ml_model_path: str, ml_model = None, ml_model_name: str="RandomForest", ai_model: str = "gemini-2.5-flash-lite", confidence_threshold: float = .8) -> "TgFilterService":
+    async def create(cls, api_key: str, ml_model_path: str, ml_model = None, ml_model_name: str="RandomForest", ai_model: str = "gemini-2.5-flash-lite", confidence_threshold: float = .8,
+                     embedding_device: Optional[str] = None, embedding_batch_size: int = 32, warm_up: bool = True,
+                     embedding_cache_dir: Optional[str] = "data/EmbeddingCache", embedding_cache_max_entries: int = 100_000,
+                     batch_mode: str = "channel", llm_max_concurrency: int = 4, llm_requests_per_minute: float = 15,
+                     llm_tokens_per_minute: float = 250_000, verdict_cache_path: Optional[str] = "data/cache/llm_verdicts.sqlite",
+                     verdict_cache_ttl_days: float = 30, published_ledger_path: Optional[str] = None,
+                     published_ledger_ttl_days: float = 30) -> "TgFilterService":
         
         if ml_model is None:
             if ml_model_name == "RandomForest":
-                ml_model = RandomForestMessageClassifier()
+                ml_model = RandomForestMessageClassifier(device=embedding_device, batch_size=embedding_batch_size)
+
+            if embedding_cache_dir:
+                # ключи кэша — по модели, которой классификатор действительно кодирует тексты
+                ml_model.embedding_cache = await asyncio.to_thread(
+                    EmbeddingCache, embedding_cache_dir, ml_model.embedding_model, embedding_cache_max_entries
+                )
 
             ml_model_path = os.path.join(os.path.dirname(__file__), "..", "..", ml_model_path)
             await ml_model.load(ml_model_path)
         else:
             assert isinstance(ml_model, Classifier), "ml_model must be an instance of Classifier"
 
-        return cls(api_key, ai_model, ml_model, confidence_threshold)
+        if warm_up:
+            # Загружаем энкодер заранее, чтобы первый канал не платил за загрузку модели
+            await asyncio.to_thread(ml_model.warm_up)
 
+        verdict_store = None
+        if verdict_cache_path:
+            verdict_store = await asyncio.to_thread(VerdictStore, verdict_cache_path, verdict_cache_ttl_days)
+
+        published_ledger = None
+        if published_ledger_path:
+            published_ledger = await asyncio.to_thread(PublishedLedgerStore, published_ledger_path, published_ledger_ttl_days)
+
+        return cls(
+            api_key, ai_model, ml_model, confidence_threshold, batch_mode,
+            llm_max_concurrency, llm_requests_per_minute, llm_tokens_per_minute, verdict_store, published_ledger
+        )
+
+
+    def result_cacheable(self) -> bool:
+        return not self.metrics["llm_failed_batches"]
+
+    def report_metrics(self) -> Dict[str, float]:
+        return dict(self.metrics + getattr(self.ml_model, "metrics", Counter()))
 
     async def run(self, container: Container) -> Container:
         """
@@ -52,6 +126,20 @@ class TgFilterService(Service):
         2. Обрабатывает ambiguous через Gemini.
         3. Возвращает итоговый список strict_accept.
         """
+        try:
+            return await self._run(container)
+        finally:
+            embedding_cache = getattr(self.ml_model, "embedding_cache", None)
+            if embedding_cache is not None:
+                await asyncio.to_thread(embedding_cache.flush)
+
+    async def _run(self, container: Container) -> Container:
+        if self.published_ledger is not None:
+            await self._drop_published(container)
+
+        if self.batch_mode == "global":
+            return await self._run_global(container)
+
         all_channels = []
         channels: List[TelegramChannel] = container.channels
 
@@ -77,7 +165,63 @@ class TgFilterService(Service):
 
         return Container(channels=all_channels)
 
+    async def _drop_published(self, container: Container) -> None:
+        """Удаляет из каналов сообщения, которые уже были опубликованы в прошлых запусках."""
+        items = [
+            (channel, msg, ad_fingerprint(channel.url, msg.sender, msg.text))
+            for channel in container.channels
+            for msg in channel.messages or []
+        ]
+        if not items:
+            return
+
+        published = await asyncio.to_thread(self.published_ledger.contains_many, [fp for _, _, fp in items])
+        if not published:
+            return
+
+        dropped = {id(msg) for _, msg, fp in items if fp in published}
+        for channel in container.channels:
+            if channel.messages:
+                channel.messages = [msg for msg in channel.messages if id(msg) not in dropped]
+        self.metrics["published_skipped"] += len(dropped)
+        print(f"[INFO] Skipping {len(dropped)} already published messages before classification.")
+
+    async def _run_global(self, container: Container) -> Container:
+        """
+        Кросс-канальный режим:
+        1. Собирает сообщения всех каналов в один общий батч.
+        2. Векторизует и классифицирует его за один проход модели.
+        3. Отправляет все ambiguous в Gemini полными батчами.
+        4. Раскладывает вердикты обратно по каналам, сохраняя порядок.
+        """
+        channels: List[TelegramChannel] = container.channels
+        all_messages: List[TelegramMessage] = [
+            msg for channel in channels if channel.messages for msg in channel.messages
+        ]
+
+        if not all_messages:
+            return Container(channels=channels)
+
+        print(f"[INFO] Classifying {len(all_messages)} messages from {len(channels)} channels in one batch...")
+        strict_accept, _, ambiguous = await self.classify_messages(all_messages)
+
+        gemini_accept: List[TelegramMessage] = []
+        if ambiguous:
+            gemini_accept, _ = await self.ai_analyzer(ambiguous)
+
+        # Сравниваем по идентичности объектов: одинаковые тексты в разных каналах — разные сообщения
+        strict_ids = {id(msg) for msg in strict_accept}
+        gemini_ids = {id(msg) for msg in gemini_accept}
 
+        for channel in channels:
+            if not channel.messages:
+                continue
+            channel.messages = (
+                [msg for msg in channel.messages if id(msg) in strict_ids]
+                + [msg for msg in channel.messages if id(msg) in gemini_ids]
+            )
+
+        return Container(channels=channels)
 
     async def classify_messages(
         self, messages: List[TelegramMessage]
@@ -100,6 +244,9 @@ class TgFilterService(Service):
             else:
                 ambiguous.append(msg)
 
+        self.metrics["ml_accepted"] += len(accept)
+        self.metrics["ml_rejected"] += len(reject)
+        self.metrics["ml_ambiguous"] += len(ambiguous)
         return accept, reject, ambiguous
     
     def _clean_ai_response_text(self, raw_text: str) -> str:
@@ -131,69 +278,105 @@ class TgFilterService(Service):
     
     async def ai_analyzer(self, messages: List[TelegramMessage]) -> Tuple[List[TelegramMessage], List[TelegramMessage]]:
         """
-        Использует Google Gemini для анализа сообщений пакетами по 5.
-        Возвращает только те сообщения, которые действительно относятся к сдаче жилья.
+        Использует Google Gemini для анализа сообщений пакетами по 10.
+        Сначала сверяется с кэшем вердиктов: в Gemini уходят только новые уникальные тексты.
+        Батчи отправляются параллельно через LLMExecutor (с учетом лимитов API).
+        Возвращает (accepted, rejected) — accepted действительно относятся к сдаче жилья.
         """
 
         if not messages:
-            return []
+            return [], []
 
         prompts_path = os.path.join(
             os.path.dirname(__file__), "..", "..", "promts", "tg_filter_service.json"
         )
-        system, user_template = get_prompt_by_id(prompts_path, "1")
+        system, user_template = get_prompt_by_id(prompts_path, self.PROMPT_ID)
+        prompt_version = text_hash(system, user_template)
+        prompt_key = f"tg_filter_service:{self.PROMPT_ID}"
+
+        hashes = [text_hash(normalize_text(msg.text)) for msg in messages]
+        verdicts: dict[str, int] = {}
+        if self.verdict_store is not None:
+            if self._verdicts_checked_version != prompt_version:
+                # чистка устаревших вердиктов — один раз на версию промта, а не на каждый батч
+                await asyncio.to_thread(self.verdict_store.invalidate_stale, prompt_key, prompt_version)
+                self._verdicts_checked_version = prompt_version
+            verdicts = await asyncio.to_thread(
+                self.verdict_store.get_many, prompt_key, prompt_version, self.ai_model, hashes
+            )
+
+        # в Gemini отправляем по одному сообщению на каждый еще неизвестный текст
+        pending: dict[str, TelegramMessage] = {}
+        for h, msg in zip(hashes, messages):
+            if h not in verdicts and h not in pending:
+                pending[h] = msg
+        self.metrics["llm_verdict_cache_hits"] += sum(h in verdicts for h in hashes)
+        print(f"[INFO] ai_analyzer: {sum(h in verdicts for h in hashes)}/{len(messages)} verdicts from cache, "
+              f"{len(pending)} texts to send to Gemini.")
 
-        accepted = []
-        rejected = []
         batch_size = 10
 
-        # разбиваем на батчи по batch_size сообщений
-        for i in range(0, len(messages), batch_size):
-            batch = messages[i:i+batch_size]
-
-            # формируем user-промт
+        # разбиваем на батчи по batch_size сообщений и формируем user-промты
+        pending_items = list(pending.items())
+        batches = [pending_items[i:i+batch_size] for i in range(0, len(pending_items), batch_size)]
+        requests = []
+        for batch in batches:
             batch_texts = []
-            for idx, msg in enumerate(batch, start=1):
+            for idx, (_, msg) in enumerate(batch, start=1):
                 batch_texts.append(f'{idx}) id: {msg.sender}, text: "{msg.text}"')
-            user = user_template.format(input_data=batch_texts)
+            requests.append([system, user_template.format(input_data=batch_texts)])
 
-            try:
-                response = await asyncio.to_thread(
-                    self.client.models.generate_content,
-                    model=self.ai_model,
-                    contents=[system, user],
-                )
-
-                raw_text = response.text.strip()
+        responses = await self.llm.map(requests)
 
-                # 🧹 Удаляем LLM-маркеры и мусор
-                cleaned = self._clean_ai_response_text(raw_text) 
+        new_verdicts: dict[str, int] = {}
+        for batch_no, (batch, response) in enumerate(zip(batches, responses), start=1):
+            if isinstance(response, BaseException):
+                print(f"ai_analyzer ERROR::\n {batch_no}: {response}")
+                self.metrics["llm_failed_batches"] += 1
+                continue
 
-                # 🧩 Ищем JSON-массив в тексте
-                match = re.search(r"\[.*\]", cleaned, re.DOTALL)
-                if not match:
-                    print(f"⚠️ JSON массив не найден в ответе батча {i//batch_size + 1}")
+            try:
+                result_json = self._parse_ai_response(response.text, batch_no)
+                if result_json is None:
+                    self.metrics["llm_failed_batches"] += 1
                     continue
 
-                json_text = match.group(0)
-
-                try:
-                    result_json = json.loads(json_text)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ JSONDecodeError в батче {i//batch_size + 1}: {e}")
-                    print(f"⚙️ Пробуем через eval-защищённый парсинг...")
-                    # Попытка парсинга fallback-способом
-                    safe_text = json_text.replace("'", '"')
-                    result_json = json.loads(safe_text)
-
-                for obj, msg in zip(result_json, batch):
-                    if obj.get("offer"):
-                        accepted.append(msg)
-                    else:
-                        rejected.append(msg)
+                for obj, (h, _) in zip(result_json, batch):
+                    new_verdicts[h] = 1 if obj.get("offer") else 0
 
             except Exception as e:
-                print(f"ai_analyzer ERROR::\n {i//10 + 1}: {e}\n{response.text if 'response' in locals() else ''}")
-
+                print(f"ai_analyzer ERROR::\n {batch_no}: {e}\n{response.text}")
+                self.metrics["llm_failed_batches"] += 1
+
+        if new_verdicts and self.verdict_store is not None:
+            await asyncio.to_thread(
+                self.verdict_store.put_many, prompt_key, prompt_version, self.ai_model, new_verdicts
+            )
+        verdicts.update(new_verdicts)
+
+        # сообщения из неудачных батчей не попадают ни в accepted, ни в rejected
+        accepted = [msg for h, msg in zip(hashes, messages) if verdicts.get(h) == 1]
+        rejected = [msg for h, msg in zip(hashes, messages) if verdicts.get(h) == 0]
         return accepted, rejected
-    
\ No newline at end of file
+
+    def _parse_ai_response(self, raw_text: str, batch_no: int) -> Optional[list]:
+        """Извлекает JSON-массив вердиктов из ответа модели (None, если массив не найден)."""
+        # 🧹 Удаляем LLM-маркеры и мусор
+        cleaned = self._clean_ai_response_text(raw_text.strip())
+
+        # 🧩 Ищем JSON-массив в тексте
+        match = re.search(r"\[.*\]", cleaned, re.DOTALL)
+        if not match:
+            print(f"⚠️ JSON массив не найден в ответе батча {batch_no}")
+            return None
+
+        json_text = match.group(0)
+
+        try:
+            return json.loads(json_text)
+        except json.JSONDecodeError as e:
+            print(f"⚠️ JSONDecodeError в батче {batch_no}: {e}")
+            print(f"⚙️ Пробуем через eval-защищённый парсинг...")
+            # Попытка парсинга fallback-способом
+            safe_text = json_text.replace("'", '"')
+            return json.loads(safe_text)
@@ -0,0 +1,105 @@
+import re
+from typing import Dict, Iterable, List, Optional, Union
+
+try:
+    import ahocorasick  # pyahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+DEFAULT_KEYWORDS: Dict[str, List[str]] = {
+    "ru": ["сдаю", "квартира", "аренда", "жильё", "комната"],
+    "uk": ["здаю", "квартира", "оренда", "житло", "кімната"],
+    "en": ["apartment", "house", "room", "rent"],
+    "de": ["wohnung", "miete", "zimmer", "unterkunft", "haus"],
+}
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Собирает регулярное выражение из префиксного дерева слов.
+
+    Общие префиксы выносятся за скобки ("квартира|квартал" -> "кварт(?:ал|ира)"),
+    поэтому движок re проверяет каждую позицию текста за один проход по дереву.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        is_end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if is_end:
+            # слово может закончиться здесь: остальное необязательно
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class KeywordPrefilter:
+    """
+    Быстрый многошаблонный префильтр сообщений по ключевым словам.
+
+    Ключевые слова (списком или словарем {язык: [слова]}) компилируются
+    один раз одним из движков:
+      - "aho-corasick" — автомат pyahocorasick (если пакет установлен),
+        время не зависит от числа ключевых слов;
+      - "regex" — регулярное выражение-дерево (_trie_pattern), выгоднее
+        подстрочного поиска на больших наборах слов;
+      - "substring" — `in` по каждому слову; на малых наборах (<= 32 слова)
+        быстрее регулярного выражения.
+    "auto" выбирает лучший доступный движок. Поиск идет по тексту в нижнем регистре.
+    """
+
+    ENGINES = ("auto", "aho-corasick", "regex", "substring")
+    SUBSTRING_MAX_KEYWORDS = 32
+
+    def __init__(self, keywords: Optional[Union[Iterable[str], Dict[str, Iterable[str]]]] = None, engine: str = "auto"):
+        if keywords is None:
+            keywords = DEFAULT_KEYWORDS
+        if isinstance(keywords, dict):
+            keywords = [word for words in keywords.values() for word in words]
+
+        self.keywords: List[str] = sorted({word.lower().strip() for word in keywords} - {""})
+
+        if not self.keywords:
+            raise ValueError("KeywordPrefilter requires at least one keyword")
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown prefilter engine: {engine}. Expected one of {self.ENGINES}")
+
+        if engine == "auto":
+            if ahocorasick is not None:
+                engine = "aho-corasick"
+            elif len(self.keywords) <= self.SUBSTRING_MAX_KEYWORDS:
+                engine = "substring"
+            else:
+                engine = "regex"
+        elif engine == "aho-corasick" and ahocorasick is None:
+            raise ImportError("engine='aho-corasick' requires the 'pyahocorasick' package")
+        self.engine = engine
+
+        if engine == "aho-corasick":
+            self._automaton = ahocorasick.Automaton()
+            for word in self.keywords:
+                self._automaton.add_word(word, word)
+            self._automaton.make_automaton()
+        elif engine == "regex":
+            self._pattern = re.compile(_trie_pattern(self.keywords))
+
+    def matches(self, text: str) -> bool:
+        """True, если в тексте есть хотя бы одно ключевое слово."""
+        lowered = text.lower()
+        if self.engine == "aho-corasick":
+            for _ in self._automaton.iter(lowered):
+                return True
+            return False
+        if self.engine == "regex":
+            return self._pattern.search(lowered) is not None
+        return any(word in lowered for word in self.keywords)
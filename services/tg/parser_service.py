@@ -1,36 +1,90 @@
 import asyncio
-from typing import List
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, Optional, Union
 from datetime import datetime, timedelta
 
-from telethon import TelegramClient
+from telethon import TelegramClient, events, types, utils
 from telethon.tl.functions.channels import JoinChannelRequest
 from telethon.tl.functions.messages import ImportChatInviteRequest
-from telethon.errors.rpcerrorlist import UserAlreadyParticipantError, InviteHashExpiredError, UsernameNotOccupiedError, FloodWaitError
+from telethon.errors.rpcerrorlist import (
+    UserAlreadyParticipantError, InviteHashExpiredError, InviteHashInvalidError, UsernameNotOccupiedError,
+    UsernameInvalidError, ChannelPrivateError, ChannelInvalidError, FloodWaitError, PeerIdInvalidError, ChatIdInvalidError,
+)
 
 from services.base import Service
 from models import Container, TelegramChannel, TelegramMessage
+from services.tg.crawl_scheduler import CrawlScheduler
+from streaming import ChunkStream
+from services.tg.keyword_prefilter import KeywordPrefilter
+from services.tg.sender_cache import SenderCache
+from storage.sender_store import SenderStore
+from storage.parser_state import ParserStateStore
+from storage.channel_registry import ChannelRegistryStore
 
 
-KEYWORDS = [
-    # RU
-    "сдаю", "квартира", "аренда", "жильё", "комната",
-    # UA
-    "здаю", "квартира", "оренда", "житло", "кімната",
-    # EN
-    "apartment", "house", "room", "rent",
-    # DE
-    "wohnung", "miete", "zimmer", "unterkunft", "haus"
-]
-
 MAX_JOIN_ATTEMPTS = 3
 
+# Ошибки, после которых канал недоступен, пока его не починят вручную (новый инвайт, другой username)
+DEAD_CHANNEL_ERRORS = (
+    InviteHashExpiredError, InviteHashInvalidError, UsernameNotOccupiedError, UsernameInvalidError, ChannelPrivateError,
+)
+
+# Ответы Telegram на сохраненный в реестре InputPeer, который больше не действителен
+STALE_ENTITY_ERRORS = (ChannelPrivateError, ChannelInvalidError, PeerIdInvalidError, ChatIdInvalidError)
+
+
+class ChannelUnavailableError(Exception):
+    """Канал недоступен: мертвый инвайт, несуществующий username или закрытый канал."""
+
+
+class _CountingTelegramClient(TelegramClient):
+    """TelegramClient, считающий RPC-запросы в `metrics` (включая запросы внутри iter_messages / get_entity)."""
+
+    def __init__(self, *args, metrics: Counter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics = metrics
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        self._metrics["telegram_rpc_calls"] += 1
+        return await super().__call__(request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+
+
 class TgParserService(Service):
-    def __init__(self, api_id: int, api_hash: str, password: str, search_period_days: int, session_name: str = "anon-usr-vasa"):
+    def __init__(self, api_id: int, api_hash: str, password: str, search_period_days: int, session_name: str = "anon-usr-vasa",
+                 incremental: bool = False, state_path: str = "data/cache/tg_parser_state.sqlite", return_window: bool = True,
+                 max_concurrency: int = 4, sender_cache_path: Optional[str] = "data/cache/tg_senders.sqlite",
+                 keywords: Optional[Union[List[str], Dict[str, List[str]]]] = None, keyword_engine: str = "auto",
+                 channel_registry_path: Optional[str] = "data/cache/tg_channels.sqlite", dead_channel_retry_days: float = 7,
+                 flood_sleep_threshold: int = 10):
+        """
+        :param incremental: загружать только сообщения новее последнего обработанного (high-water mark)
+        :param state_path: путь к SQLite с состоянием инкрементального парсинга
+        :param return_window: в инкрементальном режиме дополнять новые сообщения
+                              сохраненными за весь search_period (иначе — только новые)
+        :param max_concurrency: сколько каналов обрабатывать одновременно
+        :param sender_cache_path: путь к SQLite-кэшу отправителей (None — только in-memory LRU)
+        :param keywords: ключевые слова префильтра — списком или {язык: [слова]} (по умолчанию DEFAULT_KEYWORDS)
+        :param keyword_engine: движок префильтра, см. KeywordPrefilter.ENGINES
+        :param channel_registry_path: путь к SQLite-реестру каналов (None — вступать и разрешать каналы каждый запуск)
+        :param dead_channel_retry_days: через сколько дней снова пробовать канал с мертвым инвайтом/username
+        :param flood_sleep_threshold: FloodWait не длиннее стольких секунд Telethon пережидает сам
+        """
         super().__init__()
 
-        self.client = TelegramClient(session_name, api_id, api_hash)
+        self.client = _CountingTelegramClient(session_name, api_id, api_hash, metrics=self.metrics)
+        # Короткие FloodWait Telethon пережидает внутри запроса — обход канала продолжается
+        # с того же места. Длинные пробрасываются наверх, чтобы общий FloodWaitGate
+        # притормозил все воркеры, а не только один запрос.
+        self.client.flood_sleep_threshold = flood_sleep_threshold
+        self.scheduler = CrawlScheduler(max_concurrency=max_concurrency)
+        self.prefilter = KeywordPrefilter(keywords, engine=keyword_engine)
+        self.sender_cache = SenderCache(store=SenderStore(sender_cache_path) if sender_cache_path else None)
         self.password = password
         self.search_period = timedelta(days=search_period_days)
+        self.state = ParserStateStore(state_path) if incremental else None
+        self.return_window = return_window
+        self.channels = ChannelRegistryStore(channel_registry_path) if channel_registry_path else None
+        self.dead_channel_retry = timedelta(days=dead_channel_retry_days)
 
     async def __aenter__(self):
         await self.client.connect()
@@ -42,9 +96,10 @@ class TgParserService(Service):
             await self.client.disconnect()
             print("[INFO] Telegram client disconnected.")
 
-    async def _join_channel(self, url: str):
+    async def _join_channel(self, url: str) -> bool:
         """
         Попытка вступить в канал/группу.
+        Возвращает False, если канал недоступен (мертвый инвайт, несуществующий username).
         """
         for attempt in range(MAX_JOIN_ATTEMPTS):
             try:
@@ -58,23 +113,26 @@ class TgParserService(Service):
                     await self.client(JoinChannelRequest(username))
 
                 print(f"[INFO] Successfully joined {url}.")
-                return
+                return True
 
             except UserAlreadyParticipantError:
                 # ЭТО НЕ ОШИБКА! Это ожидаемое поведение. Логируем как INFO.
                 # print(f"[INFO] Already a member of {url}. Skipping join.")
-                return
+                return True
             
-            except (InviteHashExpiredError, UsernameNotOccupiedError) as e:
+            except DEAD_CHANNEL_ERRORS as e:
                 # Это реальные проблемы с каналом, которые стоит отметить.
                 print(f"[WARN] Could not join {url}: {e.__class__.__name__}:\n{e}")
-                return
+                if self.channels is not None:
+                    await asyncio.to_thread(self.channels.mark_failed, url, e.__class__.__name__)
+                return False
 
             except FloodWaitError as e:
-                # Telegram просит подождать.
+                # Telegram просит подождать — паузу соблюдают все воркеры.
                 wait_time = e.seconds + 1 # +1 секунда на всякий случай
                 print(f"[WARN] Flood wait of {wait_time}s required for {url} on attempt {attempt + 1}/{MAX_JOIN_ATTEMPTS}.")
-                await asyncio.sleep(wait_time)
+                self.scheduler.gate.trigger(wait_time)
+                await self.scheduler.gate.wait()
 
             except Exception as e:
                 # Все остальные, неожиданные ошибки.
@@ -82,41 +140,268 @@ class TgParserService(Service):
                 await asyncio.sleep(5)
         
         print(f"[ERROR] Failed to join {url} after {MAX_JOIN_ATTEMPTS} attempts.")
+        # причина неизвестна — как и раньше, все равно пробуем get_entity
+        return True
+
+    async def _fetch_messages(self, entity, cutoff_date: datetime, min_id: int = 0) -> Tuple[List[Tuple[int, TelegramMessage]], int]:
+        """
+        Загружает сообщения канала новее `cutoff_date` и `min_id`, отбирая их по ключевым словам.
+        Отправители разрешаются пакетно через SenderCache после обхода канала.
+        Возвращает ([(id, TelegramMessage)], id последнего просмотренного сообщения).
+        """
+        matched = []
+        last_id = min_id
+
+        scanned = 0
+        async for msg in self.client.iter_messages(entity, offset_date=cutoff_date, reverse=True, min_id=min_id):
+            scanned += 1
+            last_id = max(last_id, msg.id)
+            if msg.text and self._matches_keywords(msg.text):
+                matched.append(msg)
+        self.metrics["messages_scanned"] += scanned
+        self.metrics["messages_matched"] += len(matched)
+
+        senders = await self.sender_cache.resolve(self.client, matched)
+
+        messages = [
+            (
+                msg.id,
+                TelegramMessage(
+                    text=msg.text,
+                    date=msg.date,
+                    sender=sender_str,
+                )
+            )
+            for msg, sender_str in zip(matched, senders)
+        ]
+        return messages, last_id
+
+    def _matches_keywords(self, text: str) -> bool:
+        """Предварительный фильтр сообщений по ключевым словам."""
+        return self.prefilter.matches(text)
+
+    @staticmethod
+    def _entity_id(entity) -> int:
+        """id канала без маркера типа — ключ состояния инкрементального парсинга."""
+        return utils.get_peer_id(entity, add_mark=False)
+
+    async def _resolve_channel(self, channel: TelegramChannel, refresh: bool = False):
+        """
+        Возвращает сущность канала для запросов к Telegram.
+
+        Известные реестру каналы, в которых аккаунт уже состоит, возвращаются как
+        InputPeer из сохраненных id/access_hash — без вступления и `get_entity`.
+        Каналы с мертвым инвайтом пропускаются `dead_channel_retry` дней.
+        Остальные — вступление, `get_entity` и запись в реестр.
+        """
+        url = channel.url
+
+        if self.channels is not None and not refresh:
+            record = await asyncio.to_thread(self.channels.get, url)
+            if record is not None:
+                if record.is_member and record.entity_id is not None:
+                    if record.peer_type == "channel":
+                        return types.InputPeerChannel(record.entity_id, record.access_hash)
+                    if record.peer_type == "chat":
+                        return types.InputPeerChat(record.entity_id)
+                    if record.peer_type == "user":
+                        return types.InputPeerUser(record.entity_id, record.access_hash)
+                dead = record.failure in {cls.__name__ for cls in DEAD_CHANNEL_ERRORS}
+                if dead and datetime.now().timestamp() - record.failed_at < self.dead_channel_retry.total_seconds():
+                    raise ChannelUnavailableError(f"{record.failure} (cached, will retry after {self.dead_channel_retry.days} days)")
+
+        # вступаем перед парсингом
+        if not await self._join_channel(url):
+            raise ChannelUnavailableError(f"cannot join {url}")
+
+        try:
+            entity = await self.client.get_entity(url)
+        except DEAD_CHANNEL_ERRORS as e:
+            if self.channels is not None:
+                await asyncio.to_thread(self.channels.mark_failed, url, e.__class__.__name__)
+            raise ChannelUnavailableError(f"{e.__class__.__name__}: {e}") from e
+
+        if self.channels is not None:
+            peer = utils.get_input_peer(entity)
+            if isinstance(peer, types.InputPeerChannel):
+                record = ("channel", peer.channel_id, peer.access_hash)
+            elif isinstance(peer, types.InputPeerChat):
+                record = ("chat", peer.chat_id, None)
+            else:
+                record = ("user", peer.user_id, peer.access_hash)
+            await asyncio.to_thread(self.channels.mark_resolved, url, *record)
+
+        return entity
+
+    async def _parse_channel(self, channel: TelegramChannel, cutoff_date: datetime) -> List[TelegramMessage]:
+        """Вступает в канал и возвращает его сообщения за период (с учетом инкрементального режима)."""
+        entity = await self._resolve_channel(channel)
+        entity_id = self._entity_id(entity)
+
+        high_water_mark = None
+        retained = []
+        if self.state is not None:
+            # Инкрементальный режим: только сообщения новее high-water mark
+            high_water_mark = await asyncio.to_thread(self.state.get_high_water_mark, entity_id)
+            if self.return_window and high_water_mark is not None:
+                retained = await asyncio.to_thread(self.state.load_retained, entity_id, cutoff_date, high_water_mark)
+
+        try:
+            fetched, last_id = await self._fetch_messages(entity, cutoff_date, min_id=high_water_mark or 0)
+        except STALE_ENTITY_ERRORS as e:
+            # сохраненная в реестре сущность устарела (исключили из канала, сменился access_hash) —
+            # разрешаем канал заново
+            if self.channels is None or not isinstance(entity, (types.InputPeerChannel, types.InputPeerChat, types.InputPeerUser)):
+                raise
+            print(f"[WARN] Cached entity for {channel.url} is no longer valid ({e.__class__.__name__}), resolving again.")
+            entity = await self._resolve_channel(channel, refresh=True)
+            fetched, last_id = await self._fetch_messages(entity, cutoff_date, min_id=high_water_mark or 0)
+
+        if self.state is None:
+            return [msg for _, msg in fetched]
+
+        await asyncio.to_thread(self.state.save_channel, entity_id, last_id, fetched)
+
+        print(f"[INFO] {channel.url}: {len(fetched)} new messages, {len(retained)} from previous runs.")
+        return retained + [msg for _, msg in fetched]
 
     async def run(self, container: Container) -> Container:
         cutoff_date = datetime.now() - self.search_period
 
         channels: List[TelegramChannel] = container.channels
 
-        for channel in channels:
-            try:
-                # вступаем перед парсингом
-                await self._join_channel(channel.url)
-
-                entity = await self.client.get_entity(channel.url)
-                messages = []
-                async for msg in self.client.iter_messages(entity, offset_date=cutoff_date, reverse=True):
-                    if msg.text:
-                        text = msg.text.lower()
-                        if any(word in text for word in KEYWORDS):
-                            sender = await msg.get_sender()  # Получаем объект User
-                            
-                            sender_str = (
-                                f"@{sender.username}" if sender and sender.username
-                                else sender.phone if sender and sender.phone
-                                else "Unknown"
-                            )
-
-                            messages.append(
-                                TelegramMessage(
-                                    text=msg.text,
-                                    date=msg.date,
-                                    sender=sender_str,
-                                )
-                            )
-                channel.messages = messages
-            except Exception as e:
-                print(f"[ERROR] Error while processing {channel.url}: {e}")
+        results = await self.scheduler.run(
+            channels,
+            lambda channel: self._parse_channel(channel, cutoff_date),
+            describe=lambda channel: channel.url,
+        )
+
+        for channel, result in zip(channels, results):
+            if isinstance(result, BaseException):
+                print(f"[ERROR] Error while processing {channel.url}: {result}")
+                self.metrics["channels_failed"] += 1
                 channel.messages = []
+            else:
+                channel.messages = result
+
+        if self.state is not None:
+            await asyncio.to_thread(self.state.prune, cutoff_date)
+        self.metrics["flood_wait_seconds"] = self.scheduler.gate.total_wait
 
         return Container(channels=channels)
+
+    async def run_stream(self, chunks: ChunkStream) -> AsyncIterator[Container]:
+        """
+        Потоковый режим пайплайна: начинает обход каналов, как только они приходят
+        от предыдущей стадии, и отдает каждый канал отдельным чанком сразу после обхода.
+        """
+        cutoff_date = datetime.now() - self.search_period
+
+        async def channels():
+            async for chunk in chunks:
+                for channel in chunk.channels:
+                    yield channel
+
+        async for channel, result in self.scheduler.stream(
+            channels(),
+            lambda channel: self._parse_channel(channel, cutoff_date),
+            describe=lambda channel: channel.url,
+        ):
+            if isinstance(result, BaseException):
+                print(f"[ERROR] Error while processing {channel.url}: {result}")
+                self.metrics["channels_failed"] += 1
+                channel.messages = []
+            else:
+                channel.messages = result
+            self.metrics["flood_wait_seconds"] = self.scheduler.gate.total_wait
+            yield Container(channels=[channel])
+
+        if self.state is not None:
+            await asyncio.to_thread(self.state.prune, cutoff_date)
+
+    async def stream(
+        self,
+        channels: List[TelegramChannel],
+        on_batch: Callable[[Container], Awaitable[None]],
+        batch_size: int = 20,
+        flush_interval: float = 30.0,
+    ) -> None:
+        """
+        Режим реального времени: подписывается на новые сообщения всех каналов,
+        фильтрует их по ключевым словам сразу при получении и передает микро-батчи
+        в `on_batch` — по достижении `batch_size` сообщений или раз в `flush_interval` секунд.
+        Работает, пока клиент не отключится или задача не будет отменена.
+        """
+        entities = await self.scheduler.run(channels, self._resolve_channel, describe=lambda c: c.url)
+
+        by_peer: Dict[int, Tuple[TelegramChannel, Any]] = {}
+        for channel, entity in zip(channels, entities):
+            if isinstance(entity, BaseException):
+                print(f"[ERROR] Could not subscribe to {channel.url}: {entity}")
+                continue
+            by_peer[utils.get_peer_id(entity)] = (channel, entity)
+
+        if not by_peer:
+            print("[WARN] No channels to listen to.")
+            return
+
+        buffer: List[Tuple[TelegramChannel, int, Any]] = []  # (канал, id сущности, сообщение Telethon)
+        batch_ready = asyncio.Event()
+
+        async def on_new_message(event: events.NewMessage.Event):
+            target = by_peer.get(event.chat_id)
+            if target is None or not event.message.text or not self._matches_keywords(event.message.text):
+                return
+            channel, entity = target
+            buffer.append((channel, self._entity_id(entity), event.message))
+            if len(buffer) >= batch_size:
+                batch_ready.set()
+
+        async def flush():
+            if not buffer:
+                return
+            pending = buffer[:]
+            buffer.clear()
+
+            senders = await self.sender_cache.resolve(self.client, [msg for _, _, msg in pending])
+            grouped: Dict[str, TelegramChannel] = {}
+            new_by_entity: Dict[int, List[Tuple[int, TelegramMessage]]] = {}
+            for (channel, entity_id, msg), sender_str in zip(pending, senders):
+                message = TelegramMessage(text=msg.text, date=msg.date, sender=sender_str)
+                target = grouped.setdefault(
+                    channel.url, TelegramChannel(city=channel.city, name=channel.name, url=channel.url, messages=[])
+                )
+                target.messages.append(message)
+                new_by_entity.setdefault(entity_id, []).append((msg.id, message))
+
+            # сообщения попадают в окно инкрементального парсинга, но high-water mark не сдвигается:
+            # пакетный запуск еще должен загрузить все, что вышло до подписки
+            if self.state is not None:
+                for entity_id, items in new_by_entity.items():
+                    await asyncio.to_thread(self.state.retain_messages, entity_id, items)
+
+            print(f"[INFO] Real-time batch: {len(pending)} messages from {len(grouped)} channels.")
+            try:
+                await on_batch(Container(channels=list(grouped.values())))
+            except Exception as e:
+                print(f"[ERROR] Real-time batch processing failed: {e}")
+
+        handler = events.NewMessage(chats=[entity for _, entity in by_peer.values()])
+        self.client.add_event_handler(on_new_message, handler)
+        print(f"[INFO] Listening for new messages in {len(by_peer)} channels...")
+
+        disconnected = asyncio.ensure_future(self.client.disconnected)
+        try:
+            while not disconnected.done():
+                # ждем полный батч, таймер или отключение — выход не должен ждать flush_interval
+                ready = asyncio.ensure_future(batch_ready.wait())
+                try:
+                    await asyncio.wait({ready, disconnected}, timeout=flush_interval, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    ready.cancel()
+                batch_ready.clear()
+                await flush()
+        finally:
+            self.client.remove_event_handler(on_new_message, handler)
+            disconnected.cancel()
+            await flush()
@@ -1,109 +1,364 @@
+import html
 import datetime
 import asyncio
-import random
+from collections import Counter
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
 
 from telegram import Bot
 from telegram.constants import ParseMode
-from telegram.error import RetryAfter
+from telegram.error import RetryAfter, TimedOut, BadRequest, NetworkError
 
 
 from models import Container, TelegramChannel, TelegramMessage
 from services.base import Service
+from services.rate_limit import TokenBucket
+from storage.outbox import OutboxStore
+from storage.published_ledger import PublishedLedgerStore, ad_fingerprint
+from utils import text_hash
 
 
 class TgPublisherService(Service):
     """
     Сервис для публикации результатов анализа в Telegram-канал.
+
+    Публикации сначала попадают в персистентную очередь (OutboxStore), а затем
+    отправляются из нее с темпом, заданным token bucket. RetryAfter от Telegram
+    приостанавливает всю очередь. После падения процесса следующий запуск
+    продолжает с первой неотправленной записи; уже отправленное повторно не публикуется.
+    Ключ записи очереди — отпечатки входящих в нее объявлений (не текст), а объявления,
+    которые еще стоят в очереди с прошлого запуска, заново не ставятся — даже если
+    дайджест теперь упаковался бы иначе.
+
+    Режимы публикации:
+      - "single" — каждое объявление отдельным сообщением;
+      - "digest" — объявления одного города склеиваются в сообщения до `digest_max_length`
+        символов; разбиение идет только по границам объявлений, поэтому HTML каждого
+        объявления остается целым.
+    Объявление длиннее лимита делится на несколько сообщений по тексту объявления
+    (шапка с тегами — только в первом), так что каждое сообщение Telegram примет.
+    В потоковом режиме пайплайна сервис публикует батчи по ~STREAM_BATCH_MESSAGES объявлений
+    по мере их прихода от фильтра, и дайджест собирается в пределах одного батча.
     """
-    def __init__(self, bot_token: str, channel_username: str):
+
+    MODES = ("single", "digest")
+    TELEGRAM_MAX_LENGTH = 4096
+    DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+    STREAM_BATCH_MESSAGES = 100
+
+    def __init__(self, bot_token: str, channel_username: str, outbox_path: Optional[str] = "data/cache/tg_outbox.sqlite",
+                 messages_per_minute: float = 20, burst: int = 3, max_attempts: int = 5,
+                 mode: str = "single", digest_max_length: int = TELEGRAM_MAX_LENGTH,
+                 ledger_path: Optional[str] = "data/cache/tg_published.sqlite", ledger_ttl_days: float = 30,
+                 requeue_uncertain_hours: Optional[float] = None):
         """
         :param bot_token: токен Telegram-бота
         :param channel_username: публичный username канала, например '@my_public_results'
+        :param outbox_path: путь к SQLite-очереди публикаций (None — очередь в памяти, без восстановления после падения)
+        :param messages_per_minute: темп публикации в канал (Telegram допускает ~20 сообщений в минуту в один чат)
+        :param burst: сколько сообщений можно отправить подряд без паузы
+        :param max_attempts: число попыток отправки одного сообщения
+        :param mode: "single" или "digest", см. MODES
+        :param digest_max_length: максимальная длина сообщения-дайджеста (не больше лимита Telegram)
+        :param ledger_path: путь к журналу опубликованных объявлений (None — не пропускать опубликованные ранее)
+        :param ledger_ttl_days: сколько дней помнить опубликованное объявление
+        :param requeue_uncertain_hours: через сколько часов снова отправлять записи со статусом uncertain
+                                        (None — только вручную: python -m storage.outbox; возможен дубликат)
         """
         super().__init__()
 
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown publish mode: {mode}. Expected one of {self.MODES}")
+        if not 0 < digest_max_length <= self.TELEGRAM_MAX_LENGTH:
+            raise ValueError(f"digest_max_length must be in 1..{self.TELEGRAM_MAX_LENGTH}")
+
         self.bot = Bot(token=bot_token)
         self.channel_username = channel_username
+        self.outbox = OutboxStore(outbox_path or ":memory:")
+        self.bucket = TokenBucket(messages_per_minute, capacity=burst)
+        self.max_attempts = max_attempts
+        self.mode = mode
+        self.digest_max_length = digest_max_length
+        self.ledger = PublishedLedgerStore(ledger_path, ledger_ttl_days) if ledger_path else None
+        self.requeue_uncertain_hours = requeue_uncertain_hours
 
     async def run(self, container: Container) -> Container:
         """
-        Публикует результаты из структуры Container в Telegram-канал.
+        Ставит результаты из структуры Container в очередь и публикует все ожидающие сообщения канала.
+        Возвращает Container с сообщениями, которые опубликовать не удалось.
+        """
+        renders = [
+            (channel, msg, self._format_message(channel, msg))
+            for channel in container.channels
+            for msg in channel.messages or []
+        ]
+        fingerprints = [ad_fingerprint(channel.url, msg.sender, msg.text) for channel, msg, _ in renders]
+
+        published = set()
+        queued = set()
+        if renders:
+            if self.ledger is not None:
+                await asyncio.to_thread(self.ledger.prune)
+                published = await asyncio.to_thread(self.ledger.contains_many, fingerprints)
+            # Объявления из записей прошлого (прерванного) запуска отправит drain. Заново их не ставим:
+            # в дайджесте они упаковались бы иначе, получили бы другой ключ и ушли бы второй раз.
+            for source in await asyncio.to_thread(self.outbox.unfinished_sources, self.channel_username):
+                queued.update(self._source_fingerprints(source))
+
+        fresh = []
+        seen = set()
+        skipped = Counter()
+        for fingerprint, render in zip(fingerprints, renders):
+            if fingerprint in published:
+                skipped["published_skipped"] += 1
+            elif fingerprint in queued:
+                skipped["queued_skipped"] += 1
+            elif fingerprint not in seen:
+                seen.add(fingerprint)
+                fresh.append((fingerprint, *render))
+        self.metrics.update(skipped)
+        if skipped["published_skipped"]:
+            print(f"[INFO] Skipping {skipped['published_skipped']} ads that were already published.")
+        if skipped["queued_skipped"]:
+            print(f"[INFO] Skipping {skipped['queued_skipped']} ads that are already queued from a previous run.")
+
+        # длинные объявления — несколькими частями; объявление числится за последней из них.
+        # Ключ части — отпечаток объявления (с номером части, если их несколько)
+        pieces = []
+        for fingerprint, channel, msg, rendered in fresh:
+            split = self._split_render(channel, msg, rendered)
+            for i, piece in enumerate(split):
+                key = fingerprint if len(split) == 1 else f"{fingerprint}:{i}"
+                pieces.append((channel, msg if i == len(split) - 1 else None, piece, key))
+
+        if self.mode == "digest":
+            parts = self._pack_digests(pieces)
+        else:
+            parts = [[piece] for piece in pieces]
+
+        items = []
+        for part in parts:
+            text = self.DIGEST_SEPARATOR.join(rendered for _, _, rendered, _ in part)
+            source = Container(channels=[])
+            for channel, msg, _, _ in part:
+                if msg is not None:
+                    self._append_message(source, channel, msg)
+            # ключ очереди — набор отпечатков объявлений, а не текст: он не зависит от оформления
+            dedup_key = text_hash("\n".join(sorted(key for _, _, _, key in part)))
+            items.append((dedup_key, text, source.to_json(ensure_ascii=False) if source.channels else None))
+
+        if items:
+            await asyncio.to_thread(self.outbox.enqueue, self.channel_username, items)
+
+        return await self.drain()
+
+    async def drain(self) -> Container:
+        """
+        Отправляет все ожидающие сообщения очереди этого канала в порядке постановки.
+        Возвращает Container с сообщениями, которые опубликовать не удалось.
         """
+        interrupted = await asyncio.to_thread(self.outbox.recover, self.channel_username)
+        if interrupted:
+            print(f"[WARN] {interrupted} messages were being sent when the previous run stopped; "
+                  f"they are marked as 'uncertain' and will not be re-sent automatically.")
+        if self.requeue_uncertain_hours is not None:
+            requeued = await asyncio.to_thread(
+                self.outbox.requeue_uncertain, self.channel_username, self.requeue_uncertain_hours * 3600
+            )
+            if requeued:
+                print(f"[WARN] {requeued} 'uncertain' messages are older than {self.requeue_uncertain_hours}h "
+                      f"and are queued again.")
+
+        pending = await asyncio.to_thread(self.outbox.pending, self.channel_username)
         not_sent_container = Container(channels=[])
+        sent = 0
 
-        for channel in container.channels:
-            if not channel.messages:
+        for outbox_id, text, source in pending:
+            published = await self.safe_send_message(outbox_id, text)
+            if not source:
                 continue
 
-            not_sent_msgs = []
-            for msg in channel.messages:
-                text = self._format_message(channel, msg)
-                try:
-                    if not await self.safe_send_message(text):
-                        not_sent_msgs.append(msg)
-
-                    await asyncio.sleep(random.uniform(1.5, 3.5))
-                except Exception as e:
-                    print(f"❌ Ошибка при публикации сообщения: {e}")
-                    not_sent_msgs.append(msg)
-
-            if not_sent_msgs:
-                existing = next((ch for ch in not_sent_container.channels if ch.url == channel.url), None)
-                if existing:
-                    existing.messages.extend(not_sent_msgs)
-                else:
-                    not_sent_channel = TelegramChannel(
-                        name=channel.name,
-                        url=channel.url,
-                        city=channel.city,
-                        messages=not_sent_msgs
-                    )
-                    not_sent_container.channels.append(not_sent_channel)
-
-        return not_sent_container
+            ads = Container.from_json(source)
+            if published:
+                sent += 1
+                if self.ledger is not None:
+                    await asyncio.to_thread(self.ledger.record_many, {
+                        ad_fingerprint(channel.url, msg.sender, msg.text): (channel.url, msg.sender)
+                        for channel in ads.channels
+                        for msg in channel.messages or []
+                    })
+                continue
 
+            for channel in ads.channels:
+                for msg in channel.messages or []:
+                    self._append_message(not_sent_container, channel, msg)
 
+        if pending:
+            print(f"[INFO] Published {sent}/{len(pending)} queued messages to {self.channel_username}.")
+        return not_sent_container
 
-    async def safe_send_message(self, text: str, max_retries: int = 5) -> bool:
-        for attempt in range(1, max_retries + 1):
+    async def safe_send_message(self, outbox_id: int, text: str) -> bool:
+        """Отправляет одну запись очереди и записывает результат. True — опубликовано."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await asyncio.to_thread(self.outbox.mark_sending, outbox_id)
             try:
-                await self.bot.send_message(
+                self.metrics["telegram_rpc_calls"] += 1
+                sent = await self.bot.send_message(
                     chat_id=self.channel_username,
                     text=text,
                     parse_mode=ParseMode.HTML,
                     disable_web_page_preview=True
                 )
-                # print("[INFO] Message sent successfully.")
-                return True
-
-            except asyncio.TimeoutError:
-                print(f"[WARN] Timeout — retrying ({attempt}/{max_retries})...")
-                await asyncio.sleep(5 * attempt)  # экспоненциальная задержка
 
             except RetryAfter as e:
-                print(f"[WARN] Flood control: waiting {e.retry_after} seconds...")
-                await asyncio.sleep(e.retry_after)
+                # Telegram отклонил запрос — повтор безопасен. Паузу соблюдает вся очередь.
+                wait_time = e.retry_after
+                if isinstance(wait_time, datetime.timedelta):
+                    wait_time = wait_time.total_seconds()
+                print(f"[WARN] Flood control: waiting {wait_time} seconds...")
+                self.metrics["flood_wait_seconds"] += wait_time
+                self.bucket.pause(wait_time + 1)
+                await asyncio.to_thread(self.outbox.mark_pending, outbox_id, str(e))
                 # продолжаем с той же попытки после ожидания
+                continue
+
+            except BadRequest as e:
+                # ошибка в самом сообщении (разметка, длина) — повтор не поможет.
+                # Ловится раньше NetworkError: BadRequest — его подкласс
+                print(f"[ERROR] Telegram rejected message #{outbox_id}: {e}")
+                await asyncio.to_thread(self.outbox.mark_failed, outbox_id, str(e), self.max_attempts, True)
+                return False
+
+            except (TimedOut, NetworkError, asyncio.TimeoutError) as e:
+                # запрос мог дойти до Telegram — повторная отправка рискует создать дубликат
+                print(f"[WARN] {e.__class__.__name__} while sending message #{outbox_id}; "
+                      f"marked as 'uncertain' and not retried.")
+                await asyncio.to_thread(self.outbox.mark_uncertain, outbox_id, f"{e.__class__.__name__}: {e}")
+                return False
 
             except Exception as e:
-                print(f"[ERROR] Unexpected error on attempt {attempt}: {e}")
-                # print(f"[DEBUG] Exception type: {type(e)} | Module: {type(e).__module__}")
-                await asyncio.sleep(2)
+                attempt += 1
+                print(f"[ERROR] Unexpected error on attempt {attempt}/{self.max_attempts}: {e}")
+                status = await asyncio.to_thread(self.outbox.mark_failed, outbox_id, str(e), self.max_attempts)
+                if status == "failed":
+                    print(f"[ERROR] Failed to send message after {self.max_attempts} attempts.")
+                    return False
+                await asyncio.sleep(2 * attempt)
+                continue
+
+            await asyncio.to_thread(self.outbox.mark_sent, outbox_id, sent.message_id)
+            self.metrics["messages_sent"] += 1
+            return True
+
+
+    @staticmethod
+    def _source_fingerprints(source: str) -> List[str]:
+        """Отпечатки объявлений, записанных в `source` записи очереди."""
+        return [
+            ad_fingerprint(channel.url, msg.sender, msg.text)
+            for channel in Container.from_json(source).channels
+            for msg in channel.messages or []
+        ]
+
+    @staticmethod
+    def _append_message(container: Container, channel: TelegramChannel, msg: TelegramMessage) -> None:
+        """Добавляет сообщение в канал контейнера с тем же URL (создавая его при необходимости)."""
+        existing = next((ch for ch in container.channels if ch.url == channel.url), None)
+        if existing:
+            existing.messages.append(msg)
+        else:
+            container.channels.append(
+                TelegramChannel(name=channel.name, url=channel.url, city=channel.city, messages=[msg])
+            )
+
+    @staticmethod
+    def _telegram_length(text: str) -> int:
+        """
+        Длина в UTF-16 code units, как считает Telegram. Считается по HTML-исходнику,
+        то есть с запасом: теги в лимит видимого текста не входят.
+        """
+        return len(text.encode("utf-16-le")) // 2
 
-        print(f"[ERROR] Failed to send message after {max_retries} attempts.")
-        return False
+    def _message_limit(self) -> int:
+        return self.digest_max_length if self.mode == "digest" else self.TELEGRAM_MAX_LENGTH
+
+    def _split_render(self, channel: TelegramChannel, msg: TelegramMessage, rendered: str) -> List[str]:
+        """
+        Делит отрисованное объявление длиннее лимита на части. Режется исходный текст
+        объявления до экранирования — по переносу строки или пробелу, если они есть, —
+        поэтому теги шапки и HTML-сущности (&lt;, &amp;) никогда не разрываются.
+        """
+        limit = self._message_limit()
+        if self._telegram_length(rendered) <= limit:
+            return [rendered]
+
+        header = self._format_message(channel, replace(msg, text=""))
+        text = msg.text
+        parts: List[str] = []
+        while text:
+            prefix = header if not parts else f"<b>💬 Продолжение ({len(parts) + 1}):</b>\n"
+            budget = limit - self._telegram_length(prefix)
+            if budget <= 0:
+                raise ValueError("digest_max_length is too small for the message header")
+
+            # самый длинный префикс текста, который после экранирования помещается в бюджет
+            lo, hi = 1, len(text)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if self._telegram_length(html.escape(text[:mid], quote=False)) <= budget:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            cut = lo
+            if cut < len(text):
+                boundary = max(text.rfind("\n", 0, cut), text.rfind(" ", 0, cut))
+                if boundary > cut // 2:
+                    cut = boundary + 1
+
+            parts.append(prefix + html.escape(text[:cut], quote=False))
+            text = text[cut:]
+        return parts
+
+    def _pack_digests(self, renders: List[Tuple[TelegramChannel, Optional[TelegramMessage], str, str]]) -> List[List[Tuple[TelegramChannel, Optional[TelegramMessage], str, str]]]:
+        """
+        Группирует отрисованные объявления по городу (в порядке первого появления) и жадно
+        упаковывает их в дайджесты не длиннее `digest_max_length`. Части длинного объявления
+        (см. `_split_render`) идут подряд и сами укладываются в лимит.
+        """
+        by_city: Dict[str, list] = {}
+        for render in renders:
+            by_city.setdefault(render[0].city, []).append(render)
 
+        digests = []
+        for city_renders in by_city.values():
+            current, length = [], 0
+            for render in city_renders:
+                added = self._telegram_length(render[2]) + (self._telegram_length(self.DIGEST_SEPARATOR) if current else 0)
+                if current and length + added > self.digest_max_length:
+                    digests.append(current)
+                    current, length = [], 0
+                    added = self._telegram_length(render[2])
+                current.append(render)
+                length += added
+            if current:
+                digests.append(current)
+        return digests
 
     def _format_message(self, channel: TelegramChannel, msg: TelegramMessage) -> str:
         """
         Формирует user-friendly текст публикации.
+        Текст из Telegram экранируется, чтобы "<" и "&" в объявлении не ломали HTML-разметку.
         """
         dt = msg.date.astimezone(datetime.timezone.utc).strftime("%d.%m.%Y %H:%M UTC")
-        sender_url = f"{msg.sender}" if msg.sender is not None else msg.sender
+        sender_url = html.escape(f"{msg.sender}", quote=False)
+        duplicates = f"<b>🔁 Также в каналах:</b> {len(msg.duplicates)}\n" if msg.duplicates else ""
         return (
-            f"<b>🏙️ Город:</b> {channel.city}\n"
-            f"<b>📢 Канал:</b> <a href='{channel.url}'>{channel.name}</a>\n"
+            f"<b>🏙️ Город:</b> {html.escape(channel.city, quote=False)}\n"
+            f"<b>📢 Канал:</b> <a href='{html.escape(channel.url)}'>{html.escape(channel.name, quote=False)}</a>\n"
+            f"{duplicates}"
             f"<b>👤 Автор:</b> {sender_url}\n"
             f"<b>🕒 Дата:</b> {dt}\n\n"
-            f"<b>💬 Сообщение:</b>\n{msg.text}"
+            f"<b>💬 Сообщение:</b>\n{html.escape(msg.text, quote=False)}"
         )
@@ -0,0 +1,68 @@
+from typing import Dict
+
+from models import Container
+from services.base import Service
+from services.tg.parser_service import TgParserService
+from services.tg.filter_service import TgFilterService
+from services.tg.publisher_service import TgPublisherService
+
+
+class TgRealtimeService(Service):
+    """
+    Долгоживущий режим отслеживания каналов в реальном времени.
+
+    TgParserService подписывается на новые сообщения, а каждый микро-батч сразу
+    проходит через TgFilterService и TgPublisherService. Классификатор и клиенты
+    создаются один раз и остаются "теплыми" все время работы.
+    """
+
+    def __init__(self, parser: TgParserService, filter_service: TgFilterService, publisher: TgPublisherService,
+                 batch_size: int = 20, flush_interval: float = 30.0):
+        """
+        :param batch_size: сколько сообщений накопить перед обработкой
+        :param flush_interval: максимальная задержка (в секундах) перед обработкой неполного батча
+        """
+        super().__init__()
+
+        self.parser = parser
+        self.filter_service = filter_service
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def report_metrics(self) -> Dict[str, float]:
+        """Счетчики вложенных сервисов с префиксом: parser.*, filter.*, publisher.*"""
+        report = dict(self.metrics)
+        for prefix, service in (("parser", self.parser), ("filter", self.filter_service), ("publisher", self.publisher)):
+            report.update((f"{prefix}.{name}", value) for name, value in service.report_metrics().items())
+        return report
+
+    async def __aenter__(self):
+        await self.parser.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.parser.__aexit__(exc_type, exc_val, exc_tb)
+
+    async def _process_batch(self, batch: Container) -> None:
+        filtered = await self.filter_service.run(batch)
+        accepted = sum(len(c.messages or []) for c in filtered.channels)
+        print(f"[INFO] Real-time batch: {accepted} messages accepted by filter.")
+
+        if accepted:
+            not_sent = await self.publisher.run(filtered)
+            if not_sent.channels:
+                print(f"[WARN] {sum(len(c.messages) for c in not_sent.channels)} messages were not published.")
+
+    async def run(self, container: Container) -> Container:
+        """
+        Слушает каналы из `container` до отключения клиента или отмены задачи.
+        Возвращает исходный список каналов.
+        """
+        await self.parser.stream(
+            container.channels,
+            self._process_batch,
+            batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+        )
+        return Container(channels=container.channels)
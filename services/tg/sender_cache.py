@@ -0,0 +1,91 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from telethon import TelegramClient
+
+from storage.sender_store import SenderStore
+
+
+def format_sender(sender: Any) -> str:
+    """Формирует строку отправителя: @username, телефон или "Unknown"."""
+    username = getattr(sender, "username", None) if sender else None
+    phone = getattr(sender, "phone", None) if sender else None
+    return f"@{username}" if username else phone if phone else "Unknown"
+
+
+class SenderCache:
+    """
+    Кэш отправителей сообщений: in-memory LRU + опциональный SQLite-слой.
+
+    `resolve` получает строки отправителей для пачки сообщений, обращаясь к
+    Telegram только за неизвестными id — и одним запросом на всю пачку.
+    """
+
+    def __init__(self, max_size: int = 50_000, store: Optional[SenderStore] = None):
+        self.max_size = max_size
+        self.store = store
+        self._lru: "OrderedDict[int, str]" = OrderedDict()
+
+    def _remember(self, sender_id: int, display: str) -> None:
+        self._lru[sender_id] = display
+        self._lru.move_to_end(sender_id)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    async def resolve(self, client: TelegramClient, messages: List[Any]) -> List[str]:
+        """Возвращает строки отправителей в порядке `messages` (сообщений Telethon)."""
+        resolved: Dict[int, str] = {}
+        unknown: Dict[int, Any] = {}  # sender_id -> первое сообщение с этим отправителем
+
+        for msg in messages:
+            sender_id = msg.sender_id
+            if sender_id is None or sender_id in resolved or sender_id in unknown:
+                continue
+            if sender_id in self._lru:
+                self._lru.move_to_end(sender_id)
+                resolved[sender_id] = self._lru[sender_id]
+            else:
+                unknown[sender_id] = msg
+
+        if unknown and self.store is not None:
+            stored = await asyncio.to_thread(self.store.get_many, unknown.keys())
+            resolved.update(stored)
+            for sender_id in stored:
+                del unknown[sender_id]
+
+        fresh: Dict[int, str] = {}
+        failed: Dict[int, str] = {}
+
+        # отправители, которые Telethon уже получил вместе со страницей сообщений — без RPC
+        for sender_id, msg in list(unknown.items()):
+            if msg.sender is not None:
+                fresh[sender_id] = format_sender(msg.sender)
+                del unknown[sender_id]
+
+        # оставшиеся — одним пакетным запросом
+        if unknown:
+            ids = list(unknown)
+            try:
+                entities = await client.get_entity(ids)
+                fresh.update((sender_id, format_sender(e)) for sender_id, e in zip(ids, entities))
+            except Exception as e:
+                print(f"[WARN] Batch sender resolution failed ({e}), falling back to per-message requests.")
+                for sender_id, msg in unknown.items():
+                    try:
+                        fresh[sender_id] = format_sender(await msg.get_sender())
+                    except Exception:
+                        # не кэшируем неудачу — попробуем снова в следующий раз
+                        failed[sender_id] = "Unknown"
+
+        for sender_id, display in fresh.items():
+            self._remember(sender_id, display)
+        for sender_id, display in resolved.items():
+            self._remember(sender_id, display)
+        resolved.update(fresh)
+        resolved.update(failed)
+
+        if fresh and self.store is not None:
+            await asyncio.to_thread(self.store.put_many, fresh)
+
+        return [resolved.get(msg.sender_id, "Unknown") if msg.sender_id is not None else "Unknown" for msg in messages]
@@ -1,29 +1,91 @@
 import os
 import json
 import asyncio
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 from google import genai
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 
 from services.base import Service
+from services.llm_executor import LLMExecutor
 from models import Container, TelegramChannel
-from utils import get_prompt_by_id
+from utils import get_prompt_by_id, normalize_text, text_hash
+from storage.verdict_store import VerdictStore
+from storage.geocode_cache import GeocodeCacheStore
+from services.web.gazetteer import Gazetteer, clean_city_name, fold_name
 
 class WebFilterService(Service):
-    def __init__(self, api_key: str, model: str = "gemini-2.5-flash-lite", strategy: str = "geo", target_region_set: set = {"Bayern"}):
+    PROMPT_ID = "1"
+    STRATEGIES = ("geo", "llm", "hybrid", "gazetteer")
+
+    # Nominatim и Gemini недетерминированы, а сбой запроса дает False для города — кэш стадии
+    # только по явному "stage_cache": true, и то лишь для запусков без сбоев
+    STAGE_CACHEABLE = False
+    CACHE_ARTIFACT_PARAMS = ("gazetteer_path",)
+    CACHE_ARTIFACTS = ("promts/web_filter_service.json", "data/gazetteer/de_places.tsv")
+
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash-lite", strategy: str = "geo", target_region_set: set = {"Bayern"},
+                 llm_max_concurrency: int = 4, llm_requests_per_minute: float = 15, llm_tokens_per_minute: float = 250_000,
+                 verdict_cache_path: Optional[str] = "data/cache/llm_verdicts.sqlite", verdict_cache_ttl_days: float = 30,
+                 country: str = "Germany", language: str = "de", geocode_cache_path: Optional[str] = "data/cache/geocode.sqlite",
+                 geocode_cache_ttl_days: float = 180, geocode_negative_ttl_days: float = 7,
+                 gazetteer_path: Optional[str] = None, gazetteer_min_confidence: float = .85,
+                 gazetteer_fuzzy_min_confidence: float = .92, gazetteer_fallback: Sequence[str] = ("geo", "llm")):
+        """
+        :param strategy: "geo" — Nominatim; "llm" — Gemini; "hybrid" — Nominatim, затем Gemini для нерешенных;
+                         "gazetteer" — офлайн-справочник, затем фазы из `gazetteer_fallback` для нерешенных
+        :param gazetteer_path: TSV-справочник мест (None — встроенный data/gazetteer/de_places.tsv)
+        :param gazetteer_min_confidence: минимальная уверенность справочника, ниже — город считается нерешенным
+        :param gazetteer_fuzzy_min_confidence: то же для нечетких совпадений (строже: "Hallen" -> Halle — не опечатка)
+        :param gazetteer_fallback: фазы для городов, не найденных в справочнике ("geo", "llm"); [] — полностью офлайн
+        """
         super().__init__()
 
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}. Expected one of {self.STRATEGIES}")
+
         self.model = model
         self.client = genai.Client(api_key=api_key)
+        self.llm = LLMExecutor(
+            self.client,
+            model,
+            max_concurrency=llm_max_concurrency,
+            requests_per_minute=llm_requests_per_minute,
+            tokens_per_minute=llm_tokens_per_minute,
+            metrics=self.metrics,
+        )
+        self.verdict_store = VerdictStore(verdict_cache_path, verdict_cache_ttl_days) if verdict_cache_path else None
+        self._verdicts_checked_version: Optional[str] = None
         self.strategy = strategy
         self.target_regions_set = target_region_set
         self.target_regions_set = {r.lower() for r in target_region_set}
 
-        if self.strategy == "geo" or self.strategy == "hybrid":
+        self.country = country
+        self.language = language
+        # справочник нужен всем стратегиям: по нему названия сводятся к каноническим
+        self.gazetteer = Gazetteer.load(gazetteer_path)
+        self.gazetteer_min_confidence = gazetteer_min_confidence
+        self.gazetteer_fuzzy_min_confidence = gazetteer_fuzzy_min_confidence
+        self.use_gazetteer = self.strategy == "gazetteer"
+        if self.use_gazetteer:
+            phases = set(gazetteer_fallback)
+        elif self.strategy == "hybrid":
+            phases = {"geo", "llm"}
+        else:
+            phases = {self.strategy}
+        self.use_geo = "geo" in phases
+        self.use_llm = "llm" in phases
+
+        self.geocode_cache = None
+        if self.use_geo:
             self.geolocator = Nominatim(user_agent="my_telegram_filter_bot_v1")
+            if geocode_cache_path:
+                self.geocode_cache = GeocodeCacheStore(geocode_cache_path, geocode_cache_ttl_days, geocode_negative_ttl_days)
+
 
+    def result_cacheable(self) -> bool:
+        return not (self.metrics["geocode_failures"] or self.metrics["llm_failed_batches"])
 
     async def run(self, container: Container) -> Container:
         """
@@ -32,11 +94,26 @@ class WebFilterService(Service):
         """
         channels: List[TelegramChannel] = container.channels
 
-        cities_to_check = [c.city for c in channels]
+        # Разные написания одного города ("Нюрнберг", "Nürnberg ", "Nuremberg") проверяются один раз
+        representatives = {}
+        channel_keys = []
+        for channel in channels:
+            key, name = self._canonical_city(channel.city)
+            representatives.setdefault(key, name)
+            channel_keys.append(key)
+        print(f"[INFO] {len(set(c.city for c in channels))} city names normalised to {len(representatives)} canonical cities.")
+
+        cities_to_check = list(representatives.values())
         final_results = {}
 
+        # 0. GAZETTEER PHASE (offline)
+        if self.use_gazetteer:
+            print(f"[INFO] PHASE 0 - resolving {len(cities_to_check)} cities with the offline gazetteer...")
+            gazetteer_results, cities_to_check = self._classify_cities_gazetteer(cities_to_check)
+            final_results.update(gazetteer_results)
+
         # 1. GEO PHASE
-        if self.strategy in ["geo", "hybrid"]:
+        if cities_to_check and self.use_geo:
             print(f"[INFO] PHASE 1 - starting Geo classification for {len(cities_to_check)} cities...")
             geo_results, unresolved_cities = await self._classify_cities_geo(cities_to_check)
             final_results.update(geo_results)
@@ -45,90 +122,186 @@ class WebFilterService(Service):
             unresolved_cities = cities_to_check
 
         # 2. LLM PHASE (Fallback)
-        if unresolved_cities and self.strategy in ["llm", "hybrid"]:
+        if unresolved_cities and self.use_llm:
             print(f"[INFO] PHASE 2 - sending {len(unresolved_cities)} unresolved cities to Gemini...")
             llm_results = await self._classify_cities_llm(unresolved_cities)
             final_results.update(llm_results)
 
 
         results = [
-            channel for channel in channels
-            if final_results.get(channel.city, False)
+            channel for channel, key in zip(channels, channel_keys)
+            if final_results.get(representatives[key], False)
         ]
         return Container(channels=results)
 
+    def _canonical_city(self, city: str) -> Tuple[str, str]:
+        """
+        Returns (canonical key, name to look up) for a raw city name: parser leftovers are
+        stripped, known spellings are mapped to the gazetteer name, and the key is the folded name.
+        """
+        cleaned = clean_city_name(city)
+        name = self.gazetteer.canonical_name(cleaned) or cleaned
+        return fold_name(name), name
+
+    def _classify_cities_gazetteer(self, cities: List[str]) -> Tuple[dict[str, bool], List[str]]:
+        """
+        Resolves cities against the bundled gazetteer (no network, a few microseconds per city).
+        Cities without a confident match are returned as unresolved for the next phases.
+        """
+        results: dict[str, bool] = {}
+        unresolved: List[str] = []
+
+        for city in sorted(set(cities)):
+            match = self.gazetteer.resolve(city)
+            min_confidence = self.gazetteer_min_confidence if match is None or match.exact else self.gazetteer_fuzzy_min_confidence
+            if match is None or match.state is None or match.confidence < min_confidence:
+                unresolved.append(city)
+                continue
+            state = match.state.lower()
+            results[city] = any(r in state for r in self.target_regions_set)
+
+        self.metrics["gazetteer_resolved"] += len(results)
+        print(f"[INFO] Gazetteer resolved {len(results)} cities, {len(unresolved)} left unresolved.")
+        return results, unresolved
+
     async def _classify_cities_geo(self, cities: List[str]) -> Tuple[dict[str, bool], List[str]]:
         """
         Validates cities using Nominatim (OpenStreetMap).
         Fast, free, but requires rate limiting (1 req/sec).
+        Cities found in the persistent geocode cache are resolved without a network lookup.
         """
         results: dict[str, bool] = {}
         unresolved: List[str] = []
         
         unique_cities = sorted(list(set(cities)))
-        
+        city_keys = {city: normalize_text(city).lower() for city in unique_cities}
 
+        cached = {}
+        if self.geocode_cache is not None:
+            cached = await asyncio.to_thread(
+                self.geocode_cache.get_many, self.country, self.language, city_keys.values()
+            )
+            hits = sum(1 for key in city_keys.values() if key in cached)
+            self.metrics["geocode_cache_hits"] += hits
+            print(f"[INFO] {hits}/{len(unique_cities)} cities taken from geocode cache.")
+
+        first_lookup = True
         for city in unique_cities:
-            try:
-                location = await asyncio.to_thread(
-                    self.geolocator.geocode, 
-                    f"{city}, Germany", 
-                    addressdetails=True,
-                    language="de"
-                )
-                
-                is_in_region = False
-                if location:
-                    address = location.raw.get('address', {})
-                    state = address.get('state', '').lower()
-
-                    if not state:
-                        print(f"[WARN] Incomplete address info for {city}, defaulting to False")
-                        unresolved.append(city)
-                    else:
-                        is_in_region = any(r in state for r in self.target_regions_set)
-                                           
+            key = city_keys[city]
+            if key in cached:
+                status, state = cached[key]
+            else:
+                if not first_lookup:
+                    # Nominatim usage policy: no more than 1 request per second
+                    await asyncio.sleep(1.0)
+                first_lookup = False
+
+                self.metrics["geocode_requests"] += 1
+                try:
+                    status, state = await self._geocode_state(city)
+                except (GeocoderTimedOut, GeocoderUnavailable):
+                    print(f"[ERROR] GeoAPI error for {city}, defaulting to False")
+                    self.metrics["geocode_failures"] += 1
+                    results[city] = False
+                    unresolved.append(city)
+                    continue
+
+                if self.geocode_cache is not None:
+                    await asyncio.to_thread(self.geocode_cache.put, self.country, self.language, key, status, state)
+
+            if status == "found":
+                results[city] = any(r in state for r in self.target_regions_set)
+            else:
+                if status == "no_state":
+                    print(f"[WARN] Incomplete address info for {city}, defaulting to False")
                 else:
                     print(f"[WARN] No info for {city}, defaulting to False")
-                    unresolved.append(city)
-                
-                results[city] = is_in_region
-                
-                await asyncio.sleep(1.0) 
-                
-
-            except (GeocoderTimedOut, GeocoderUnavailable):
-                print(f"[ERROR] GeoAPI error for {city}, defaulting to False")
                 results[city] = False
                 unresolved.append(city)
 
         return results, unresolved
 
+    async def _geocode_state(self, city: str) -> Tuple[str, Optional[str]]:
+        """
+        Looks the city up in Nominatim and returns (status, state in lower case).
+        Status is "found", "no_state" (address without a state) or "not_found".
+        """
+        location = await asyncio.to_thread(
+            self.geolocator.geocode, 
+            f"{city}, {self.country}", 
+            addressdetails=True,
+            language=self.language
+        )
+        if not location:
+            return "not_found", None
+
+        state = location.raw.get('address', {}).get('state', '').lower()
+        if not state:
+            return "no_state", None
+        return "found", state
+
     async def _classify_cities_llm(self, cities: List[str]) -> dict[str, bool]:
-        """Send unique city batches to Gemini and return mapping {city: bool}."""
+        """
+        Send unique city batches to Gemini (concurrently) and return mapping {city: bool}.
+        Cities with a cached verdict for the current prompt version are not sent again.
+        """
         prompts_path = os.path.join(
             os.path.dirname(__file__), "..", "..", "promts", "web_filter_service.json"
         )
-        system, user_template = get_prompt_by_id(prompts_path, "1")
+        system, user_template = get_prompt_by_id(prompts_path, self.PROMPT_ID)
+        prompt_version = text_hash(system, user_template)
+        prompt_key = f"web_filter_service:{self.PROMPT_ID}"
 
         results: dict[str, bool] = {}
         batch_size = 10
 
         # уникализируем города
         unique_cities = sorted(list(set(cities)))
+        city_hashes = {city: text_hash(normalize_text(city)) for city in unique_cities}
 
-        for i in range(0, len(unique_cities), batch_size):
-            batch = unique_cities[i:i + batch_size]
-            user = user_template.format(input_data=batch)
-
-            response = await asyncio.to_thread(
-                self.client.models.generate_content,
-                model=self.model,
-                contents=[system, user],
+        if self.verdict_store is not None:
+            if self._verdicts_checked_version != prompt_version:
+                # чистка устаревших вердиктов — один раз на версию промта, а не на каждый батч
+                await asyncio.to_thread(self.verdict_store.invalidate_stale, prompt_key, prompt_version)
+                self._verdicts_checked_version = prompt_version
+            cached = await asyncio.to_thread(
+                self.verdict_store.get_many, prompt_key, prompt_version, self.model, city_hashes.values()
             )
+            for city, h in city_hashes.items():
+                if h in cached:
+                    results[city] = bool(cached[h])
+            self.metrics["llm_verdict_cache_hits"] += len(results)
+            print(f"[INFO] {len(results)}/{len(unique_cities)} city verdicts taken from cache.")
+
+        pending = [city for city in unique_cities if city not in results]
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        responses = await self.llm.map(
+            [[system, user_template.format(input_data=batch)] for batch in batches]
+        )
 
-            parsed = json.loads(response.candidates[0].content.parts[0].text)
+        new_verdicts: dict[str, int] = {}
+        for batch, response in zip(batches, responses):
+            if isinstance(response, BaseException):
+                print(f"[ERROR] Gemini request failed for cities {batch}: {response}")
+                self.metrics["llm_failed_batches"] += 1
+                continue
+
+            try:
+                parsed = json.loads(response.candidates[0].content.parts[0].text)
+            except (json.JSONDecodeError, IndexError, AttributeError, TypeError) as e:
+                print(f"[ERROR] Could not parse Gemini response for cities {batch}: {e}")
+                self.metrics["llm_failed_batches"] += 1
+                continue
             results.update(parsed)
 
-        return results
+            for city in batch:
+                if city in parsed:
+                    new_verdicts[city_hashes[city]] = int(bool(parsed[city]))
 
+        if new_verdicts and self.verdict_store is not None:
+            await asyncio.to_thread(
+                self.verdict_store.put_many, prompt_key, prompt_version, self.model, new_verdicts
+            )
+
+        return results
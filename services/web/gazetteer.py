@@ -0,0 +1,176 @@
+import os
+import re
+import difflib
+import unicodedata
+from dataclasses import dataclass
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "gazetteer", "de_places.tsv")
+
+# Транслитерация кириллицы, ориентированная на немецкое написание:
+# "Мюнхен" -> "munchen", "Вюрцбург" -> "wurzburg", "Штутгарт" -> "stutgart".
+_CYRILLIC_DIGRAPHS = {"шт": "st", "шп": "sp"}
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "w", "г": "g", "ґ": "g", "д": "d", "е": "e", "є": "je", "ё": "o", "ж": "sch",
+    "з": "s", "и": "i", "і": "i", "ї": "ji", "й": "j", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "ch", "ц": "z", "ч": "tsch",
+    "ш": "sch", "щ": "schtsch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "u", "я": "ja",
+}
+_CYRILLIC_RE = re.compile("|".join(sorted(_CYRILLIC_DIGRAPHS, key=len, reverse=True)) + "|[" + "".join(_CYRILLIC) + "]")
+
+
+def fold_name(name: str) -> str:
+    """
+    Приводит название места к ключу для сравнения: нижний регистр, без диакритики
+    (ü -> u, ß -> ss), кириллица транслитерирована, пунктуация заменена пробелами.
+    """
+    text = (name or "").lower().replace("ß", "ss")
+    text = _CYRILLIC_RE.sub(lambda m: _CYRILLIC_DIGRAPHS.get(m.group(0), _CYRILLIC.get(m.group(0), "")), text)
+    text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def clean_city_name(name: str) -> str:
+    """
+    Убирает мусор, оставшийся после парсинга страницы (маркеры "‣", "•", переводы строк,
+    пунктуацию по краям), сохраняя читаемое написание: "‣ Nürnberg ," -> "Nürnberg".
+    """
+    text = unicodedata.normalize("NFC", name or "")
+    text = re.sub(r"[‣•▪►▸➤→·|]+", " ", text)
+    text = " ".join(text.split())
+    return text.strip(" \t-–—,.;:!?*\"'«»")
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class GazetteerMatch:
+    query: str
+    name: str             # каноническое название из справочника
+    state: Optional[str]  # федеральная земля; None, если название неоднозначно
+    confidence: float
+    exact: bool           # совпадение с названием или синонимом, а не нечеткое
+
+
+class Gazetteer:
+    """
+    Офлайн-справочник мест Германии: муниципалитеты, районы и регионы -> федеральная земля.
+
+    Поиск идет по сложенному ключу (`fold_name`): сначала точное совпадение с названием
+    или синонимом ("Munich", "Мюнхен" -> München), затем нечеткое — кандидаты отбираются
+    по триграммному индексу и ранжируются difflib. Уточнение в скобках или через запятую
+    ("Friedberg (Bayern)", "Haan, NRW") сужает выбор до названной земли.
+
+    Уверенность: 1.0 для однозначного точного совпадения, сходство строк для нечеткого,
+    и делится на число разных земель-кандидатов, если название неоднозначно.
+    Короткие ключи (меньше MIN_FUZZY_KEY_LENGTH символов) ищутся только точно: для них
+    одна буква разницы дает высокое сходство с чужим местом ("Main" -> Mainz, "Ham" -> Hamm).
+    """
+
+    MIN_FUZZY_KEY_LENGTH = 6
+
+    def __init__(self, entries: List[Tuple[str, str, List[str]]]):
+        """
+        :param entries: [(каноническое название, земля, [синонимы])]
+        """
+        self._by_key: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self._index: Dict[str, Set[str]] = defaultdict(set)
+        self._state_keys: Dict[str, str] = {}
+
+        for name, state, aliases in entries:
+            for alias in [name, *aliases]:
+                key = fold_name(alias)
+                if key:
+                    self._by_key[key].add((name, state))
+
+        for key in self._by_key:
+            for gram in _trigrams(key):
+                self._index[gram].add(key)
+
+        # названия земель и их синонимы — для уточнений вида "(Bayern)" / ", NRW"
+        for key, places in self._by_key.items():
+            states = {state for _, state in places}
+            if any(fold_name(name) == fold_name(state) for name, state in places) and len(states) == 1:
+                self._state_keys[key] = next(iter(states))
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "Gazetteer":
+        """Загружает справочник из TSV: name, state, aliases (через '|'); строки с '#' — комментарии."""
+        entries = []
+        with open(path or DEFAULT_GAZETTEER_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line or line.startswith("#") or line.startswith("name\t"):
+                    continue
+                name, state, *rest = line.split("\t")
+                aliases = [a for a in (rest[0].split("|") if rest else []) if a]
+                entries.append((name, state, aliases))
+        return cls(entries)
+
+    def canonical_name(self, query: str) -> Optional[str]:
+        """
+        Каноническое название для точного совпадения с названием или синонимом
+        ("Nuremberg", "Нюрнберг" -> "Nürnberg"); None, если совпадения нет или оно неоднозначно.
+        """
+        names = {name for name, _ in self._by_key.get(fold_name(query), ())}
+        return next(iter(names)) if len(names) == 1 else None
+
+    def _candidates(self, key: str, limit: int = 5) -> List[Tuple[float, str]]:
+        """Ключи справочника, похожие на `key`: [(сходство, ключ)] по убыванию сходства."""
+        if key in self._by_key:
+            return [(1.0, key)]
+        if len(key) < self.MIN_FUZZY_KEY_LENGTH:
+            return []
+
+        grams = _trigrams(key)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._index.get(gram, ()):
+                shared[candidate] += 1
+
+        # грубый отбор по доле общих триграмм, точная оценка — difflib
+        rough = sorted(shared, key=lambda c: shared[c] / len(grams | _trigrams(c)), reverse=True)[:limit * 4]
+        scored = [(difflib.SequenceMatcher(None, key, c).ratio(), c) for c in rough]
+        return sorted(scored, reverse=True)[:limit]
+
+    def resolve(self, query: str) -> Optional[GazetteerMatch]:
+        """Находит место по названию. None — ничего похожего в справочнике нет."""
+        key = fold_name(query)
+        if not key:
+            return None
+
+        state_hint = None
+        if key not in self._by_key:
+            # "Friedberg (Bayern)", "Haan, NRW", "Hagen, Ruhrgebiet"
+            parts = re.split(r"[(,]", query, maxsplit=1)
+            if len(parts) == 2:
+                base, qualifier = fold_name(parts[0]), fold_name(parts[1])
+                if base:
+                    state_hint = self._state_keys.get(qualifier)
+                    if state_hint is None and qualifier in self._by_key:
+                        qualifier_states = {s for _, s in self._by_key[qualifier]}
+                        state_hint = next(iter(qualifier_states)) if len(qualifier_states) == 1 else None
+                    key = base
+
+        candidates = self._candidates(key)
+        if not candidates:
+            return None
+
+        best_score, best_key = candidates[0]
+        exact = best_key == key
+        # кандидаты почти с тем же сходством считаются равноправными
+        places = {place for score, c in candidates if score >= best_score - .02 for place in self._by_key[c]}
+        if state_hint is not None:
+            hinted = {place for place in places if place[1] == state_hint}
+            places = hinted or places
+
+        states = {state for _, state in places}
+        name = sorted(places)[0][0]
+        if len(states) == 1:
+            return GazetteerMatch(query, name, next(iter(states)), best_score, exact)
+        return GazetteerMatch(query, name, None, best_score / len(states), exact)
@@ -0,0 +1,178 @@
+import re
+import uuid
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from models import TelegramChannel
+
+
+DEFAULT_ROOT_BLOCK_ID = "a7450047-24d6-4e14-a80c-de8903f35b13"
+
+_TME_RE = re.compile(r"https?://t\.me/[^\s\"'<>)]+")
+
+
+def page_id_from_url(url: str) -> str:
+    """Достает id страницы Notion (32 hex-символа в конце пути) и возвращает его в виде UUID."""
+    match = re.search(r"([0-9a-f]{32})(?:[/?#]|$)", url.replace("-", ""), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Could not find a Notion page id in {url}")
+    return str(uuid.UUID(match.group(1)))
+
+
+def _clean_city(text: str) -> str:
+    # "‣" — так Notion отображает упоминания страниц в заголовках
+    return text.replace("‣", "").replace("\n", "").strip()
+
+
+def _block_value(entry: dict) -> dict:
+    """recordMap хранит блок как {"value": {...}} или, в новых ответах, {"value": {"value": {...}}}."""
+    value = entry.get("value") or {}
+    if "type" not in value and isinstance(value.get("value"), dict):
+        value = value["value"]
+    return value
+
+
+def _rich_text(value: dict) -> List[list]:
+    return (value.get("properties") or {}).get("title") or []
+
+
+def _plain_text(segments: List[list]) -> str:
+    return "".join(seg[0] for seg in segments if seg and isinstance(seg[0], str))
+
+
+def _links(segments: List[list]) -> Iterable[Tuple[str, str]]:
+    """Пары (текст, ссылка на t.me) из rich text Notion: ссылки-аннотации и ссылки прямо в тексте."""
+    for seg in segments:
+        if not seg or not isinstance(seg[0], str):
+            continue
+        text = seg[0]
+        annotations = seg[1] if len(seg) > 1 else []
+        hrefs = [a[1] for a in annotations if len(a) > 1 and a[0] == "a" and isinstance(a[1], str)]
+        if hrefs:
+            for href in hrefs:
+                if "t.me" in href:
+                    yield text.strip(), href
+        else:
+            for href in _TME_RE.findall(text):
+                yield href, href
+
+
+def channels_from_record_map(record_map: dict, root_block_id: Optional[str] = DEFAULT_ROOT_BLOCK_ID) -> List[TelegramChannel]:
+    """
+    Извлекает каналы из recordMap страницы Notion.
+
+    Города — toggle-блоки: дочерние блоки `root_block_id`, а если его нет в recordMap —
+    все toggle-блоки без вложенных toggle. Ссылки на t.me ищутся во всех потомках toggle.
+    """
+    blocks = {block_id: _block_value(entry) for block_id, entry in (record_map.get("block") or {}).items()}
+
+    def descendants(block_id: str) -> Iterable[dict]:
+        stack = list(reversed(blocks.get(block_id, {}).get("content") or []))
+        while stack:
+            child = blocks.get(stack.pop())
+            if child is None:
+                continue
+            yield child
+            stack.extend(reversed(child.get("content") or []))
+
+    if root_block_id and root_block_id in blocks:
+        toggles = [blocks[c] for c in blocks[root_block_id].get("content") or [] if c in blocks]
+        toggles = [t for t in toggles if t.get("type") == "toggle"]
+    else:
+        toggles = [
+            b for b in blocks.values()
+            if b.get("type") == "toggle" and not any(d.get("type") == "toggle" for d in descendants(b["id"]))
+        ]
+
+    results = []
+    for toggle in toggles:
+        city = _clean_city(_plain_text(_rich_text(toggle)))
+        for child in descendants(toggle["id"]):
+            for name, href in _links(_rich_text(child)):
+                results.append(TelegramChannel(city=city, name=name, url=href))
+    return results
+
+
+def channels_from_html(html: str) -> List[TelegramChannel]:
+    """Извлекает каналы из сохраненного HTML страницы Notion (toggle-блоки должны быть раскрыты)."""
+    soup = BeautifulSoup(html, "html.parser")
+    results = []
+
+    for toggle in soup.select(".notion-toggle"):
+        content = toggle.select_one(".notion-toggle__content")
+        summary = toggle.select_one(".notion-toggle__summary")
+        # города — только toggle без вложенных toggle; внешний toggle-список пропускаем
+        if content is None or summary is None or content.select_one(".notion-toggle"):
+            continue
+
+        city = _clean_city(summary.get_text())
+        for a in content.find_all("a", href=True):
+            if "t.me" in a["href"]:
+                results.append(TelegramChannel(city=city, name=a.get_text().strip(), url=a["href"]))
+    return results
+
+
+def channels_from_file(path: str, root_block_id: Optional[str] = DEFAULT_ROOT_BLOCK_ID) -> List[TelegramChannel]:
+    """Разбирает сохраненный ответ loadPageChunk / recordMap (.json) или HTML-страницу."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+
+    if path.lower().endswith(".json"):
+        data = json.loads(raw)
+        return channels_from_record_map(data.get("recordMap", data), root_block_id)
+    return channels_from_html(raw)
+
+
+async def fetch_record_map(page_url: str, timeout: float = 30) -> dict:
+    """
+    Загружает recordMap публичной страницы Notion через ее внутренний API
+    (`loadPageChunk` по всем чанкам, затем `syncRecordValues` для недостающих дочерних блоков).
+    """
+    parsed = urlparse(page_url)
+    api = f"{parsed.scheme}://{parsed.netloc}/api/v3"
+    page_id = page_id_from_url(page_url)
+    blocks: Dict[str, dict] = {}
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+
+        async def post(endpoint: str, payload: dict) -> dict:
+            async with session.post(f"{api}/{endpoint}", json=payload) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+        cursor, chunk_number = {"stack": []}, 0
+        while True:
+            data = await post("loadPageChunk", {
+                "pageId": page_id, "limit": 100, "cursor": cursor,
+                "chunkNumber": chunk_number, "verticalColumns": False,
+            })
+            blocks.update((data.get("recordMap") or {}).get("block") or {})
+            cursor = data.get("cursor") or {}
+            if not cursor.get("stack"):
+                break
+            chunk_number += 1
+
+        # содержимое свернутых toggle в чанки может не попасть — догружаем по id
+        requested = set()
+        while True:
+            missing = {
+                child
+                for entry in blocks.values()
+                for child in _block_value(entry).get("content") or []
+                if child not in blocks and child not in requested
+            }
+            if not missing:
+                break
+            requested |= missing
+            missing = sorted(missing)
+            for i in range(0, len(missing), 100):
+                data = await post("syncRecordValues", {
+                    "requests": [{"pointer": {"table": "block", "id": block_id}, "version": -1} for block_id in missing[i:i + 100]]
+                })
+                blocks.update((data.get("recordMap") or {}).get("block") or {})
+
+    return {"block": blocks}
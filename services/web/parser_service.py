@@ -1,67 +1,139 @@
 import time
-from typing import List
+import asyncio
+from typing import List, Optional, Union
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.chrome.options import Options
+except ImportError:
+    webdriver = None
 
 from services.base import Service
 from models import Container, TelegramChannel
+from services.web.notion_parser import DEFAULT_ROOT_BLOCK_ID, channels_from_file, channels_from_record_map, fetch_record_map
 
 class WebParserService(Service):
+    """
+    Сервис сбора списка каналов (город -> ссылки t.me) со страницы Notion.
 
-    def __init__(self):
+    Бэкенды:
+      - "http" — recordMap страницы через внутренний API Notion, без браузера;
+      - "file" — сохраненный ответ API (.json) или HTML-страница (`source_path`), для офлайн-запусков;
+      - "selenium" — Chrome с раскрытием toggle-блоков (медленно, нужен браузер);
+      - "auto" — "file", если задан `source_path`, иначе "http" с откатом на "selenium" при ошибке.
+    Selenium выполняется в отдельном потоке и не блокирует event loop.
+    """
+
+    BACKENDS = ("auto", "http", "file", "selenium")
+
+    def __init__(self, backend: str = "auto", page_url: Optional[str] = None, source_path: Optional[str] = None,
+                 root_block_id: Optional[str] = DEFAULT_ROOT_BLOCK_ID, timeout: float = 30):
+        """
+        :param backend: см. BACKENDS
+        :param page_url: адрес публичной страницы Notion; обязателен для всех бэкендов, кроме "file"
+                         (и "auto" с `source_path`). `run(url)` может передать другой адрес
+        :param source_path: сохраненный ответ API / HTML для бэкенда "file"
+        :param root_block_id: toggle-блок со списком городов; обязателен для "selenium" (и отката на него в "auto")
+        :param timeout: таймаут HTTP-запросов к Notion в секундах
+        """
         super().__init__()
 
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}. Expected one of {self.BACKENDS}")
+        if backend == "file" and not source_path:
+            raise ValueError("backend='file' requires source_path")
+        uses_network = backend in ("http", "selenium") or (backend == "auto" and not source_path)
+        if uses_network and not page_url:
+            raise ValueError(f"backend='{backend}' requires page_url (or source_path for offline runs)")
+        if backend == "selenium" and not root_block_id:
+            raise ValueError("backend='selenium' requires root_block_id")
+
+        self.backend = backend
+        self.page_url = page_url
+        self.source_path = source_path
+        self.root_block_id = root_block_id
+        self.timeout = timeout
+
+    async def run(self, url: Optional[Union[str, Container]] = None) -> Container:
+        # в пайплайне Orchestrator передает Container — тогда берем адрес из конфига
+        if not isinstance(url, str):
+            url = self.page_url
+
+        if self.backend == "file" or (self.backend == "auto" and self.source_path):
+            results = await asyncio.to_thread(channels_from_file, self.source_path, self.root_block_id)
+
+        elif self.backend == "selenium":
+            results = await asyncio.to_thread(self._parse_selenium, url)
+
+        else:
+            try:
+                record_map = await fetch_record_map(url, timeout=self.timeout)
+                results = channels_from_record_map(record_map, self.root_block_id)
+                if not results:
+                    raise ValueError("no city toggles with t.me links found in the page data")
+            except Exception as e:
+                if self.backend == "http" or not self.root_block_id:
+                    raise
+                print(f"[WARN] Notion HTTP parsing failed ({e}), falling back to Selenium.")
+                results = await asyncio.to_thread(self._parse_selenium, url)
+
+        print(f"[INFO] Parsed {len(results)} channels in {len({c.city for c in results})} cities.")
+        return Container(channels = results)
+
+    def _parse_selenium(self, url: str) -> List[TelegramChannel]:
+        """Блокирующий разбор страницы через Chrome — вызывать через asyncio.to_thread."""
+        if webdriver is None:
+            raise ImportError("The selenium backend requires the 'selenium' package")
+
         chrome_options = Options()
         # chrome_options.add_argument("--headless")  # если нужно без GUI
         # chrome_options.add_argument("--disable-gpu")
         # chrome_options.add_argument("--no-sandbox")
 
         # Selenium сам найдет подходящий драйвер
-        self.driver = webdriver.Chrome(options=chrome_options)
-        self.wait = WebDriverWait(self.driver, 10)
-    
-    async def run(self, url: str) -> Container:
-        self.driver.get(url)
-        results = []
-
-        main_block = self.driver.find_element(By.ID, "block-a745004724d64e14a80cde8903f35b13")
-        main_block.click()
-                
-        time.sleep(0.2)
-
-        # Находим все toggle-блоки внутри
-        list_div = self.driver.find_element(By.CLASS_NAME, "notion-toggle__content")
-        
-        for toggle in list_div.find_elements(By.CLASS_NAME, "notion-toggle"):
-            try:
-                # Кликаем по summary, чтобы открыть toggle
-                summary = toggle.find_element(By.CLASS_NAME, "notion-toggle__summary")
-                self.driver.execute_script("arguments[0].scrollIntoView(true);", summary)
-                summary.click()
-                time.sleep(0.2)
-
-                city = summary.text.strip()
-                
-                # Контент с ссылками
-                content = toggle.find_element(By.CLASS_NAME, "notion-toggle__content")
-                links = content.find_elements(By.TAG_NAME, "a")
-                
-                for a in links:
-                    href = a.get_attribute("href")
-                    if href and "t.me" in href:
-                        results.append(
-                            TelegramChannel(
-                                city=city.replace("‣", "").replace("\n", "").strip(),
-                                name=a.text.strip(),
-                                url=href
+        driver = webdriver.Chrome(options=chrome_options)
+
+        try:
+            driver.get(url)
+            results = []
+
+            main_block = driver.find_element(By.ID, "block-" + self.root_block_id.replace("-", ""))
+            main_block.click()
+
+            time.sleep(0.2)
+
+            # Находим все toggle-блоки внутри
+            list_div = driver.find_element(By.CLASS_NAME, "notion-toggle__content")
+
+            for toggle in list_div.find_elements(By.CLASS_NAME, "notion-toggle"):
+                try:
+                    # Кликаем по summary, чтобы открыть toggle
+                    summary = toggle.find_element(By.CLASS_NAME, "notion-toggle__summary")
+                    driver.execute_script("arguments[0].scrollIntoView(true);", summary)
+                    summary.click()
+                    time.sleep(0.2)
+
+                    city = summary.text.strip()
+
+                    # Контент с ссылками
+                    content = toggle.find_element(By.CLASS_NAME, "notion-toggle__content")
+                    links = content.find_elements(By.TAG_NAME, "a")
+
+                    for a in links:
+                        href = a.get_attribute("href")
+                        if href and "t.me" in href:
+                            results.append(
+                                TelegramChannel(
+                                    city=city.replace("‣", "").replace("\n", "").strip(),
+                                    name=a.text.strip(),
+                                    url=href
+                                )
                             )
-                        )
-            except Exception as e:
-                print(f"Ошибка при обработке toggle: {e}")
-                continue
-        
-        self.driver.quit()
-        return Container(channels = results)
\ No newline at end of file
+                except Exception as e:
+                    print(f"Ошибка при обработке toggle: {e}")
+                    continue
+
+            return results
+        finally:
+            driver.quit()
@@ -1,11 +1,13 @@
 import os
 import json
-import aiofiles
+import asyncio
+from itertools import islice
 from datetime import datetime
 from dataclasses import is_dataclass, asdict
-from typing import Optional
+from typing import AsyncIterator, Iterable, List, Optional
 
-from models import Container
+from models import Container, TelegramChannel
+from snapshot_codec import CODECS, SnapshotCodec, channel_to_record, detect_codec, get_codec, iter_channels
 
 class DataclassJSONEncoder(json.JSONEncoder):
     """
@@ -20,9 +22,55 @@ class DataclassJSONEncoder(json.JSONEncoder):
             return o.isoformat()
         return super().default(o)
 
+class SnapshotWriter:
+    """
+    Пишет снепшот Container на диск по частям.
+
+    Каналы кодируются по одному в отдельном потоке и сразу дописываются в файл:
+    ни копии всего Container, ни одной огромной строки в памяти, event loop не блокируется.
+    Файл появляется атомарно при `close` (до этого запись идет во временный файл).
+    """
+
+    def __init__(self, file_path: str, codec: SnapshotCodec = CODECS["json"]):
+        self.file_path = file_path
+        self.codec = codec
+        self._tmp_path = file_path + ".tmp"
+        self._writer = None
+
+    def _write_sync(self, channels: list) -> None:
+        if self._writer is None:
+            self._writer = self.codec.writer(self._tmp_path)
+        for channel in channels:
+            self._writer.write(channel_to_record(channel))
+
+    def _close_sync(self) -> None:
+        if self._writer is None:
+            self._write_sync([])
+        self._writer.close()
+        os.replace(self._tmp_path, self.file_path)
+
+    async def write(self, channels: Iterable[TelegramChannel]) -> None:
+        """Дописывает каналы. Вызывать до того, как каналы изменит следующая стадия."""
+        await asyncio.to_thread(self._write_sync, list(channels))
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close_sync)
+
+
 class SessionManager:
-    def __init__(self, base_dir: str = "data/SessionResults"):
+    """
+    Управляет директориями сессий и снепшотами стадий.
+
+    Формат снепшотов задается `snapshot_format` (см. snapshot_codec.CODECS): по умолчанию
+    сжатый gzip JSON Lines (по записи на канал), "json" — прежний читаемый формат,
+    "jsonl.zst" и "msgpack" требуют пакетов zstandard / msgpack. При загрузке формат
+    определяется по содержимому файла, так что старые сессии читаются как раньше.
+    Экспорт в читаемый JSON: python -m snapshot_codec <снепшот> [<выходной файл>].
+    """
+
+    def __init__(self, base_dir: str = "data/SessionResults", snapshot_format: str = "jsonl.gz"):
         self.base_path = base_dir
+        self.codec = get_codec(snapshot_format)
         self.session_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.session_path = os.path.join(self.base_path, self.session_timestamp)
         os.makedirs(self.session_path, exist_ok=True)
@@ -53,27 +101,60 @@ class SessionManager:
             path = os.path.join(self.base_path, session_id)
             return path if os.path.isdir(path) else None
 
+    @staticmethod
+    def find_snapshot(session_path: str, service_name: str) -> Optional[str]:
+        """Путь к снепшоту сервиса в сессии (в любом из поддерживаемых форматов)."""
+        for codec in CODECS.values():
+            file_path = os.path.join(session_path, f"{service_name}_snapshot.{codec.extension}")
+            if os.path.exists(file_path):
+                return file_path
+        return None
+
     async def load_snapshot(self, session_path: str, service_name: str) -> Optional[Container]:
         """Загружает артефакт (снепшот) конкретного сервиса из указанной сессии."""
-        file_path = os.path.join(session_path, f"{service_name}_snapshot.json")
-        
-        if not os.path.exists(file_path):
+        file_path = self.find_snapshot(session_path, service_name)
+        if file_path is None:
             return None
-            
+
         try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                return Container.from_json(content)
+            channels = await asyncio.to_thread(lambda: list(iter_channels(file_path)))
+            return Container(channels=channels)
         except Exception as e:
             print(f"[ERROR] Failed to load snapshot {file_path}: {e}")
             return None
 
+    async def iter_snapshot(self, session_path: str, service_name: str, batch_size: int = 20) -> AsyncIterator[List[TelegramChannel]]:
+        """
+        Читает снепшот лениво: отдает каналы пачками по `batch_size`, не загружая файл целиком
+        (кроме формата "json", который разбирается за один раз).
+        """
+        file_path = self.find_snapshot(session_path, service_name)
+        if file_path is None:
+            return
+
+        codec = await asyncio.to_thread(detect_codec, file_path)
+        channels = iter_channels(file_path, codec)
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(islice(channels, batch_size)))
+                if not batch:
+                    return
+                yield batch
+        finally:
+            channels.close()
+
+    def open_snapshot(self, service_name: str) -> SnapshotWriter:
+        """Открывает снепшот в директории ТЕКУЩЕЙ сессии для записи по частям."""
+        return SnapshotWriter(
+            os.path.join(self.session_path, f"{service_name}_snapshot.{self.codec.extension}"), self.codec
+        )
+
     async def save_snapshot(self, service_name: str, data: Container):
-        """Сохраняет снепшот в директорию ТЕКУЩЕЙ сессии."""
-        filename = f"{service_name}_snapshot.json"
-        file_path = os.path.join(self.session_path, filename)
-        
-        json_data = json.dumps(data, indent=4, cls=DataclassJSONEncoder, ensure_ascii=False)
-        async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-            await f.write(json_data)
-        print(f"[INFO] Snapshot for '{service_name}' saved to {file_path}")
\ No newline at end of file
+        """
+        Сохраняет снепшот в директорию ТЕКУЩЕЙ сессии.
+        Кодирование идет в отдельном потоке; до завершения `data` изменять нельзя.
+        """
+        writer = self.open_snapshot(service_name)
+        await writer.write(data.channels)
+        await writer.close()
+        print(f"[INFO] Snapshot for '{service_name}' saved to {writer.file_path}")
@@ -0,0 +1,267 @@
+import os
+import sys
+import gzip
+import json
+import textwrap
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from models import Container, TelegramChannel, TelegramMessage
+
+
+# --- Записи каналов ---
+
+def channel_to_record(channel: TelegramChannel) -> Dict[str, Any]:
+    """
+    Канал -> словарь для сериализации. Порядок и формат полей те же, что у asdict +
+    DataclassJSONEncoder, но без глубокого копирования, которое делает asdict.
+    """
+    messages = None
+    if channel.messages is not None:
+        messages = [
+            {
+                "text": msg.text,
+                "sender": msg.sender,
+                "date": msg.date.isoformat() if msg.date else None,
+                "duplicates": msg.duplicates,
+            }
+            for msg in channel.messages
+        ]
+    return {"city": channel.city, "name": channel.name, "url": channel.url, "messages": messages}
+
+
+def channel_from_record(record: Dict[str, Any]) -> TelegramChannel:
+    messages = record.get("messages")
+    if messages is not None:
+        messages = [
+            TelegramMessage(
+                text=msg["text"],
+                sender=msg.get("sender"),
+                date=datetime.fromisoformat(msg["date"]) if msg.get("date") else None,
+                duplicates=msg.get("duplicates"),
+            )
+            for msg in messages
+        ]
+    return TelegramChannel(city=record["city"], name=record["name"], url=record["url"], messages=messages)
+
+
+# --- Кодеки ---
+
+class RecordWriter(ABC):
+    """Пишет записи каналов в файл одну за другой."""
+
+    @abstractmethod
+    def write(self, record: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class SnapshotCodec(ABC):
+    """Формат файла снепшота: последовательность записей каналов."""
+
+    name: str = ""
+    extension: str = ""
+
+    @abstractmethod
+    def writer(self, path: str) -> RecordWriter:
+        pass
+
+    @abstractmethod
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Записи каналов по одной, по мере чтения файла."""
+        pass
+
+
+class _JsonWriter(RecordWriter):
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write('{\n    "channels": [')
+        self._count = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        encoded = json.dumps(record, indent=4, ensure_ascii=False)
+        self._file.write(("," if self._count else "") + "\n" + textwrap.indent(encoded, " " * 8))
+        self._count += 1
+
+    def close(self) -> None:
+        self._file.write("\n    ]\n}" if self._count else "]\n}")
+        self._file.close()
+
+
+class JsonCodec(SnapshotCodec):
+    """
+    Читаемый JSON ({"channels": [...]} с отступами) — прежний формат снепшотов, для экспорта
+    и просмотра. Совпадает с json.dumps(container, indent=4); читается только целиком.
+    """
+
+    name = "json"
+    extension = "json"
+
+    def writer(self, path: str) -> RecordWriter:
+        return _JsonWriter(path)
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        yield from data.get("channels", [])
+
+
+class _LineWriter(RecordWriter):
+    def __init__(self, file: IO[str]):
+        self._file = file
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JsonlCodec(SnapshotCodec):
+    """JSON Lines: одна строка на канал, опционально сжатая (gzip или zstd)."""
+
+    def __init__(self, name: str, extension: str, opener: Callable[..., IO[str]]):
+        self.name = name
+        self.extension = extension
+        self._opener = opener
+
+    def writer(self, path: str) -> RecordWriter:
+        return _LineWriter(self._opener(path, "wt", encoding="utf-8"))
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        with self._opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _gzip_open(path: str, mode: str, encoding: str) -> IO[str]:
+    # уровень 3: почти втрое быстрее уровня 6 по умолчанию при файле на ~20% больше
+    return gzip.open(path, mode, compresslevel=3, encoding=encoding)
+
+
+def _zstd_open(path: str, mode: str, encoding: str) -> IO[str]:
+    if zstandard is None:
+        raise ImportError("The jsonl.zst snapshot format requires the 'zstandard' package")
+    return zstandard.open(path, mode, encoding=encoding)
+
+
+class _MsgpackWriter(RecordWriter):
+    def __init__(self, path: str):
+        self._file = open(path, "wb")
+        self._packer = msgpack.Packer()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(self._packer.pack(record))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class MsgpackCodec(SnapshotCodec):
+    """Поток msgpack-объектов, по одному на канал."""
+
+    name = "msgpack"
+    extension = "msgpack"
+
+    def writer(self, path: str) -> RecordWriter:
+        if msgpack is None:
+            raise ImportError("The msgpack snapshot format requires the 'msgpack' package")
+        return _MsgpackWriter(path)
+
+    def read(self, path: str) -> Iterator[Dict[str, Any]]:
+        if msgpack is None:
+            raise ImportError("The msgpack snapshot format requires the 'msgpack' package")
+        with open(path, "rb") as f:
+            yield from msgpack.Unpacker(f, raw=False)
+
+
+CODECS: Dict[str, SnapshotCodec] = {
+    codec.name: codec
+    for codec in (
+        JsonCodec(),
+        JsonlCodec("jsonl", "jsonl", open),
+        JsonlCodec("jsonl.gz", "jsonl.gz", _gzip_open),
+        JsonlCodec("jsonl.zst", "jsonl.zst", _zstd_open),
+        MsgpackCodec(),
+    )
+}
+
+
+def get_codec(name: str) -> SnapshotCodec:
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Unknown snapshot format: {name}. Expected one of {tuple(CODECS)}")
+    return codec
+
+
+def detect_codec(path: str) -> SnapshotCodec:
+    """Определяет формат снепшота по содержимому файла (а не по расширению)."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+        if not head:
+            # пустой снепшот (без каналов) — читается любым построчным кодеком
+            return CODECS["jsonl"]
+        if head.startswith(b"\x1f\x8b"):
+            return CODECS["jsonl.gz"]
+        if head == b"\x28\xb5\x2f\xfd":
+            return CODECS["jsonl.zst"]
+        if not head.lstrip().startswith(b"{"):
+            return CODECS["msgpack"]
+        f.seek(0)
+        first_line = f.readline()
+
+    # JSON Lines: первая строка — законченная запись канала; экспорт JSON начинается с "{" и переноса
+    try:
+        record = json.loads(first_line)
+    except ValueError:
+        return CODECS["json"]
+    return CODECS["jsonl"] if isinstance(record, dict) and "url" in record else CODECS["json"]
+
+
+def iter_channels(path: str, codec: Optional[SnapshotCodec] = None) -> Iterator[TelegramChannel]:
+    """Каналы снепшота по одному (формат определяется автоматически)."""
+    for record in (codec or detect_codec(path)).read(path):
+        yield channel_from_record(record)
+
+
+def read_container(path: str) -> Container:
+    return Container(channels=list(iter_channels(path)))
+
+
+def write_container(path: str, container: Container, codec: SnapshotCodec) -> None:
+    writer = codec.writer(path)
+    for channel in container.channels:
+        writer.write(channel_to_record(channel))
+    writer.close()
+
+
+if __name__ == "__main__":
+    # Экспорт/конвертация: python -m snapshot_codec <снепшот> [<выходной файл>] [<формат>]
+    if len(sys.argv) < 2:
+        print("Usage: python -m snapshot_codec <snapshot> [<output>] [<format>]")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    target_format = sys.argv[3] if len(sys.argv) > 3 else "json"
+    target = sys.argv[2] if len(sys.argv) > 2 else f"{source.split('_snapshot.')[0]}_snapshot.export.{get_codec(target_format).extension}"
+    if os.path.abspath(source) == os.path.abspath(target):
+        print("[ERROR] Output must differ from the source snapshot.")
+        sys.exit(1)
+
+    write_container(target, read_container(source), get_codec(target_format))
+    print(f"[INFO] {source} ({detect_codec(source).name}) exported to {target} ({target_format}).")
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import types
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from models import Container
+from services.base import Service
+from session_manager import SnapshotWriter
+from snapshot_codec import channel_to_record, get_codec, read_container
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class StageCache:
+    """
+    Контентно-адресуемый кэш результатов стадий пайплайна.
+
+    Ключ (fingerprint) — хэш от имени сервиса, его параметров, входного Container,
+    содержимого файлов-артефактов (модель, промты, справочники — см. Service.CACHE_*),
+    Service.CACHE_VERSION и исходного кода модуля сервиса вместе со всеми модулями
+    репозитория, которые он транзитивно импортирует (классификатор, LLMExecutor, utils...).
+    Любое изменение входа, конфигурации, модели или кода дает новый ключ, поэтому
+    устаревший результат не может быть переиспользован. Изменяемое состояние (SQLite-базы)
+    в ключ не входит: его хэш не отражает записи в -wal, а стадии после кэша сверяются с ним сами.
+    Кэш общий для всех сессий: `cache_dir/<service>/<fingerprint>.<расширение формата>`.
+
+    Размер ограничен: после каждой записи в каталоге сервиса остается не больше `max_entries`
+    записей не старше `max_age_days` (None — без ограничения). Возраст считается от последнего
+    использования — попадание в кэш обновляет mtime записи.
+    """
+
+    def __init__(self, cache_dir: str = "data/StageCache", snapshot_format: str = "jsonl.gz",
+                 max_entries: Optional[int] = 50, max_age_days: Optional[float] = 30):
+        self.cache_dir = cache_dir
+        self.codec = get_codec(snapshot_format)
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        # (путь, mtime, размер) -> sha256, чтобы не перечитывать большие модели в каждом запуске
+        self._file_hashes: Dict[Tuple[str, float, int], str] = {}
+
+    @staticmethod
+    def _resolve(path: str) -> Optional[str]:
+        """Путь к файлу: как есть (относительно cwd) или относительно корня репозитория."""
+        for candidate in (path, os.path.join(REPO_ROOT, path)):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def _file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+        if key not in self._file_hashes:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            self._file_hashes[key] = h.hexdigest()
+        return self._file_hashes[key]
+
+    @staticmethod
+    def _module_sources(service_cls: Type[Service]) -> List[str]:
+        """
+        Файлы модулей репозитория, от которых зависит сервис: его модуль и все модули,
+        на которые ссылаются глобальные имена (импорты), транзитивно. Сторонние пакеты не входят.
+        """
+        files = []
+        seen = set()
+        stack = [sys.modules.get(service_cls.__module__)]
+        while stack:
+            module = stack.pop()
+            if module is None or module.__name__ in seen:
+                continue
+            seen.add(module.__name__)
+
+            path = getattr(module, "__file__", None)
+            if not path:
+                continue
+            path = os.path.abspath(path)
+            if not path.startswith(REPO_ROOT + os.sep) or "site-packages" in path:
+                continue
+            files.append(path)
+
+            for value in list(vars(module).values()):
+                if isinstance(value, types.ModuleType):
+                    stack.append(value)
+                elif isinstance(getattr(value, "__module__", None), str):
+                    stack.append(sys.modules.get(value.__module__))
+        return files
+
+    def _fingerprint_sync(self, service_name: str, service_cls: Type[Service], params: Dict[str, Any], data: Container) -> str:
+        h = hashlib.sha256()
+
+        def part(label: str, value: str) -> None:
+            h.update(label.encode("utf-8") + b"\x00" + value.encode("utf-8") + b"\x00")
+
+        part("service", service_name)
+        part("version", str(service_cls.CACHE_VERSION))
+        part("params", json.dumps(params, sort_keys=True, ensure_ascii=False, default=str))
+        part("input", json.dumps([channel_to_record(c) for c in data.channels], sort_keys=True, ensure_ascii=False))
+
+        artifacts = [params[key] for key in service_cls.CACHE_ARTIFACT_PARAMS if params.get(key)]
+        artifacts += list(service_cls.CACHE_ARTIFACTS)
+        # код — по пути относительно репозитория, чтобы ключ не зависел от того, где лежит checkout
+        artifacts += [os.path.relpath(path, REPO_ROOT) for path in self._module_sources(service_cls)]
+
+        for artifact in sorted(set(artifacts)):
+            resolved = self._resolve(artifact)
+            part(f"artifact:{artifact}", self._file_hash(resolved) if resolved else "missing")
+
+        return h.hexdigest()
+
+    async def fingerprint(self, service_name: str, service_cls: Type[Service], params: Dict[str, Any], data: Container) -> str:
+        """Вычисляет ключ стадии в отдельном потоке (сериализация большого Container не блокирует event loop)."""
+        return await asyncio.to_thread(self._fingerprint_sync, service_name, service_cls, params, data)
+
+    def _path(self, service_name: str, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, service_name, f"{fingerprint}.{self.codec.extension}")
+
+    async def load(self, service_name: str, fingerprint: str) -> Optional[Container]:
+        file_path = self._path(service_name, fingerprint)
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            data = await asyncio.to_thread(read_container, file_path)
+        except Exception as e:
+            print(f"[ERROR] Failed to load stage cache entry {file_path}: {e}")
+            return None
+        # запись используется — при чистке она считается свежей
+        os.utime(file_path)
+        return data
+
+    async def save(self, service_name: str, fingerprint: str, data: Container) -> None:
+        file_path = self._path(service_name, fingerprint)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # запись по частям через временный файл: прерванная запись не оставит битую запись кэша
+        writer = SnapshotWriter(file_path, self.codec)
+        await writer.write(data.channels)
+        await writer.close()
+        removed = await asyncio.to_thread(self.prune, service_name)
+        if removed:
+            print(f"[INFO] Removed {removed} old stage cache entries of {service_name}.")
+
+    def prune(self, service_name: str) -> int:
+        """
+        Удаляет записи сервиса старше `max_age_days` и самые давно использованные сверх `max_entries`.
+        Возвращает число удаленных файлов.
+        """
+        directory = os.path.join(self.cache_dir, service_name)
+        suffix = f".{self.codec.extension}"
+        try:
+            entries = [
+                (entry.stat().st_mtime, entry.path)
+                for entry in os.scandir(directory)
+                if entry.is_file() and entry.name.endswith(suffix)
+            ]
+        except FileNotFoundError:
+            return 0
+
+        entries.sort(reverse=True)
+        keep = entries[:self.max_entries] if self.max_entries is not None else entries
+        if self.max_age_seconds is not None:
+            min_mtime = time.time() - self.max_age_seconds
+            keep = [entry for entry in keep if entry[0] >= min_mtime]
+
+        kept = {path for _, path in keep}
+        removed = 0
+        for _, path in entries:
+            if path not in kept:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
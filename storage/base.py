@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Sequence
+
+
+class SqliteStore:
+    """
+    Базовый класс для небольших персистентных хранилищ на SQLite.
+
+    Наследники задают схему в `SCHEMA`. Все методы синхронные и потокобезопасные —
+    из асинхронного кода их следует вызывать через `asyncio.to_thread`.
+    """
+
+    SCHEMA: str = ""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+
+    def _query(self, sql: str, args: Sequence[Any] = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def _execute(self, sql: str, args: Sequence[Any] = ()) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, args).rowcount
+
+    def _executemany(self, sql: str, rows: Iterable[Sequence[Any]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,92 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from storage.base import SqliteStore
+
+
+@dataclass
+class ChannelRecord:
+    url: str
+    peer_type: Optional[str]       # "channel" / "chat" / "user"
+    entity_id: Optional[int]
+    access_hash: Optional[int]
+    is_member: bool
+    failure: Optional[str]         # имя класса последней ошибки, например "InviteHashExpiredError"
+    failed_at: Optional[float]
+    updated_at: float
+
+
+class ChannelRegistryStore(SqliteStore):
+    """
+    Реестр каналов Telegram: URL -> разрешенная сущность (id + access_hash),
+    статус членства и причина последней неудачи.
+
+    Позволяет не вступать в канал и не вызывать `get_entity` заново для уже
+    известных каналов, а также не повторять каждый запуск попытки вступить
+    по мертвым инвайтам.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS channels (
+            url         TEXT    PRIMARY KEY,
+            peer_type   TEXT,
+            entity_id   INTEGER,
+            access_hash INTEGER,
+            is_member   INTEGER NOT NULL DEFAULT 0,
+            failure     TEXT,
+            failed_at   REAL,
+            updated_at  REAL    NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = "data/cache/tg_channels.sqlite"):
+        super().__init__(path)
+
+    def get(self, url: str) -> Optional[ChannelRecord]:
+        rows = self._query(
+            """
+            SELECT url, peer_type, entity_id, access_hash, is_member, failure, failed_at, updated_at
+            FROM channels WHERE url = ?
+            """,
+            (url,),
+        )
+        if not rows:
+            return None
+        url, peer_type, entity_id, access_hash, is_member, failure, failed_at, updated_at = rows[0]
+        return ChannelRecord(url, peer_type, entity_id, access_hash, bool(is_member), failure, failed_at, updated_at)
+
+    def mark_resolved(self, url: str, peer_type: str, entity_id: int, access_hash: Optional[int]) -> None:
+        """Канал разрешен и аккаунт в нем состоит — сбрасывает причину прошлой неудачи."""
+        self._execute(
+            """
+            INSERT INTO channels VALUES (?, ?, ?, ?, 1, NULL, NULL, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                peer_type = excluded.peer_type,
+                entity_id = excluded.entity_id,
+                access_hash = excluded.access_hash,
+                is_member = 1,
+                failure = NULL,
+                failed_at = NULL,
+                updated_at = excluded.updated_at
+            """,
+            (url, peer_type, entity_id, access_hash, time.time()),
+        )
+
+    def mark_failed(self, url: str, failure: str) -> None:
+        """Запоминает причину неудачи; разрешенная ранее сущность больше не считается надежной."""
+        now = time.time()
+        self._execute(
+            """
+            INSERT INTO channels VALUES (?, NULL, NULL, NULL, 0, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                is_member = 0,
+                failure = excluded.failure,
+                failed_at = excluded.failed_at,
+                updated_at = excluded.updated_at
+            """,
+            (url, failure, now, now),
+        )
+
+    def forget(self, url: str) -> None:
+        self._execute("DELETE FROM channels WHERE url = ?", (url,))
@@ -0,0 +1,65 @@
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from storage.base import SqliteStore
+
+
+class GeocodeCacheStore(SqliteStore):
+    """
+    Персистентный кэш геокодирования городов: (город, страна, язык) -> земля (state).
+
+    Статусы записи:
+      - found     — адрес найден, `state` заполнен;
+      - no_state  — адрес найден, но без земли;
+      - not_found — геокодер ничего не нашел.
+    Отрицательные результаты (no_state / not_found) живут `negative_ttl_days`,
+    найденные — `ttl_days`: названия земель не меняются, а пропуски геокодера могут исправить.
+    Ошибки сети не кэшируются.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS geocodes (
+            city       TEXT NOT NULL,
+            country    TEXT NOT NULL,
+            language   TEXT NOT NULL,
+            status     TEXT NOT NULL,
+            state      TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (city, country, language)
+        );
+    """
+
+    _CHUNK = 500
+
+    def __init__(self, path: str = "data/cache/geocode.sqlite", ttl_days: Optional[float] = 180,
+                 negative_ttl_days: Optional[float] = 7):
+        super().__init__(path)
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.negative_ttl_seconds = negative_ttl_days * 86400 if negative_ttl_days else None
+
+    def get_many(self, country: str, language: str, cities: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Возвращает {город: (status, state)} для известных и не просроченных городов."""
+        keys = list(dict.fromkeys(cities))
+        now = time.time()
+        found: Dict[str, Tuple[str, Optional[str]]] = {}
+
+        for i in range(0, len(keys), self._CHUNK):
+            chunk = keys[i:i + self._CHUNK]
+            rows = self._query(
+                f"""
+                SELECT city, status, state, updated_at FROM geocodes
+                WHERE country = ? AND language = ? AND city IN ({",".join("?" * len(chunk))})
+                """,
+                (country, language, *chunk),
+            )
+            for city, status, state, updated_at in rows:
+                ttl = self.ttl_seconds if status == "found" else self.negative_ttl_seconds
+                if ttl is None or now - updated_at <= ttl:
+                    found[city] = (status, state)
+        return found
+
+    def put(self, country: str, language: str, city: str, status: str, state: Optional[str]) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?)",
+            (city, country, language, status, state, time.time()),
+        )
@@ -0,0 +1,154 @@
+import sys
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from storage.base import SqliteStore
+
+
+class OutboxStore(SqliteStore):
+    """
+    Персистентная очередь исходящих публикаций Telegram.
+
+    Статусы записи:
+      - pending   — ждет отправки;
+      - sending   — запрос к Telegram начат, но результат не записан;
+      - sent      — опубликовано;
+      - failed    — исчерпаны попытки или ошибка не исправится повтором;
+      - uncertain — отправка прервалась (падение процесса, таймаут, сетевая ошибка), и неизвестно,
+                    дошло ли сообщение. Сами по себе они не отправляются повторно: их возвращает
+                    в очередь `requeue_uncertain` (параметр издателя или команда ниже), когда
+                    оператор убедился, что сообщения в канале нет, или дубликат допустим.
+
+    Вернуть uncertain-записи в очередь вручную:
+        python -m storage.outbox <путь к базе> <канал> [<старше, часов>]
+
+    Идемпотентность: (chat_id, dedup_key) уникальны, поэтому повторная постановка
+    той же публикации не создает дубликат, а уже отправленная не уходит снова.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id     TEXT    NOT NULL,
+            dedup_key   TEXT    NOT NULL,
+            payload     TEXT    NOT NULL,
+            source      TEXT,
+            status      TEXT    NOT NULL DEFAULT 'pending',
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            last_error  TEXT,
+            message_id  INTEGER,
+            created_at  REAL    NOT NULL,
+            updated_at  REAL    NOT NULL,
+            UNIQUE (chat_id, dedup_key)
+        );
+        CREATE INDEX IF NOT EXISTS outbox_status ON outbox (chat_id, status, id);
+    """
+
+    def __init__(self, path: str = "data/cache/tg_outbox.sqlite"):
+        super().__init__(path)
+
+    def enqueue(self, chat_id: str, items: Sequence[Tuple[str, str, Optional[str]]]) -> List[int]:
+        """
+        Ставит публикации (dedup_key, payload, source) в очередь и возвращает их id.
+        Уже известные записи не меняются, кроме окончательно упавших — они снова становятся pending.
+        """
+        now = time.time()
+        self._executemany(
+            """
+            INSERT INTO outbox (chat_id, dedup_key, payload, source, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, dedup_key) DO UPDATE SET
+                status = 'pending', attempts = 0, last_error = NULL, updated_at = excluded.updated_at
+            WHERE status = 'failed'
+            """,
+            [(chat_id, key, payload, source, now, now) for key, payload, source in items],
+        )
+        ids = []
+        for key, _, _ in items:
+            rows = self._query("SELECT id FROM outbox WHERE chat_id = ? AND dedup_key = ?", (chat_id, key))
+            ids.append(rows[0][0])
+        return ids
+
+    def recover(self, chat_id: str) -> int:
+        """Записи, оставшиеся в 'sending' после падения процесса, помечаются как uncertain."""
+        return self._execute(
+            """
+            UPDATE outbox SET status = 'uncertain', last_error = 'interrupted', updated_at = ?
+            WHERE chat_id = ? AND status = 'sending'
+            """,
+            (time.time(), chat_id),
+        )
+
+    def requeue_uncertain(self, chat_id: str, older_than: float = 0) -> int:
+        """Возвращает в pending uncertain-записи, не менявшиеся `older_than` секунд. Возвращает их число."""
+        return self._execute(
+            """
+            UPDATE outbox SET status = 'pending', updated_at = ?
+            WHERE chat_id = ? AND status = 'uncertain' AND updated_at <= ?
+            """,
+            (time.time(), chat_id, time.time() - older_than),
+        )
+
+    def pending(self, chat_id: str) -> List[Tuple[int, str, Optional[str]]]:
+        """Ожидающие отправки записи (id, payload, source) в порядке постановки."""
+        return self._query(
+            "SELECT id, payload, source FROM outbox WHERE chat_id = ? AND status = 'pending' ORDER BY id",
+            (chat_id,),
+        )
+
+    def unfinished_sources(self, chat_id: str) -> List[str]:
+        """
+        `source` записей, которые еще не отправлены и не упали окончательно (pending, sending, uncertain).
+        По ним издатель узнает объявления, уже стоящие в очереди с прошлых запусков.
+        """
+        rows = self._query(
+            """
+            SELECT source FROM outbox
+            WHERE chat_id = ? AND status IN ('pending', 'sending', 'uncertain') AND source IS NOT NULL
+            """,
+            (chat_id,),
+        )
+        return [source for (source,) in rows]
+
+    def _set_status(self, outbox_id: int, status: str, error: Optional[str] = None, message_id: Optional[int] = None) -> None:
+        self._execute(
+            "UPDATE outbox SET status = ?, last_error = ?, message_id = ?, updated_at = ? WHERE id = ?",
+            (status, error, message_id, time.time(), outbox_id),
+        )
+
+    def mark_sending(self, outbox_id: int) -> None:
+        self._set_status(outbox_id, "sending")
+
+    def mark_pending(self, outbox_id: int, error: Optional[str] = None) -> None:
+        """Возвращает запись в очередь, не расходуя попытку (например, после RetryAfter)."""
+        self._set_status(outbox_id, "pending", error)
+
+    def mark_sent(self, outbox_id: int, message_id: Optional[int]) -> None:
+        self._set_status(outbox_id, "sent", message_id=message_id)
+
+    def mark_uncertain(self, outbox_id: int, error: str) -> None:
+        self._set_status(outbox_id, "uncertain", error)
+
+    def mark_failed(self, outbox_id: int, error: str, max_attempts: int, permanent: bool = False) -> str:
+        """
+        Учитывает неудачную попытку: запись возвращается в pending, пока не исчерпано
+        `max_attempts` попыток (или сразу становится failed, если `permanent`). Возвращает новый статус.
+        """
+        with self._lock, self._conn:
+            attempts = self._conn.execute("SELECT attempts FROM outbox WHERE id = ?", (outbox_id,)).fetchone()[0] + 1
+            status = "failed" if permanent or attempts >= max_attempts else "pending"
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, error, time.time(), outbox_id),
+            )
+        return status
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m storage.outbox <outbox.sqlite> <chat_id> [<older_than_hours>]")
+        sys.exit(1)
+
+    hours = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    requeued = OutboxStore(sys.argv[1]).requeue_uncertain(sys.argv[2], hours * 3600)
+    print(f"[INFO] {requeued} uncertain messages of {sys.argv[2]} returned to the queue.")
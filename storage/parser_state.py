@@ -0,0 +1,95 @@
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from models import TelegramMessage
+from storage.base import SqliteStore
+
+
+def _utc_iso(dt: datetime) -> str:
+    """ISO-строка в UTC, чтобы даты сравнивались корректно как строки (naive = локальное время)."""
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+class ParserStateStore(SqliteStore):
+    """
+    Состояние инкрементального парсинга Telegram.
+
+    Для каждого канала (ключ — id разрешенной сущности Telegram) хранит
+    high-water mark — id последнего просмотренного сообщения, — и окно ранее
+    найденных сообщений, чтобы следующие стадии могли получать полный период
+    без повторной загрузки истории.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS channel_state (
+            entity_id       INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            updated_at      REAL    NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS retained_messages (
+            entity_id  INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            date       TEXT,
+            sender     TEXT,
+            text       TEXT    NOT NULL,
+            PRIMARY KEY (entity_id, message_id)
+        );
+        CREATE INDEX IF NOT EXISTS retained_messages_date ON retained_messages (entity_id, date);
+    """
+
+    def __init__(self, path: str = "data/cache/tg_parser_state.sqlite"):
+        super().__init__(path)
+
+    def get_high_water_mark(self, entity_id: int) -> Optional[int]:
+        rows = self._query("SELECT last_message_id FROM channel_state WHERE entity_id = ?", (entity_id,))
+        return rows[0][0] if rows else None
+
+    def load_retained(self, entity_id: int, since: datetime, up_to_id: Optional[int] = None) -> List[TelegramMessage]:
+        """
+        Сообщения канала, сохраненные в прошлых запусках и не старше `since`.
+        `up_to_id` — только сообщения не новее high-water mark: более новые будут загружены заново.
+        """
+        rows = self._query(
+            """
+            SELECT text, sender, date FROM retained_messages
+            WHERE entity_id = ? AND date >= ? AND message_id <= ?
+            ORDER BY message_id
+            """,
+            (entity_id, _utc_iso(since), up_to_id if up_to_id is not None else 2 ** 63 - 1),
+        )
+        return [
+            TelegramMessage(text=text, sender=sender, date=datetime.fromisoformat(date) if date else None)
+            for text, sender, date in rows
+        ]
+
+    def retain_messages(self, entity_id: int, messages: List[Tuple[int, TelegramMessage]]) -> None:
+        """
+        Сохраняет сообщения канала в окне, не трогая high-water mark.
+        Так пишет режим реального времени: сообщения между прошлым обходом и подпиской
+        он не видел, поэтому сдвигать mark по ним нельзя.
+        """
+        self._executemany(
+            "INSERT OR REPLACE INTO retained_messages VALUES (?, ?, ?, ?, ?)",
+            [
+                (entity_id, msg_id, _utc_iso(msg.date) if msg.date else None, msg.sender, msg.text)
+                for msg_id, msg in messages
+            ],
+        )
+
+    def save_channel(self, entity_id: int, last_message_id: int, messages: List[Tuple[int, TelegramMessage]]) -> None:
+        """Сохраняет новые сообщения канала и сдвигает high-water mark."""
+        self.retain_messages(entity_id, messages)
+        self._execute(
+            """
+            INSERT INTO channel_state VALUES (?, ?, ?)
+            ON CONFLICT(entity_id) DO UPDATE SET
+                last_message_id = MAX(last_message_id, excluded.last_message_id),
+                updated_at = excluded.updated_at
+            """,
+            (entity_id, last_message_id, time.time()),
+        )
+
+    def prune(self, before: datetime) -> int:
+        """Удаляет сообщения старше окна хранения."""
+        return self._execute("DELETE FROM retained_messages WHERE date < ?", (_utc_iso(before),))
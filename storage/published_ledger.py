@@ -0,0 +1,70 @@
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from storage.base import SqliteStore
+from utils import normalize_text, text_hash
+
+
+def ad_fingerprint(channel_url: str, sender: Optional[str], text: str) -> str:
+    """Отпечаток объявления: канал-источник + отправитель + хэш нормализованного текста."""
+    return text_hash(channel_url, sender or "", normalize_text(text))
+
+
+class PublishedLedgerStore(SqliteStore):
+    """
+    Журнал опубликованных объявлений между запусками.
+
+    Окно парсинга соседних запусков перекрывается, поэтому одно и то же объявление
+    приходит несколько дней подряд. Журнал хранит отпечатки (`ad_fingerprint`)
+    уже опубликованных объявлений; записи старше `ttl_days` не учитываются и вычищаются.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS published (
+            fingerprint  TEXT PRIMARY KEY,
+            channel_url  TEXT NOT NULL,
+            sender       TEXT,
+            published_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS published_at ON published (published_at);
+    """
+
+    _CHUNK = 500
+
+    def __init__(self, path: str = "data/cache/tg_published.sqlite", ttl_days: Optional[float] = 30):
+        super().__init__(path)
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+
+    def _min_published_at(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds else 0.0
+
+    def contains_many(self, fingerprints: Iterable[str]) -> Set[str]:
+        """Возвращает отпечатки, которые уже опубликованы и не просрочены."""
+        keys = list(dict.fromkeys(fingerprints))
+        found: Set[str] = set()
+
+        for i in range(0, len(keys), self._CHUNK):
+            chunk = keys[i:i + self._CHUNK]
+            rows = self._query(
+                f"""
+                SELECT fingerprint FROM published
+                WHERE published_at >= ? AND fingerprint IN ({",".join("?" * len(chunk))})
+                """,
+                (self._min_published_at(), *chunk),
+            )
+            found.update(fp for fp, in rows)
+        return found
+
+    def record_many(self, entries: Dict[str, tuple]) -> None:
+        """Записывает опубликованные объявления {fingerprint: (channel_url, sender)}."""
+        now = time.time()
+        self._executemany(
+            "INSERT OR REPLACE INTO published VALUES (?, ?, ?, ?)",
+            [(fp, url, sender, now) for fp, (url, sender) in entries.items()],
+        )
+
+    def prune(self) -> int:
+        """Удаляет просроченные записи."""
+        if not self.ttl_seconds:
+            return 0
+        return self._execute("DELETE FROM published WHERE published_at < ?", (self._min_published_at(),))
@@ -0,0 +1,46 @@
+import time
+from typing import Dict, Iterable, Optional
+
+from storage.base import SqliteStore
+
+
+class SenderStore(SqliteStore):
+    """
+    Персистентный кэш отображаемых имен отправителей Telegram: sender_id -> "@username" / телефон / "Unknown".
+    Записи старше `ttl_days` считаются устаревшими (username может измениться).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS senders (
+            sender_id  INTEGER PRIMARY KEY,
+            display    TEXT    NOT NULL,
+            updated_at REAL    NOT NULL
+        );
+    """
+
+    _CHUNK = 500
+
+    def __init__(self, path: str = "data/cache/tg_senders.sqlite", ttl_days: Optional[float] = 7):
+        super().__init__(path)
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+
+    def get_many(self, sender_ids: Iterable[int]) -> Dict[int, str]:
+        ids = list(dict.fromkeys(sender_ids))
+        min_updated = time.time() - self.ttl_seconds if self.ttl_seconds else 0.0
+        found: Dict[int, str] = {}
+
+        for i in range(0, len(ids), self._CHUNK):
+            chunk = ids[i:i + self._CHUNK]
+            rows = self._query(
+                f"SELECT sender_id, display FROM senders WHERE updated_at >= ? AND sender_id IN ({','.join('?' * len(chunk))})",
+                (min_updated, *chunk),
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, senders: Dict[int, str]) -> None:
+        now = time.time()
+        self._executemany(
+            "INSERT OR REPLACE INTO senders VALUES (?, ?, ?)",
+            [(sender_id, display, now) for sender_id, display in senders.items()],
+        )
@@ -0,0 +1,73 @@
+import time
+from typing import Dict, Iterable, Optional
+
+from storage.base import SqliteStore
+
+
+class VerdictStore(SqliteStore):
+    """
+    Персистентный кэш вердиктов LLM.
+
+    Ключ: (prompt_id, prompt_version, model, text_hash). Версия промта — хэш
+    его текста, поэтому изменение файла промтов автоматически делает старые
+    вердикты недействительными (`invalidate_stale` удаляет их из базы).
+    Записи старше `ttl_days` не возвращаются и вычищаются.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS verdicts (
+            prompt_id      TEXT    NOT NULL,
+            prompt_version TEXT    NOT NULL,
+            model          TEXT    NOT NULL,
+            text_hash      TEXT    NOT NULL,
+            verdict        INTEGER NOT NULL,
+            created_at     REAL    NOT NULL,
+            PRIMARY KEY (prompt_id, prompt_version, model, text_hash)
+        );
+    """
+
+    # ограничение SQLite на число параметров в одном запросе
+    _CHUNK = 500
+
+    def __init__(self, path: str = "data/cache/llm_verdicts.sqlite", ttl_days: Optional[float] = 30):
+        super().__init__(path)
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+
+    def _min_created_at(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds else 0.0
+
+    def get_many(self, prompt_id: str, prompt_version: str, model: str, text_hashes: Iterable[str]) -> Dict[str, int]:
+        """Возвращает {text_hash: verdict} для известных и не просроченных текстов."""
+        hashes = list(dict.fromkeys(text_hashes))
+        found: Dict[str, int] = {}
+
+        for i in range(0, len(hashes), self._CHUNK):
+            chunk = hashes[i:i + self._CHUNK]
+            rows = self._query(
+                f"""
+                SELECT text_hash, verdict FROM verdicts
+                WHERE prompt_id = ? AND prompt_version = ? AND model = ?
+                  AND created_at >= ? AND text_hash IN ({",".join("?" * len(chunk))})
+                """,
+                (prompt_id, prompt_version, model, self._min_created_at(), *chunk),
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, prompt_id: str, prompt_version: str, model: str, verdicts: Dict[str, int]) -> None:
+        """Сохраняет вердикты {text_hash: verdict}."""
+        now = time.time()
+        self._executemany(
+            "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)",
+            [(prompt_id, prompt_version, model, h, int(v), now) for h, v in verdicts.items()],
+        )
+
+    def invalidate_stale(self, prompt_id: str, prompt_version: str) -> int:
+        """Удаляет вердикты других версий промта и просроченные записи. Возвращает число удаленных строк."""
+        removed = self._execute(
+            "DELETE FROM verdicts WHERE prompt_id = ? AND prompt_version != ?",
+            (prompt_id, prompt_version),
+        )
+        if self.ttl_seconds:
+            removed += self._execute("DELETE FROM verdicts WHERE created_at < ?", (self._min_created_at(),))
+        return removed
@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from models import Container, TelegramChannel
+
+
+_END = object()
+
+
+def count_messages(container: Container) -> int:
+    return sum(len(channel.messages or []) for channel in container.channels)
+
+
+class ChunkStream:
+    """
+    Ограниченная очередь чанков между двумя стадиями потокового пайплайна.
+
+    Чанк — Container с частью каналов; каждый канал проходит через стадию ровно в одном чанке.
+    `put` ждет, пока в очереди освободится место: медленная стадия притормаживает быструю
+    (backpressure), и между стадиями в памяти не больше `maxsize` чанков.
+    """
+
+    def __init__(self, maxsize: int = 16, batch_messages: Optional[int] = None):
+        """
+        :param maxsize: сколько чанков может ждать в очереди
+        :param batch_messages: размер батча для `batches` (перекрывает значение по умолчанию сервиса)
+        """
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._closed = False
+        self.batch_messages = batch_messages
+
+    async def put(self, chunk: Container) -> None:
+        await self._queue.put(chunk)
+
+    async def close(self) -> None:
+        """Сообщает потребителю, что чанков больше не будет."""
+        await self._queue.put(_END)
+
+    def __aiter__(self) -> "ChunkStream":
+        return self
+
+    async def __anext__(self) -> Container:
+        if self._closed:
+            raise StopAsyncIteration
+        chunk = await self._queue.get()
+        if chunk is _END:
+            self._closed = True
+            raise StopAsyncIteration
+        return chunk
+
+    async def batches(self, max_messages: int) -> AsyncIterator[Container]:
+        """
+        Объединяет чанки в батчи: ждет хотя бы один чанк и добирает уже готовые,
+        пока в батче меньше `max_messages` сообщений. Быстрый источник дает полные батчи,
+        медленный — маленькие, но без ожидания.
+        """
+        limit = self.batch_messages or max_messages
+        async for chunk in self:
+            channels: List[TelegramChannel] = list(chunk.channels)
+            size = count_messages(chunk)
+            while size < limit:
+                try:
+                    chunk = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if chunk is _END:
+                    self._closed = True
+                    break
+                channels.extend(chunk.channels)
+                size += count_messages(chunk)
+            yield Container(channels=channels)
+
+    async def collect(self) -> Container:
+        """Дожидается конца потока и возвращает все каналы одним Container."""
+        channels: List[TelegramChannel] = []
+        async for chunk in self:
+            channels.extend(chunk.channels)
+        return Container(channels=channels)
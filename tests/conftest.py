@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# модули проекта лежат в корне репозитория (без пакета)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_parser(tmp_path):
+    """Фабрика TgParserService с фейковым клиентом; сеть и реестр каналов не используются."""
+    from services.tg.parser_service import TgParserService
+
+    def factory(client, **kwargs):
+        options = dict(sender_cache_path=None, channel_registry_path=None, keywords=["квартир"])
+        options.update(kwargs)
+        service = TgParserService(1, "hash", "", 7, session_name=str(tmp_path / "session"), **options)
+        service.client = client
+        return service
+
+    return factory
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from telethon import types
+from telethon.errors.rpcerrorlist import ChannelPrivateError, UsernameNotOccupiedError
+
+from models import Container, TelegramChannel
+from services.tg.parser_service import ChannelUnavailableError
+from storage.channel_registry import ChannelRegistryStore
+from tg_fakes import FakeTelegramClient, fake_message
+
+URL = "https://t.me/chan_101"
+
+
+class FlakyTelegramClient(FakeTelegramClient):
+    """Клиент, который отвечает заданными ошибками на вступление и чтение истории."""
+
+    def __init__(self, *args, join_error=None, iter_errors=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.join_error = join_error
+        self.iter_errors = list(iter_errors)
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        await super().__call__(request)
+        if self.join_error is not None:
+            raise self.join_error
+
+    async def iter_messages(self, entity, offset_date=None, reverse=False, min_id=0):
+        if self.iter_errors:
+            raise self.iter_errors.pop(0)
+        async for msg in super().iter_messages(entity, offset_date, reverse, min_id):
+            yield msg
+
+
+def channel_lookups(client):
+    """get_entity по URL канала (без пакетных запросов отправителей)."""
+    return [what for what in client.entity_lookups if isinstance(what, str)]
+
+
+def channel():
+    return TelegramChannel(city="A", name="chan", url=URL, messages=None)
+
+
+@pytest.fixture
+def registry_path(tmp_path):
+    return str(tmp_path / "channels.sqlite")
+
+
+def test_known_channels_skip_join_and_get_entity(make_parser, registry_path):
+    client = FakeTelegramClient(history={101: [fake_message(1, "квартира")]})
+    parser = make_parser(client, channel_registry_path=registry_path)
+
+    asyncio.run(parser.run(Container(channels=[channel()])))
+    joins, lookups = len(client.requests), len(channel_lookups(client))
+    second = asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert (joins, lookups) == (1, 1)
+    assert len(client.requests) == 1 and len(channel_lookups(client)) == 1
+    assert [m.text for m in second.channels[0].messages] == ["квартира"]
+    assert parser.channels.get(URL).entity_id == 101
+
+
+def test_dead_channels_are_skipped_until_retry(make_parser, registry_path):
+    client = FlakyTelegramClient(join_error=UsernameNotOccupiedError(request=None))
+    parser = make_parser(client, channel_registry_path=registry_path)
+
+    with pytest.raises(ChannelUnavailableError):
+        asyncio.run(parser._resolve_channel(channel()))
+    with pytest.raises(ChannelUnavailableError, match="cached"):
+        asyncio.run(parser._resolve_channel(channel()))
+    assert len(client.requests) == 1
+
+    parser.channels._execute("UPDATE channels SET failed_at = failed_at - 8 * 86400")
+    client.join_error = None
+    entity = asyncio.run(parser._resolve_channel(channel()))
+
+    assert entity.channel_id == 101
+    assert parser.channels.get(URL).failure is None
+
+
+def test_stale_cached_peer_is_resolved_again(make_parser, registry_path):
+    client = FlakyTelegramClient(history={101: [fake_message(1, "квартира")]}, iter_errors=[ChannelPrivateError(request=None)])
+    parser = make_parser(client, channel_registry_path=registry_path)
+    parser.channels.mark_resolved(URL, "channel", 101, 999)
+
+    result = asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert [m.text for m in result.channels[0].messages] == ["квартира"]
+    assert channel_lookups(client) == [URL]
+    assert parser.channels.get(URL).access_hash == 1
+
+
+def test_other_errors_do_not_trigger_re_resolution(make_parser, registry_path):
+    client = FlakyTelegramClient(iter_errors=[ValueError("bug")])
+    parser = make_parser(client, channel_registry_path=registry_path)
+    parser.channels.mark_resolved(URL, "channel", 101, 999)
+
+    result = asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert result.channels[0].messages == []
+    assert parser.metrics["channels_failed"] == 1
+    assert channel_lookups(client) == []
+
+
+def test_registry_records_round_trip(registry_path):
+    registry = ChannelRegistryStore(registry_path)
+
+    registry.mark_resolved(URL, "channel", 101, 5)
+    registry.mark_failed(URL, "ChannelPrivateError")
+    record = registry.get(URL)
+
+    assert (record.entity_id, record.is_member, record.failure) == (101, False, "ChannelPrivateError")
+    registry.forget(URL)
+    assert registry.get(URL) is None
+
+
+def test_cached_peer_types(make_parser, registry_path):
+    parser = make_parser(FakeTelegramClient(), channel_registry_path=registry_path)
+    parser.channels.mark_resolved("https://t.me/chat", "chat", 7, None)
+    parser.channels.mark_resolved("https://t.me/user", "user", 8, 3)
+
+    chat = asyncio.run(parser._resolve_channel(TelegramChannel(city="A", name="c", url="https://t.me/chat")))
+    user = asyncio.run(parser._resolve_channel(TelegramChannel(city="A", name="u", url="https://t.me/user")))
+
+    assert chat == types.InputPeerChat(7)
+    assert user == types.InputPeerUser(8, 3)
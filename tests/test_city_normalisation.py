@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from models import Container, TelegramChannel
+from services.web.filter_service import WebFilterService
+from services.web.gazetteer import clean_city_name
+
+
+class CountingGeolocator:
+    def __init__(self, states):
+        self.states = states
+        self.queries = []
+
+    def geocode(self, query, addressdetails=True, language=None):
+        self.queries.append(query)
+        return SimpleNamespace(raw={"address": {"state": self.states[query]}})
+
+
+@pytest.mark.parametrize("raw, cleaned", [
+    ("‣ Nürnberg ,", "Nürnberg"),
+    ("• Augsburg\n", "Augsburg"),
+    ("  Bad   Tölz  ", "Bad Tölz"),
+    ("«Fürth»", "Fürth"),
+    ("Nürnberg", "Nürnberg"),  # NFD -> NFC
+])
+def test_clean_city_name(raw, cleaned):
+    assert clean_city_name(raw) == cleaned
+
+
+def test_spellings_of_one_city_are_looked_up_once():
+    service = WebFilterService("key", strategy="geo", verdict_cache_path=None, geocode_cache_path=None)
+    service.geolocator = CountingGeolocator({"Nürnberg, Germany": "Bayern", "Kleinstadt, Germany": "Hessen"})
+    spellings = ["Нюрнберг", "Nürnberg ", "Nuremberg", "‣ Nürnberg", "NURNBERG", "Kleinstadt"]
+    container = Container(channels=[
+        TelegramChannel(city=city, name=str(i), url=f"https://t.me/{i}") for i, city in enumerate(spellings)
+    ])
+
+    result = asyncio.run(service.run(container))
+
+    assert sorted(service.geolocator.queries) == ["Kleinstadt, Germany", "Nürnberg, Germany"]
+    assert [c.city for c in result.channels] == spellings[:5]
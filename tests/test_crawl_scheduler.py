@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from telethon.errors.rpcerrorlist import FloodWaitError
+
+from services.tg.crawl_scheduler import CrawlScheduler, FloodWaitGate
+
+
+def test_run_keeps_input_order_and_returns_errors():
+    async def worker(item):
+        if item == "bad":
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.01 * (3 - len(item)))
+        return item.upper()
+
+    results = asyncio.run(CrawlScheduler(max_concurrency=3).run(["a", "bb", "bad"], worker))
+
+    assert results[:2] == ["A", "BB"]
+    assert isinstance(results[2], RuntimeError)
+
+
+def test_run_respects_concurrency():
+    active = peak = 0
+
+    async def worker(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return item
+
+    assert asyncio.run(CrawlScheduler(max_concurrency=2).run(list(range(7)), worker)) == list(range(7))
+    assert peak == 2
+
+
+def test_flood_wait_pauses_all_workers_and_retries():
+    attempts = {"a": 0, "b": 0}
+    started = {}
+
+    async def worker(item):
+        attempts[item] += 1
+        if item == "a" and attempts[item] == 1:
+            raise FloodWaitError(request=None, capture=0)
+        if item == "b":
+            await asyncio.sleep(0.05)  # стартует после паузы, которую включил "a"
+        started.setdefault(item, time.monotonic())
+        return item
+
+    async def scenario():
+        scheduler = CrawlScheduler(max_concurrency=1)
+        t0 = time.monotonic()
+        return await scheduler.run(["a", "b"], worker), scheduler.gate, t0
+
+    results, gate, t0 = asyncio.run(scenario())
+
+    assert results == ["a", "b"]
+    assert attempts == {"a": 2, "b": 1}
+    assert started["b"] - t0 >= 1  # FloodWait 0s + 1s запаса
+    assert 0.9 <= gate.total_wait <= 1.1
+
+
+def test_flood_wait_gives_up_after_max_attempts():
+    async def worker(item):
+        raise FloodWaitError(request=None, capture=0)
+
+    gate = FloodWaitGate()
+    gate.trigger = lambda seconds: None  # без реальной паузы
+
+    [result] = asyncio.run(CrawlScheduler(max_attempts=2, gate=gate).run(["a"], worker))
+
+    assert isinstance(result, FloodWaitError)
+
+
+def test_gate_counts_overlapping_waits_once():
+    gate = FloodWaitGate()
+
+    gate.trigger(10)
+    gate.trigger(5)
+
+    assert 9.9 <= gate.total_wait <= 10
+
+
+def test_parser_lets_telethon_sleep_through_short_flood_waits(tmp_path):
+    from services.tg.parser_service import TgParserService
+
+    parser = TgParserService(
+        1, "hash", "", 7, session_name=str(tmp_path / "session"),
+        sender_cache_path=None, channel_registry_path=None, flood_sleep_threshold=15,
+    )
+
+    assert parser.client.flood_sleep_threshold == 15
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from models import Container, TelegramChannel, TelegramMessage
+from services.tg.dedup_service import TgDedupService
+from streaming import ChunkStream
+
+AD = "Сдаю двухкомнатную квартиру в центре, 60 м², тепло 850 евро, свободна с 1 марта, без животных"
+OTHER = "Ищу комнату в районе вокзала на длительный срок, бюджет до 500 евро, некурящий студент"
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def channel(url: str, *texts: str, minutes: int = 0) -> TelegramChannel:
+    return TelegramChannel(city="A", name=url, url=url, messages=[
+        TelegramMessage(text=text, date=START + timedelta(minutes=minutes + i)) for i, text in enumerate(texts)
+    ])
+
+
+def test_near_duplicates_collapse_to_earliest_copy():
+    container = Container(channels=[
+        channel("late", AD + "!", minutes=10),
+        channel("early", AD, OTHER),
+    ])
+
+    result = asyncio.run(TgDedupService().run(container))
+
+    late, early = result.channels
+    assert late.messages == []
+    assert [m.text for m in early.messages] == [AD, OTHER]
+    assert early.messages[0].duplicates == ["late"]
+
+
+def test_distinct_texts_are_kept():
+    result = asyncio.run(TgDedupService().run(Container(channels=[channel("a", AD), channel("b", OTHER)])))
+
+    assert [len(c.messages) for c in result.channels] == [1, 1]
+
+
+def test_texts_shorter_than_a_shingle_are_never_merged():
+    container = Container(channels=[channel("a", "🔥🔥", "!!!"), channel("b", "", "ok")])
+
+    result = asyncio.run(TgDedupService().run(container))
+
+    assert [len(c.messages) for c in result.channels] == [2, 2]
+
+
+def test_cluster_groups_near_duplicates_only():
+    service = TgDedupService()
+
+    clusters = service._cluster([AD, OTHER, AD.replace("850", "860"), "🔥", ""])
+
+    assert sorted(map(sorted, clusters)) == [[0, 2], [1], [3], [4]]
+
+
+def sample_channels():
+    return [
+        channel("late", AD + "!", OTHER, minutes=30),
+        channel("short", "🔥", "ok", minutes=5),
+        channel("early", AD, minutes=0),
+        channel("mid", OTHER.replace("500", "550"), AD.replace("850", "860"), minutes=10),
+    ]
+
+
+def snapshot(channels):
+    return [(c.url, [(m.text, m.duplicates) for m in c.messages]) for c in channels]
+
+
+def test_stream_result_equals_batch_result():
+    # копии приходят раньше самой ранней публикации и после того, как она уже пришла
+    async def stream_run():
+        stream = ChunkStream()
+        for ch in sample_channels():
+            await stream.put(Container(channels=[ch]))
+        await stream.close()
+        return [c async for chunk in TgDedupService().run_stream(stream) for c in chunk.channels]
+
+    batch = asyncio.run(TgDedupService().run(Container(channels=sample_channels())))
+    streamed = asyncio.run(stream_run())
+
+    assert snapshot(streamed) == snapshot(batch.channels)
+    early = next(c for c in streamed if c.url == "early")
+    assert early.messages[0].duplicates == ["late", "mid"]
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from services.tg.classifier.message_processor import FEATURE_COLUMNS, FeatureExtractor
+
+TEXTS = [
+    "Сдаю квартиру 2 комнаты, 650€ тепло, тел +49 170 1234567",
+    "СДАЮ КВАРТИРУ В ЦЕНТРЕ, ДЖОБЦЕНТР ОПЛАЧИВАЕТ",
+    "Ищу комнату на месяц?",
+    "ЗДАЮ КІМНАТУ, ЗВІЛЬНИЛАСЬ",
+    "Nachmieter für WOHNUNG gesucht, KOSTENÜBERNAHME vom Jobcenter möglich",
+    "ZWISCHENMIETE bis 3.5., WG-Zimmer frei",
+    "Office / GARAGE for rent, business only",
+    "İstanbul'dan arkadaşım ODA arıyor",  # длина меняется при lower()
+    "ẞ STRASSE 12",
+    "",
+    "x" * 1200,
+]
+
+
+def reference_row(extractor: FeatureExtractor, text: str) -> np.ndarray:
+    """Исходная логика: регистронезависимые паттерны по оригинальному тексту."""
+    row = np.zeros(len(FEATURE_COLUMNS), dtype=np.int32)
+    for name, patterns in extractor._re_groups.items():
+        row[FEATURE_COLUMNS.index(name)] = int(any(p.search(text) for p in patterns))
+    row[FEATURE_COLUMNS.index("price")] = int(bool(extractor._price_re.search(text)))
+    row[FEATURE_COLUMNS.index("phone")] = int(bool(extractor._phone_re.search(text)))
+    row[FEATURE_COLUMNS.index("question")] = int(bool(extractor._question_re.search(text)))
+    row[FEATURE_COLUMNS.index("len_short")] = int(len(text) < 50)
+    row[FEATURE_COLUMNS.index("len_long")] = int(len(text) > 1000)
+    row[FEATURE_COLUMNS.index("length_val")] = len(text)
+    return row
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return FeatureExtractor()
+
+
+def test_batch_matches_case_insensitive_reference(extractor):
+    matrix = extractor.extract_batch(TEXTS)
+
+    assert matrix.dtype == np.int32
+    assert matrix.shape == (len(TEXTS), len(FEATURE_COLUMNS))
+    for text, row in zip(TEXTS, matrix):
+        assert row.tolist() == reference_row(extractor, text).tolist(), text
+
+
+def test_extract_matches_batch_row(extractor):
+    matrix = extractor.extract_batch(TEXTS)
+
+    for text, row in zip(TEXTS, matrix):
+        assert list(extractor.extract(text).values()) == row.tolist()
+        assert list(extractor.extract(text)) == list(FEATURE_COLUMNS)
+
+
+def test_uppercase_text_gets_same_features(extractor):
+    text = "Сдаю квартиру, ищу обмен"
+
+    assert extractor.extract(text.upper())["offer_verb"] == extractor.extract(text)["offer_verb"] == 1
+    assert extractor.extract(text.upper())["is_swap"] == 1
+
+
+def test_parallel_batch_matches_serial(extractor):
+    texts = TEXTS * 5
+
+    serial = extractor.extract_batch(texts)
+    parallel = extractor.extract_batch(texts, n_jobs=2, chunk_size=10)
+
+    assert np.array_equal(serial, parallel)
+
+
+def test_empty_batch(extractor):
+    assert extractor.extract_batch([]).shape == (0, len(FEATURE_COLUMNS))
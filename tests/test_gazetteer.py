@@ -0,0 +1,80 @@
+import pytest
+
+from services.web.filter_service import WebFilterService
+from services.web.gazetteer import Gazetteer, fold_name
+
+FUZZY_MIN_CONFIDENCE = .92  # порог WebFilterService по умолчанию
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer.load()
+
+
+@pytest.mark.parametrize("query, name", [
+    ("München", "München"),
+    ("Munich", "München"),
+    ("Мюнхен", "München"),
+    ("Вюрцбург", "Würzburg"),
+    ("Frankfurt", "Frankfurt am Main"),
+])
+def test_exact_names_and_aliases(gazetteer, query, name):
+    match = gazetteer.resolve(query)
+
+    assert (match.name, match.exact, match.confidence) == (name, True, 1.0)
+
+
+@pytest.mark.parametrize("query", ["Nurnberg", "NÜRNBERG", "nürnberg ", "Wurzburg"])
+def test_umlaut_and_case_folding_is_exact(gazetteer, query):
+    match = gazetteer.resolve(query)
+
+    assert match.exact and match.state == "Bayern"
+
+
+@pytest.mark.parametrize("query, name", [("Muenchen", "München"), ("Nürnbrg", "Nürnberg"), ("Augsburgg", "Augsburg")])
+def test_typos_are_accepted_above_fuzzy_threshold(gazetteer, query, name):
+    match = gazetteer.resolve(query)
+
+    assert match.name == name and not match.exact
+    assert match.confidence >= FUZZY_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("query", ["Hallen", "Regensburk", "Atlantis"])
+def test_near_misses_stay_below_fuzzy_threshold(gazetteer, query):
+    match = gazetteer.resolve(query)
+
+    assert match is None or match.state is None or match.confidence < FUZZY_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("query", ["Main", "Ham", "Hall"])
+def test_short_names_are_never_fuzzy_matched(gazetteer, query):
+    assert gazetteer.resolve(query) is None
+
+
+def test_ambiguous_names_need_a_qualifier(gazetteer):
+    assert gazetteer.resolve("Friedberg").state is None
+    assert gazetteer.resolve("Friedberg (Bayern)").state == "Bayern"
+    assert gazetteer.resolve("Friedberg (Hessen)").state == "Hessen"
+
+
+def test_in_memory_gazetteer():
+    gazetteer = Gazetteer([("Bayern", "Bayern", []), ("Neustadt", "Bayern", []), ("Neustadt", "Sachsen", ["Nowe Miasto"])])
+
+    assert gazetteer.resolve("Neustadt").confidence == .5
+    assert gazetteer.resolve("Neustadt, Bayern").state == "Bayern"
+    assert gazetteer.canonical_name("nowe miasto") == "Neustadt"
+    assert gazetteer.canonical_name("Neustadt") == "Neustadt"
+
+
+def test_fold_name():
+    assert fold_name("Straßburg-Süd") == "strassburg sud"
+    assert fold_name("Штутгарт") == "stutgart"
+
+
+def test_filter_applies_stricter_threshold_to_fuzzy_matches():
+    service = WebFilterService("key", strategy="gazetteer", gazetteer_fallback=[], verdict_cache_path=None)
+
+    results, unresolved = service._classify_cities_gazetteer(["München", "Muenchen", "Hallen", "Berlin", "Friedberg"])
+
+    assert results == {"München": True, "Muenchen": True, "Berlin": False}
+    assert unresolved == ["Friedberg", "Hallen"]
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from geopy.exc import GeocoderTimedOut
+
+from services.web.filter_service import WebFilterService
+from storage.geocode_cache import GeocodeCacheStore
+
+
+class FakeGeolocator:
+    def __init__(self, answers):
+        self.answers = answers  # запрос -> state / None (не найдено) / исключение
+        self.queries = []
+
+    def geocode(self, query, addressdetails=True, language=None):
+        self.queries.append(query)
+        answer = self.answers.get(query)
+        if isinstance(answer, Exception):
+            raise answer
+        if answer is None:
+            return None
+        return SimpleNamespace(raw={"address": {"state": answer}})
+
+
+def make_filter(tmp_path, answers, **kwargs):
+    service = WebFilterService(
+        "key", strategy="geo", verdict_cache_path=None,
+        geocode_cache_path=str(tmp_path / "geocode.sqlite"), **kwargs,
+    )
+    service.geolocator = FakeGeolocator(answers)
+    return service
+
+
+def test_store_uses_separate_ttls_for_found_and_negative_results(tmp_path):
+    store = GeocodeCacheStore(str(tmp_path / "geocode.sqlite"), ttl_days=180, negative_ttl_days=7)
+    store.put("Germany", "de", "augsburg", "found", "bayern")
+    store.put("Germany", "de", "atlantis", "not_found", None)
+    store._execute("UPDATE geocodes SET updated_at = updated_at - 30 * 86400")
+
+    assert store.get_many("Germany", "de", ["augsburg", "atlantis"]) == {"augsburg": ("found", "bayern")}
+    assert store.get_many("Austria", "de", ["augsburg"]) == {}
+
+
+def test_lookups_are_reused_across_instances(tmp_path):
+    first = make_filter(tmp_path, {"Augsburg, Germany": "Bayern"})
+    assert asyncio.run(first._classify_cities_geo(["Augsburg"])) == ({"Augsburg": True}, [])
+
+    second = make_filter(tmp_path, {})
+    results, unresolved = asyncio.run(second._classify_cities_geo(["Augsburg"]))
+
+    assert results == {"Augsburg": True} and unresolved == []
+    assert second.geolocator.queries == []
+    assert second.metrics["geocode_cache_hits"] == 1
+
+
+def test_not_found_is_cached_but_reported_unresolved(tmp_path):
+    first = make_filter(tmp_path, {"Atlantis, Germany": None})
+    asyncio.run(first._classify_cities_geo(["Atlantis"]))
+
+    second = make_filter(tmp_path, {})
+    results, unresolved = asyncio.run(second._classify_cities_geo(["Atlantis"]))
+
+    assert results == {"Atlantis": False} and unresolved == ["Atlantis"]
+    assert second.geolocator.queries == []
+
+
+def test_network_errors_are_not_cached(tmp_path):
+    failing = make_filter(tmp_path, {"Augsburg, Germany": GeocoderTimedOut()})
+    asyncio.run(failing._classify_cities_geo(["Augsburg"]))
+
+    assert failing.metrics["geocode_failures"] == 1
+    assert not failing.result_cacheable()
+
+    retry = make_filter(tmp_path, {"Augsburg, Germany": "Bayern"})
+    assert asyncio.run(retry._classify_cities_geo(["Augsburg"]))[0] == {"Augsburg": True}
+    assert retry.geolocator.queries == ["Augsburg, Germany"]
+
+
+@pytest.mark.parametrize("spelling", ["augsburg", "  Augsburg "])
+def test_cache_key_is_normalised(tmp_path, spelling):
+    first = make_filter(tmp_path, {"Augsburg, Germany": "Bayern"})
+    asyncio.run(first._classify_cities_geo(["Augsburg"]))
+
+    second = make_filter(tmp_path, {})
+    asyncio.run(second._classify_cities_geo([spelling]))
+
+    assert second.geolocator.queries == []
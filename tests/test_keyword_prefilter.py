@@ -0,0 +1,57 @@
+import pytest
+
+from services.tg.keyword_prefilter import DEFAULT_KEYWORDS, KeywordPrefilter, _trie_pattern
+
+ENGINES = ["aho-corasick", "regex", "substring"]
+
+# пересекающиеся слова и слова-префиксы друг друга
+OVERLAPPING = ["квартира", "кварт", "квартал", "аренда", "ренд", "room", "roommate", "zimmer", "wg-zimmer"]
+
+TEXTS = [
+    "Сдаю КВАРТИРУ в центре",
+    "новый КВАРТАЛ",
+    "КВАРТ",
+    "Аренда",
+    "оРЕНДа",
+    "ROOMMATE wanted",
+    "Ein WG-ZIMMER frei",
+    "кв-ра",
+    "ничего",
+    "",
+    "zimme",
+]
+
+
+def reference(keywords, text):
+    return any(word.lower() in text.lower() for word in keywords)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("keywords", [OVERLAPPING, DEFAULT_KEYWORDS], ids=["overlapping", "default"])
+def test_engines_agree_with_substring_search(engine, keywords):
+    prefilter = KeywordPrefilter(keywords, engine=engine)
+    words = [w for ws in keywords.values() for w in ws] if isinstance(keywords, dict) else keywords
+
+    assert [prefilter.matches(text) for text in TEXTS] == [reference(words, text) for text in TEXTS]
+
+
+def test_keywords_are_normalised_and_deduplicated():
+    prefilter = KeywordPrefilter({"ru": ["Квартира", " квартира "], "uk": ["квартира", ""]}, engine="substring")
+
+    assert prefilter.keywords == ["квартира"]
+
+
+def test_auto_engine_prefers_aho_corasick():
+    assert KeywordPrefilter(["a"]).engine == "aho-corasick"
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        KeywordPrefilter([" "])
+    with pytest.raises(ValueError):
+        KeywordPrefilter(["a"], engine="simd")
+
+
+def test_trie_pattern_factors_common_prefixes():
+    assert _trie_pattern(["квартал", "квартира"]) == "кварт(?:ал|ира)"
+    assert _trie_pattern(["кварт", "квартира"]) == "кварт(?:ира)?"
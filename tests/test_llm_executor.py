@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from google.genai.errors import APIError
+
+from services.llm_executor import LLMExecutor
+
+
+class FakeModels:
+    """Отдает заранее заданные ответы/исключения по очереди."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def generate_content(self, model, contents):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def make_executor(outcomes, max_retries=3):
+    models = FakeModels(outcomes)
+    client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    executor = LLMExecutor(
+        client, "test-model",
+        requests_per_minute=6000, tokens_per_minute=10_000_000,
+        max_retries=max_retries, base_delay=0, max_delay=0,
+    )
+    return executor, models
+
+
+def response(text):
+    usage = SimpleNamespace(prompt_token_count=10, candidates_token_count=2)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("refused"),
+    httpx.ReadTimeout("slow"),
+    httpx.RemoteProtocolError("closed"),
+    asyncio.TimeoutError(),
+    ConnectionResetError(),
+    APIError(503, {}),
+    APIError(429, {}),
+])
+def test_transient_errors_are_retried(error):
+    executor, models = make_executor([error, response("ok")])
+
+    result = asyncio.run(executor.generate(["prompt"]))
+
+    assert result.text == "ok"
+    assert models.calls == 2
+    assert executor.metrics["llm_retries"] == 1
+    assert executor.metrics["llm_prompt_tokens"] == 10
+
+
+def test_client_errors_are_not_retried():
+    executor, models = make_executor([APIError(400, {}), response("ok")])
+
+    with pytest.raises(APIError):
+        asyncio.run(executor.generate(["prompt"]))
+    assert models.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    executor, models = make_executor([httpx.ConnectError("down")] * 3, max_retries=2)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(executor.generate(["prompt"]))
+    assert models.calls == 3
+
+
+def test_map_keeps_order_and_returns_failures():
+    executor, _ = make_executor([response("a"), APIError(400, {}), response("c")])
+
+    results = asyncio.run(executor.map([["1"], ["2"], ["3"]]))
+
+    assert results[0].text == "a"
+    assert isinstance(results[1], APIError)
+    assert results[2].text == "c"
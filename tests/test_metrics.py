@@ -0,0 +1,133 @@
+import json
+import pstats
+
+import pytest
+
+from metrics import RunMetrics, container_counts
+from models import Container, TelegramChannel, TelegramMessage
+
+
+def run_two_steps(tmp_path, **kwargs) -> RunMetrics:
+    metrics = RunMetrics(str(tmp_path), execution="streaming", **kwargs)
+    container = Container(channels=[
+        TelegramChannel(city="A", name="a", url="a", messages=[TelegramMessage(text="x"), TelegramMessage(text="y")]),
+        TelegramChannel(city="A", name="b", url="b", messages=None),
+    ])
+
+    parser = metrics.add_step("TgParserService")
+    with metrics.measure(parser):
+        sum(range(10000))
+    parser.input = container_counts(None)
+    parser.output = container_counts(container)
+    parser.counters = {"telegram_rpc_calls": 3, "flood_wait.seconds": 1.5}
+
+    cached = metrics.add_step("TgDedupService")
+    cached.cache = "stage_cache"
+    cached.cpu_seconds = None
+    return metrics
+
+
+def test_container_counts():
+    container = Container(channels=[
+        TelegramChannel(city="A", name="a", url="a", messages=[TelegramMessage(text="x")]),
+        TelegramChannel(city="A", name="b", url="b", messages=None),
+    ])
+
+    assert container_counts(container) == {"channels": 2, "messages": 1}
+    assert container_counts(None) == {"channels": 0, "messages": 0}
+
+
+def test_metrics_json_report(tmp_path):
+    metrics = run_two_steps(tmp_path)
+
+    metrics.save()
+
+    report = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert report["session"] == tmp_path.name
+    assert report["execution"] == "streaming"
+    assert report["wall_seconds"] >= 0 and report["cpu_seconds"] >= 0
+
+    parser, dedup = report["steps"]
+    assert (parser["index"], parser["service"], parser["cache"]) == (0, "TgParserService", None)
+    assert parser["output"] == {"channels": 2, "messages": 2}
+    assert parser["counters"] == {"telegram_rpc_calls": 3, "flood_wait.seconds": 1.5}
+    assert parser["finished_at"] >= parser["started_at"]
+    assert parser["wall_seconds"] >= 0 and parser["cpu_seconds"] >= 0
+    assert parser["profile"] is None
+    assert (dedup["cache"], dedup["cpu_seconds"]) == ("stage_cache", None)
+
+    assert not (tmp_path / "metrics.prom").exists()
+
+
+def parse_prometheus(text: str):
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE"):
+            _, _, name, kind = line.split()
+            types[name] = kind
+        elif not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples, types
+
+
+def test_prometheus_textfile(tmp_path):
+    run_two_steps(tmp_path, prometheus=True).save()
+
+    text = (tmp_path / "metrics.prom").read_text(encoding="utf-8")
+    samples, types = parse_prometheus(text)
+    labels = f'session="{tmp_path.name}",execution="streaming"'
+    parser = f'{labels},step="0",service="TgParserService"'
+    dedup = f'{labels},step="1",service="TgDedupService"'
+
+    assert text.endswith("\n")
+    assert set(types.values()) == {"gauge"}
+    assert f"pipeline_run_wall_seconds{{{labels}}}" in samples
+    assert samples[f"pipeline_step_output_messages{{{parser}}}"] == 2
+    assert samples[f"pipeline_step_output_channels{{{parser}}}"] == 2
+    assert samples[f"pipeline_service_telegram_rpc_calls{{{parser}}}"] == 3
+    # недопустимые в имени метрики символы заменяются на "_"
+    assert samples[f"pipeline_service_flood_wait_seconds{{{parser}}}"] == 1.5
+    assert samples[f"pipeline_step_cache_hit{{{parser}}}"] == 0
+    assert samples[f"pipeline_step_cache_hit{{{dedup}}}"] == 1
+    # значения None не выводятся
+    assert f"pipeline_step_cpu_seconds{{{dedup}}}" not in samples
+
+
+def test_prometheus_families_are_grouped_and_labels_escaped():
+    report = {
+        "session": 'a"b\\c\nd', "execution": "batch", "wall_seconds": 1, "cpu_seconds": 1, "peak_rss_mb": None,
+        "steps": [
+            {"index": i, "service": "S", "cache": None, "wall_seconds": i, "cpu_seconds": i,
+             "peak_rss_delta_mb": None, "input": {}, "output": {}, "counters": {}}
+            for i in range(2)
+        ],
+    }
+
+    text = RunMetrics.to_prometheus(report)
+
+    assert 'session="a\\"b\\\\c\\nd"' in text
+    lines = text.splitlines()
+    wall = [i for i, line in enumerate(lines) if line.startswith("pipeline_step_wall_seconds")]
+    # один HELP/TYPE на семейство, сэмплы семейства идут подряд
+    assert sum(line == "# TYPE pipeline_step_wall_seconds gauge" for line in lines) == 1
+    assert wall == [wall[0], wall[0] + 1]
+    assert "pipeline_run_peak_rss_megabytes" not in text
+
+
+def test_profile_dump_per_step(tmp_path):
+    metrics = run_two_steps(tmp_path, profile=True)
+
+    path = metrics.steps[0].profile_path
+    assert path == str(tmp_path / "profile_00_TgParserService.prof")
+    assert pstats.Stats(path).total_calls > 0
+
+
+@pytest.mark.parametrize("execution", ["batch", "streaming"])
+def test_metrics_saved_for_each_execution_mode(tmp_path, execution):
+    metrics = RunMetrics(str(tmp_path), execution=execution, prometheus=True)
+
+    metrics.save()
+
+    assert json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))["steps"] == []
+    assert f'execution="{execution}"' in (tmp_path / "metrics.prom").read_text(encoding="utf-8")
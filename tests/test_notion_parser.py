@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+
+from services.web.notion_parser import (
+    channels_from_file, channels_from_html, channels_from_record_map, fetch_record_map, page_id_from_url,
+)
+from services.web.parser_service import WebParserService
+
+ROOT = "00000000-0000-0000-0000-000000000001"
+PAGE_URL_ID = "0123456789abcdef0123456789abcdef"
+
+
+def block(block_id, type_, title=None, content=None, nested=False):
+    value = {"id": block_id, "type": type_, "content": content or []}
+    if title is not None:
+        value["properties"] = {"title": title}
+    return {"value": {"value": value}} if nested else {"value": value}
+
+
+def record_map():
+    return {"block": {
+        ROOT: block(ROOT, "toggle", [["Города"]], ["muc", "nue"]),
+        "muc": block("muc", "toggle", [["‣ München\n"]], ["muc-1", "muc-2"]),
+        "muc-1": block("muc-1", "text", [["Аренда Мюнхен", [["a", "https://t.me/muc_rent"]]], [" и "], ["чат", [["b"]]]]),
+        "muc-2": block("muc-2", "bulleted_list", [["вот https://t.me/muc_chat рядом"]], ["muc-3"]),
+        "muc-3": block("muc-3", "text", [["Сайт", [["a", "https://example.com"]]], ["Вложенный", [["a", "https://t.me/nested"]]]]),
+        "nue": block("nue", "toggle", [["Nürnberg"]], ["nue-1"], nested=True),
+        "nue-1": block("nue-1", "text", [["Nürnberg", [["a", "https://t.me/nue"]]]], nested=True),
+    }}
+
+
+EXPECTED = [
+    ("München", "Аренда Мюнхен", "https://t.me/muc_rent"),
+    ("München", "https://t.me/muc_chat", "https://t.me/muc_chat"),
+    ("München", "Вложенный", "https://t.me/nested"),
+    ("Nürnberg", "Nürnberg", "https://t.me/nue"),
+]
+
+
+def as_tuples(channels):
+    return [(c.city, c.name, c.url) for c in channels]
+
+
+@pytest.mark.parametrize("url", [
+    f"https://www.notion.so/Page-{PAGE_URL_ID}",
+    f"https://site.notion.site/{PAGE_URL_ID}?pvs=4",
+    "https://site.notion.site/Page-01234567-89ab-cdef-0123-456789abcdef#x",
+])
+def test_page_id_from_url(url):
+    assert page_id_from_url(url) == "01234567-89ab-cdef-0123-456789abcdef"
+
+
+def test_page_id_from_url_rejects_urls_without_id():
+    with pytest.raises(ValueError):
+        page_id_from_url("https://www.notion.so/Page")
+
+
+def test_record_map_under_root_block():
+    assert as_tuples(channels_from_record_map(record_map(), ROOT)) == EXPECTED
+
+
+def test_record_map_without_root_uses_innermost_toggles():
+    assert sorted(as_tuples(channels_from_record_map(record_map(), "missing"))) == sorted(EXPECTED)
+
+
+def test_html_page():
+    html = """
+    <div class="notion-toggle"><div class="notion-toggle__summary">Города</div><div class="notion-toggle__content">
+      <div class="notion-toggle"><div class="notion-toggle__summary">‣ München</div>
+        <div class="notion-toggle__content"><a href="https://t.me/muc"> Аренда </a><a href="https://example.com">x</a></div></div>
+    </div></div>
+    """
+    assert as_tuples(channels_from_html(html)) == [("München", "Аренда", "https://t.me/muc")]
+
+
+def test_file_backend_reads_saved_api_response(tmp_path):
+    path = tmp_path / "page.json"
+    path.write_text(json.dumps({"recordMap": record_map()}), encoding="utf-8")
+
+    assert as_tuples(channels_from_file(str(path), ROOT)) == EXPECTED
+    container = asyncio.run(WebParserService(backend="file", source_path=str(path), root_block_id=ROOT).run())
+    assert as_tuples(container.channels) == EXPECTED
+
+
+def test_fetch_record_map_pages_chunks_and_loads_missing_children():
+    blocks = record_map()["block"]
+    chunks = [{k: blocks[k] for k in (ROOT, "muc")}, {k: blocks[k] for k in ("nue", "nue-1")}]
+    requests = []
+
+    async def load_page_chunk(request):
+        payload = await request.json()
+        requests.append(("loadPageChunk", payload["chunkNumber"]))
+        number = payload["chunkNumber"]
+        cursor = {"stack": [["next"]]} if number + 1 < len(chunks) else {"stack": []}
+        return web.json_response({"recordMap": {"block": chunks[number]}, "cursor": cursor})
+
+    async def sync_record_values(request):
+        payload = await request.json()
+        ids = [r["pointer"]["id"] for r in payload["requests"]]
+        requests.append(("syncRecordValues", ids))
+        return web.json_response({"recordMap": {"block": {i: blocks[i] for i in ids}}})
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/api/v3/loadPageChunk", load_page_chunk)
+        app.router.add_post("/api/v3/syncRecordValues", sync_record_values)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await fetch_record_map(f"http://127.0.0.1:{port}/Page-{PAGE_URL_ID}", timeout=5)
+        finally:
+            await runner.cleanup()
+
+    fetched = asyncio.run(scenario())
+
+    assert as_tuples(channels_from_record_map(fetched, ROOT)) == EXPECTED
+    assert requests == [
+        ("loadPageChunk", 0), ("loadPageChunk", 1),
+        ("syncRecordValues", ["muc-1", "muc-2"]), ("syncRecordValues", ["muc-3"]),
+    ]
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(backend="ftp", page_url="https://x"),
+    dict(backend="file"),
+    dict(backend="http"),
+    dict(backend="auto"),
+    dict(backend="selenium", page_url="https://x", root_block_id=None),
+])
+def test_invalid_parser_configuration(kwargs):
+    with pytest.raises(ValueError):
+        WebParserService(**kwargs)
@@ -0,0 +1,60 @@
+from storage.outbox import OutboxStore
+
+
+def status(outbox: OutboxStore, outbox_id: int) -> str:
+    return outbox._query("SELECT status FROM outbox WHERE id = ?", (outbox_id,))[0][0]
+
+
+def test_outbox_enqueue_is_idempotent(tmp_path):
+    outbox = OutboxStore(str(tmp_path / "outbox.sqlite"))
+
+    first = outbox.enqueue("@c", [("k1", "text 1", None), ("k2", "text 2", "src")])
+    again = outbox.enqueue("@c", [("k1", "changed", None)])
+
+    assert again == first[:1]
+    assert outbox.pending("@c") == [(first[0], "text 1", None), (first[1], "text 2", "src")]
+
+
+def test_outbox_sent_rows_are_not_requeued(tmp_path):
+    outbox = OutboxStore(str(tmp_path / "outbox.sqlite"))
+    [row] = outbox.enqueue("@c", [("k", "text", None)])
+
+    outbox.mark_sending(row)
+    outbox.mark_sent(row, 42)
+    outbox.enqueue("@c", [("k", "text", None)])
+
+    assert status(outbox, row) == "sent"
+    assert outbox.pending("@c") == []
+
+
+def test_outbox_failures_retry_until_max_attempts_then_requeue_on_enqueue(tmp_path):
+    outbox = OutboxStore(str(tmp_path / "outbox.sqlite"))
+    [row] = outbox.enqueue("@c", [("k", "text", None)])
+
+    assert outbox.mark_failed(row, "err", max_attempts=2) == "pending"
+    assert outbox.mark_failed(row, "err", max_attempts=2) == "failed"
+    assert outbox.pending("@c") == []
+
+    outbox.enqueue("@c", [("k", "text", None)])
+    assert status(outbox, row) == "pending"
+
+
+def test_outbox_permanent_failure(tmp_path):
+    outbox = OutboxStore(str(tmp_path / "outbox.sqlite"))
+    [row] = outbox.enqueue("@c", [("k", "text", None)])
+
+    assert outbox.mark_failed(row, "bad html", max_attempts=5, permanent=True) == "failed"
+
+
+def test_outbox_interrupted_rows_become_uncertain_until_requeued(tmp_path):
+    outbox = OutboxStore(str(tmp_path / "outbox.sqlite"))
+    [row] = outbox.enqueue("@c", [("k", "text", None)])
+    outbox.mark_sending(row)
+
+    assert outbox.recover("@c") == 1
+    assert status(outbox, row) == "uncertain"
+    assert outbox.pending("@c") == []
+
+    assert outbox.requeue_uncertain("@c", older_than=3600) == 0
+    assert outbox.requeue_uncertain("@c") == 1
+    assert outbox.pending("@c") == [(row, "text", None)]
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from models import Container, TelegramChannel, TelegramMessage
+from storage.parser_state import ParserStateStore
+from tg_fakes import FakeTelegramClient, fake_message
+
+NOW = datetime.now(timezone.utc)
+
+
+def channel(url="https://t.me/chan_101"):
+    return TelegramChannel(city="A", name="chan", url=url, messages=None)
+
+
+def test_high_water_mark_only_moves_forward(tmp_path):
+    state = ParserStateStore(str(tmp_path / "state.sqlite"))
+
+    state.save_channel(1, 10, [])
+    state.save_channel(1, 7, [])
+
+    assert state.get_high_water_mark(1) == 10
+    assert state.get_high_water_mark(2) is None
+
+
+def test_retained_window_is_bounded_by_date_and_mark(tmp_path):
+    state = ParserStateStore(str(tmp_path / "state.sqlite"))
+    state.save_channel(1, 12, [
+        (10, TelegramMessage(text="old", date=NOW - timedelta(days=10))),
+        (11, TelegramMessage(text="recent", date=NOW - timedelta(days=1))),
+        (12, TelegramMessage(text="newest", date=NOW)),
+    ])
+
+    since = NOW - timedelta(days=7)
+    assert [m.text for m in state.load_retained(1, since)] == ["recent", "newest"]
+    assert [m.text for m in state.load_retained(1, since, up_to_id=11)] == ["recent"]
+
+    assert state.prune(since) == 1
+    assert [m.text for m in state.load_retained(1, NOW - timedelta(days=30))] == ["recent", "newest"]
+
+
+def test_incremental_run_resumes_from_high_water_mark(tmp_path, make_parser):
+    client = FakeTelegramClient(history={101: [
+        fake_message(1, "сдаю квартиру 1"),
+        fake_message(2, "не по теме"),
+        fake_message(3, "сдаю квартиру 3"),
+    ]})
+    parser = make_parser(client, incremental=True, state_path=str(tmp_path / "state.sqlite"))
+
+    first = asyncio.run(parser.run(Container(channels=[channel()])))
+    client.history[101].append(fake_message(4, "сдаю квартиру 4"))
+    second = asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert [m.text for m in first.channels[0].messages] == ["сдаю квартиру 1", "сдаю квартиру 3"]
+    assert [m.text for m in second.channels[0].messages] == ["сдаю квартиру 1", "сдаю квартиру 3", "сдаю квартиру 4"]
+    assert client.iter_calls == [(101, 0), (101, 3)]
+    assert parser.state.get_high_water_mark(101) == 4
+
+
+def test_incremental_run_without_window_returns_only_new_messages(tmp_path, make_parser):
+    client = FakeTelegramClient(history={101: [fake_message(1, "сдаю квартиру 1")]})
+    parser = make_parser(client, incremental=True, return_window=False, state_path=str(tmp_path / "state.sqlite"))
+
+    asyncio.run(parser.run(Container(channels=[channel()])))
+    client.history[101].append(fake_message(2, "сдаю квартиру 2"))
+    second = asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert [m.text for m in second.channels[0].messages] == ["сдаю квартиру 2"]
+
+
+def test_full_run_keeps_no_state(make_parser):
+    client = FakeTelegramClient(history={101: [fake_message(1, "сдаю квартиру 1")]})
+    parser = make_parser(client)
+
+    asyncio.run(parser.run(Container(channels=[channel()])))
+    asyncio.run(parser.run(Container(channels=[channel()])))
+
+    assert parser.state is None
+    assert client.iter_calls == [(101, 0), (101, 0)]
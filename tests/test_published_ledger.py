@@ -0,0 +1,31 @@
+from storage.published_ledger import PublishedLedgerStore, ad_fingerprint
+
+
+def test_ledger_records_and_expires(tmp_path):
+    ledger = PublishedLedgerStore(str(tmp_path / "ledger.sqlite"), ttl_days=1)
+    fp = ad_fingerprint("https://t.me/a", "@user", "Сдаю  КВАРТИРУ")
+
+    ledger.record_many({fp: ("https://t.me/a", "@user")})
+
+    assert ledger.contains_many([fp, "other"]) == {fp}
+    assert ad_fingerprint("https://t.me/a", "@user", " Сдаю КВАРТИРУ\n") == fp
+
+    ledger._execute("UPDATE published SET published_at = published_at - 2 * 86400")
+    assert ledger.contains_many([fp]) == set()
+    assert ledger.prune() == 1
+
+
+def test_fingerprint_depends_on_channel_and_sender():
+    fp = ad_fingerprint("https://t.me/a", "@user", "квартира")
+
+    assert ad_fingerprint("https://t.me/b", "@user", "квартира") != fp
+    assert ad_fingerprint("https://t.me/a", None, "квартира") == ad_fingerprint("https://t.me/a", "", "квартира")
+
+
+def test_ledger_without_ttl_keeps_everything(tmp_path):
+    ledger = PublishedLedgerStore(str(tmp_path / "ledger.sqlite"), ttl_days=None)
+    ledger.record_many({f"fp{i}": ("https://t.me/a", None) for i in range(PublishedLedgerStore._CHUNK + 3)})
+    ledger._execute("UPDATE published SET published_at = 0")
+
+    assert len(ledger.contains_many(f"fp{i}" for i in range(PublishedLedgerStore._CHUNK + 3))) == PublishedLedgerStore._CHUNK + 3
+    assert ledger.prune() == 0
@@ -0,0 +1,215 @@
+import asyncio
+from html import unescape as html_unescape
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+from models import Container, TelegramChannel, TelegramMessage
+from services.tg.publisher_service import TgPublisherService
+
+DATE = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeBot:
+    """Записывает отправленные сообщения; `errors` — исключения для очередных вызовов (None — успех)."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, disable_web_page_preview=None):
+        self.calls += 1
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def make_publisher(tmp_path, bot=None, **kwargs):
+    options = dict(
+        outbox_path=str(tmp_path / "outbox.sqlite"), ledger_path=None,
+        messages_per_minute=6000, burst=100,
+    )
+    options.update(kwargs)
+    publisher = TgPublisherService("123:token", "@chan", **options)
+    publisher.bot = bot or FakeBot()
+    return publisher
+
+
+def ads(*texts, city="Berlin", url="https://t.me/src"):
+    messages = [TelegramMessage(text=text, sender="@user", date=DATE) for text in texts]
+    return Container(channels=[TelegramChannel(city=city, name="src", url=url, messages=messages)])
+
+
+def outbox_statuses(publisher):
+    return [status for (status,) in publisher.outbox._query("SELECT status FROM outbox ORDER BY id")]
+
+
+def test_ads_are_published_once(tmp_path):
+    publisher = make_publisher(tmp_path)
+
+    not_sent = asyncio.run(publisher.run(ads("квартира 1", "квартира 2")))
+    asyncio.run(publisher.run(ads("квартира 1", "квартира 2")))
+
+    assert not_sent.channels == []
+    assert len(publisher.bot.sent) == 2
+    assert "квартира 1" in publisher.bot.sent[0]
+    assert outbox_statuses(publisher) == ["sent", "sent"]
+
+
+def test_retry_after_pauses_and_resends(tmp_path):
+    publisher = make_publisher(tmp_path, FakeBot([RetryAfter(0)]))
+
+    asyncio.run(publisher.run(ads("квартира")))
+
+    assert publisher.bot.calls == 2
+    assert outbox_statuses(publisher) == ["sent"]
+
+
+@pytest.mark.parametrize("error", [TimedOut(), NetworkError("connection reset"), asyncio.TimeoutError()])
+def test_ambiguous_failures_become_uncertain_and_are_not_resent(tmp_path, error):
+    publisher = make_publisher(tmp_path, FakeBot([error]))
+
+    not_sent = asyncio.run(publisher.run(ads("квартира")))
+    asyncio.run(publisher.drain())
+
+    assert [m.text for m in not_sent.channels[0].messages] == ["квартира"]
+    assert publisher.bot.calls == 1
+    assert outbox_statuses(publisher) == ["uncertain"]
+
+
+def test_uncertain_rows_are_requeued_when_configured(tmp_path):
+    first = make_publisher(tmp_path, FakeBot([TimedOut()]))
+    asyncio.run(first.run(ads("квартира")))
+
+    second = make_publisher(tmp_path, requeue_uncertain_hours=0)
+    asyncio.run(second.drain())
+
+    assert len(second.bot.sent) == 1
+    assert outbox_statuses(second) == ["sent"]
+
+
+def test_bad_request_fails_permanently(tmp_path):
+    publisher = make_publisher(tmp_path, FakeBot([BadRequest("can't parse entities")]))
+
+    asyncio.run(publisher.run(ads("квартира")))
+
+    assert publisher.bot.calls == 1
+    assert outbox_statuses(publisher) == ["failed"]
+
+
+def test_interrupted_send_is_not_repeated_after_restart(tmp_path):
+    publisher = make_publisher(tmp_path, FakeBot([KeyboardInterrupt()]))
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(publisher.run(ads("квартира")))
+    assert outbox_statuses(publisher) == ["sending"]
+
+    restarted = make_publisher(tmp_path)
+    asyncio.run(restarted.drain())
+
+    assert restarted.bot.sent == []
+    assert outbox_statuses(restarted) == ["uncertain"]
+
+
+def sent_ads(publisher, texts):
+    """Сколько раз каждое объявление попало в отправленные сообщения."""
+    return {text: sum(text in message for message in publisher.bot.sent) for text in texts}
+
+
+def test_digest_resumes_after_crash_without_reposting(tmp_path):
+    crashed = make_publisher(tmp_path, mode="digest", ledger_path=str(tmp_path / "ledger.sqlite"))
+
+    async def crash():
+        raise KeyboardInterrupt
+
+    crashed.drain = crash
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(crashed.run(ads("квартира A", "квартира B")))
+
+    # следующий запуск получает те же объявления и новое — дайджест упаковался бы иначе
+    resumed = make_publisher(tmp_path, mode="digest", ledger_path=str(tmp_path / "ledger.sqlite"))
+    asyncio.run(resumed.run(ads("квартира A", "квартира B", "квартира C")))
+    asyncio.run(resumed.run(ads("квартира A", "квартира B", "квартира C")))
+
+    assert sent_ads(resumed, ["квартира A", "квартира B", "квартира C"]) == {
+        "квартира A": 1, "квартира B": 1, "квартира C": 1,
+    }
+    assert resumed.metrics["queued_skipped"] == 2
+
+
+def test_uncertain_digest_is_not_repacked_and_resent(tmp_path):
+    first = make_publisher(tmp_path, FakeBot([TimedOut()]), mode="digest")
+    asyncio.run(first.run(ads("квартира A")))
+
+    second = make_publisher(tmp_path, mode="digest")
+    asyncio.run(second.run(ads("квартира A", "квартира B")))
+
+    assert sent_ads(second, ["квартира A", "квартира B"]) == {"квартира A": 0, "квартира B": 1}
+
+
+def test_dedup_key_does_not_depend_on_rendering(tmp_path):
+    publisher = make_publisher(tmp_path)
+    asyncio.run(publisher.run(ads("квартира")))
+
+    # то же объявление из того же канала, но канал переименован — текст публикации другой
+    renamed = ads("квартира")
+    renamed.channels[0].name = "renamed"
+    asyncio.run(publisher.run(renamed))
+
+    assert len(publisher.bot.sent) == 1
+
+
+def test_digest_packs_ads_per_city_within_limit(tmp_path):
+    publisher = make_publisher(tmp_path, mode="digest", digest_max_length=700)
+    container = ads(*(f"квартира {i} " + "x" * 100 for i in range(6)))
+    container.channels += ads("квартира в Мюнхене", city="München", url="https://t.me/muc").channels
+
+    asyncio.run(publisher.run(container))
+
+    assert all(publisher._telegram_length(text) <= 700 for text in publisher.bot.sent)
+    *berlin, munich = publisher.bot.sent
+    assert 1 < len(berlin) < 6
+    assert all("Berlin" in text and "München" not in text for text in berlin)
+    assert "Мюнхене" in munich and "Berlin" not in munich
+    assert sent_ads(publisher, [f"квартира {i} " for i in range(6)]) == {f"квартира {i} ": 1 for i in range(6)}
+
+
+def test_oversized_ad_is_split_at_escaped_boundaries(tmp_path):
+    publisher = make_publisher(tmp_path)
+    text = " ".join(f"<слово&{i}>" for i in range(1500))
+
+    asyncio.run(publisher.run(ads(text)))
+
+    assert len(publisher.bot.sent) > 1
+    assert all(publisher._telegram_length(part) <= publisher.TELEGRAM_MAX_LENGTH for part in publisher.bot.sent)
+    bodies = [part.split("\n", 1)[1] if i else part.split("<b>💬 Сообщение:</b>\n", 1)[1] for i, part in enumerate(publisher.bot.sent)]
+    assert html_unescape("".join(bodies)) == text
+    assert outbox_statuses(publisher) == ["sent"] * len(publisher.bot.sent)
+
+
+def test_ledger_skips_ads_published_in_earlier_runs(tmp_path):
+    ledger_path = str(tmp_path / "ledger.sqlite")
+    first = make_publisher(tmp_path, outbox_path=None, ledger_path=ledger_path)
+    asyncio.run(first.run(ads("квартира A")))
+
+    # другой дайджест/очередь: отпечаток объявления все равно известен журналу
+    second = make_publisher(tmp_path, outbox_path=None, ledger_path=ledger_path, mode="digest")
+    asyncio.run(second.run(ads("квартира A", "квартира B")))
+
+    assert sent_ads(second, ["квартира A", "квартира B"]) == {"квартира A": 0, "квартира B": 1}
+    assert second.metrics["published_skipped"] == 1
+
+
+def test_failed_ads_are_not_recorded_in_ledger(tmp_path):
+    ledger_path = str(tmp_path / "ledger.sqlite")
+    failing = make_publisher(tmp_path, FakeBot([BadRequest("bad")]), outbox_path=None, ledger_path=ledger_path)
+    asyncio.run(failing.run(ads("квартира")))
+
+    retry = make_publisher(tmp_path, outbox_path=None, ledger_path=ledger_path)
+    asyncio.run(retry.run(ads("квартира")))
+
+    assert len(retry.bot.sent) == 1
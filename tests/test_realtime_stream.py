@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon import types, utils
+
+from models import TelegramChannel
+from tg_fakes import FakeTelegramClient, fake_message
+
+CHANNELS = [
+    TelegramChannel(city="A", name="a", url="https://t.me/chan_101", messages=None),
+    TelegramChannel(city="B", name="b", url="https://t.me/chan_202", messages=None),
+]
+
+
+def event(channel_id, msg):
+    chat_id = utils.get_peer_id(types.PeerChannel(channel_id))
+    return SimpleNamespace(chat_id=chat_id, message=msg)
+
+
+async def listen(parser, client, deliver, **kwargs):
+    """Запускает parser.stream, передает события через `deliver` и отключает клиента."""
+    client.disconnected = asyncio.get_running_loop().create_future()
+    batches = []
+
+    async def on_batch(container):
+        batches.append({c.url: [m.text for m in c.messages] for c in container.channels})
+
+    task = asyncio.ensure_future(parser.stream(CHANNELS, on_batch, **kwargs))
+    while not client.handlers:
+        await asyncio.sleep(0)
+    await deliver(client.handlers[0], batches)
+    client.disconnected.set_result(None)
+    await asyncio.wait_for(task, 1)
+    return batches
+
+
+def test_full_batches_are_flushed_immediately_and_filtered(make_parser):
+    client = FakeTelegramClient()
+    parser = make_parser(client)
+
+    async def deliver(handler, batches):
+        await handler(event(101, fake_message(1, "сдаю квартиру")))
+        await handler(event(101, fake_message(2, "не по теме")))
+        await handler(event(999, fake_message(3, "сдаю квартиру в чужом чате")))
+        await handler(event(202, fake_message(4, "квартира свободна")))
+        await asyncio.sleep(0.05)
+        assert batches == [{"https://t.me/chan_101": ["сдаю квартиру"], "https://t.me/chan_202": ["квартира свободна"]}]
+
+    asyncio.run(listen(parser, client, deliver, batch_size=2, flush_interval=60))
+
+
+def test_partial_batch_is_flushed_by_interval_and_on_shutdown(make_parser):
+    client = FakeTelegramClient()
+    parser = make_parser(client)
+
+    async def deliver(handler, batches):
+        await handler(event(101, fake_message(1, "квартира 1")))
+        await asyncio.sleep(0.15)
+        assert batches == [{"https://t.me/chan_101": ["квартира 1"]}]
+        await handler(event(202, fake_message(2, "квартира 2")))
+
+    batches = asyncio.run(listen(parser, client, deliver, batch_size=100, flush_interval=0.05))
+
+    assert batches[-1] == {"https://t.me/chan_202": ["квартира 2"]}
+    assert client.handlers == []
+
+
+def test_failing_batch_does_not_stop_listening(make_parser):
+    client = FakeTelegramClient()
+    parser = make_parser(client)
+    seen = []
+
+    async def on_batch(container):
+        seen.append(container)
+        raise RuntimeError("filter is down")
+
+    async def scenario():
+        client.disconnected = asyncio.get_running_loop().create_future()
+        task = asyncio.ensure_future(parser.stream(CHANNELS, on_batch, batch_size=1, flush_interval=60))
+        while not client.handlers:
+            await asyncio.sleep(0)
+        await client.handlers[0](event(101, fake_message(1, "квартира 1")))
+        await asyncio.sleep(0.01)
+        await client.handlers[0](event(101, fake_message(2, "квартира 2")))
+        await asyncio.sleep(0.01)
+        client.disconnected.set_result(None)
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(scenario())
+
+    assert len(seen) == 2
+
+
+def test_realtime_messages_are_retained_without_moving_high_water_mark(tmp_path, make_parser):
+    client = FakeTelegramClient()
+    parser = make_parser(client, incremental=True, state_path=str(tmp_path / "state.sqlite"))
+    parser.state.save_channel(101, 10, [])
+
+    async def deliver(handler, batches):
+        await handler(event(101, fake_message(50, "квартира live")))
+
+    asyncio.run(listen(parser, client, deliver, batch_size=1, flush_interval=60))
+
+    since = datetime.now(timezone.utc) - timedelta(days=1)
+    assert parser.state.get_high_water_mark(101) == 10
+    assert [m.text for m in parser.state.load_retained(101, since, up_to_id=10)] == []
+    assert [m.text for m in parser.state.load_retained(101, since)] == ["квартира live"]
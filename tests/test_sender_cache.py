@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.tg.sender_cache import SenderCache, format_sender
+from storage.sender_store import SenderStore
+from tg_fakes import FakeTelegramClient, fake_message
+
+
+def user(username=None, phone=None):
+    return SimpleNamespace(username=username, phone=phone)
+
+
+def test_format_sender():
+    assert format_sender(user("bob", "+49")) == "@bob"
+    assert format_sender(user(phone="+49")) == "+49"
+    assert format_sender(None) == "Unknown"
+
+
+def test_unknown_senders_are_resolved_in_one_batch_and_cached():
+    client = FakeTelegramClient(users={1: user("a"), 2: user(phone="+49")})
+    cache = SenderCache()
+    messages = [fake_message(1, "x", 1), fake_message(2, "y", 2), fake_message(3, "z", 1), fake_message(4, "w", None)]
+
+    first = asyncio.run(cache.resolve(client, messages))
+    second = asyncio.run(cache.resolve(client, messages))
+
+    assert first == second == ["@a", "+49", "@a", "Unknown"]
+    assert client.entity_lookups == [[1, 2]]
+
+
+def test_sender_attached_to_message_needs_no_rpc():
+    client = FakeTelegramClient()
+    msg = fake_message(1, "x", 7)
+    msg.sender = user("inline")
+
+    assert asyncio.run(SenderCache().resolve(client, [msg])) == ["@inline"]
+    assert client.entity_lookups == []
+
+
+def test_failed_lookups_are_not_remembered():
+    client = FakeTelegramClient()  # get_entity и get_sender падают
+    cache = SenderCache()
+
+    assert asyncio.run(cache.resolve(client, [fake_message(1, "x", 5)])) == ["Unknown"]
+
+    client.users[5] = user("back")
+    assert asyncio.run(cache.resolve(client, [fake_message(1, "x", 5)])) == ["@back"]
+
+
+def test_lru_is_bounded():
+    client = FakeTelegramClient(users={i: user(f"u{i}") for i in range(3)})
+    cache = SenderCache(max_size=2)
+
+    asyncio.run(cache.resolve(client, [fake_message(i, "x", i) for i in range(3)]))
+
+    assert list(cache._lru) == [1, 2]
+
+
+def test_persistent_layer_survives_restarts(tmp_path):
+    path = str(tmp_path / "senders.sqlite")
+    client = FakeTelegramClient(users={1: user("a")})
+    asyncio.run(SenderCache(store=SenderStore(path)).resolve(client, [fake_message(1, "x", 1)]))
+
+    restarted = FakeTelegramClient()
+    result = asyncio.run(SenderCache(store=SenderStore(path)).resolve(restarted, [fake_message(1, "x", 1)]))
+
+    assert result == ["@a"]
+    assert restarted.entity_lookups == []
+
+
+def test_expired_store_entries_are_ignored(tmp_path):
+    store = SenderStore(str(tmp_path / "senders.sqlite"), ttl_days=1)
+    store.put_many({1: "@old"})
+    store._execute("UPDATE senders SET updated_at = updated_at - 2 * 86400")
+
+    assert store.get_many([1]) == {}
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from models import Container, TelegramChannel, TelegramMessage
+from snapshot_codec import CODECS, detect_codec, iter_channels, read_container, write_container
+
+
+def make_container() -> Container:
+    date = datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    return Container(channels=[
+        TelegramChannel(city="München", name="Канал 1", url="https://t.me/a", messages=[
+            TelegramMessage(text="сдаю квартиру \"центр\" <50m²>", sender="@user", date=date, duplicates=["https://t.me/b"]),
+            TelegramMessage(text="второе", sender=None, date=None),
+        ]),
+        TelegramChannel(city="Berlin", name="empty", url="https://t.me/b", messages=[]),
+        TelegramChannel(city="Köln", name="not parsed", url="https://t.me/c", messages=None),
+    ])
+
+
+# кодеки с необязательными зависимостями пропускаются, если пакет не установлен
+CODEC_DEPENDENCIES = {"jsonl.zst": "zstandard", "msgpack": "msgpack"}
+
+
+def get_test_codec(name: str):
+    if name in CODEC_DEPENDENCIES:
+        pytest.importorskip(CODEC_DEPENDENCIES[name])
+    return CODECS[name]
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_round_trip_and_detection(tmp_path, name):
+    codec = get_test_codec(name)
+    path = str(tmp_path / f"snapshot.{codec.extension}")
+    container = make_container()
+
+    write_container(path, container, codec)
+
+    assert detect_codec(path) is codec
+    assert read_container(path) == container
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_empty_snapshot(tmp_path, name):
+    codec = get_test_codec(name)
+    path = str(tmp_path / f"snapshot.{codec.extension}")
+
+    write_container(path, Container(channels=[]), codec)
+
+    assert read_container(path) == Container(channels=[])
+
+
+def test_json_matches_previous_format(tmp_path):
+    path = tmp_path / "snapshot.json"
+    container = make_container()
+
+    write_container(str(path), container, CODECS["json"])
+
+    assert Container.from_json(path.read_text(encoding="utf-8")) == container
+
+
+def test_iter_channels_is_lazy(tmp_path):
+    path = str(tmp_path / "snapshot.jsonl")
+    write_container(path, make_container(), CODECS["jsonl"])
+
+    channels = iter_channels(path)
+
+    assert next(channels).url == "https://t.me/a"
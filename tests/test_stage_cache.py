@@ -0,0 +1,142 @@
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+import stage_cache
+from models import Container, TelegramChannel, TelegramMessage
+from services.base import Service
+from services.tg.dedup_service import TgDedupService
+from stage_cache import StageCache
+
+
+def container(*texts):
+    return Container(channels=[
+        TelegramChannel(city="A", name="a", url="https://t.me/a", messages=[TelegramMessage(text=t) for t in texts]),
+    ])
+
+
+def fingerprint(cache, service_cls=TgDedupService, params=None, data=None, name="TgDedupService"):
+    return asyncio.run(cache.fingerprint(name, service_cls, params or {"threshold": .8}, data or container("x")))
+
+
+def test_identical_inputs_hit(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = fingerprint(cache)
+    asyncio.run(cache.save("TgDedupService", key, container("result")))
+
+    again = fingerprint(StageCache(str(tmp_path)))
+
+    assert again == key
+    assert asyncio.run(cache.load("TgDedupService", again)) == container("result")
+
+
+def test_params_and_input_change_the_key(tmp_path):
+    cache = StageCache(str(tmp_path))
+    key = fingerprint(cache)
+
+    assert fingerprint(cache, params={"threshold": .9}) != key
+    assert fingerprint(cache, data=container("y")) != key
+    assert fingerprint(cache, name="Other") != key
+    assert asyncio.run(cache.load("TgDedupService", fingerprint(cache, data=container("y")))) is None
+
+
+def test_artifact_change_changes_the_key(tmp_path):
+    class ModelService(Service):
+        CACHE_ARTIFACT_PARAMS = ("model_path",)
+
+    model = tmp_path / "model.bin"
+    model.write_bytes(b"v1")
+    cache = StageCache(str(tmp_path / "cache"))
+    params = {"model_path": str(model)}
+    key = fingerprint(cache, ModelService, params)
+
+    model.write_bytes(b"version 2")
+
+    assert fingerprint(cache, ModelService, params) != key
+
+
+def test_cache_version_changes_the_key(tmp_path):
+    class Versioned(TgDedupService):
+        CACHE_VERSION = 2
+
+    cache = StageCache(str(tmp_path))
+
+    assert fingerprint(cache, Versioned) != fingerprint(cache)
+
+
+def test_transitively_imported_module_changes_the_key(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "fake_helper.py").write_text("def helper():\n    return 1\n")
+    (repo / "fake_service.py").write_text(
+        "from services.base import Service\nfrom fake_helper import helper\n\n\nclass FakeService(Service):\n    pass\n"
+    )
+    monkeypatch.setattr(stage_cache, "REPO_ROOT", str(repo))
+    monkeypatch.syspath_prepend(str(repo))
+    service_cls = importlib.import_module("fake_service").FakeService
+    cache = StageCache(str(tmp_path / "cache"))
+
+    try:
+        sources = {os.path.basename(p) for p in cache._module_sources(service_cls)}
+        key = fingerprint(cache, service_cls)
+        (repo / "fake_helper.py").write_text("def helper():\n    return 2  # changed\n")
+        changed = fingerprint(cache, service_cls)
+    finally:
+        sys.modules.pop("fake_service", None)
+        sys.modules.pop("fake_helper", None)
+
+    assert sources == {"fake_service.py", "fake_helper.py"}
+    assert changed != key
+
+
+def test_service_sources_include_repo_modules_only():
+    sources = {os.path.relpath(p, stage_cache.REPO_ROOT) for p in StageCache._module_sources(TgDedupService)}
+
+    assert {os.path.join("services", "tg", "dedup_service.py"), "models.py", "streaming.py"} <= sources
+    assert all(not p.startswith("..") for p in sources)
+
+
+def save_entries(cache_dir, count):
+    """Записи с возрастающим временем использования: keys[0] — самая старая."""
+    unbounded = StageCache(cache_dir, max_entries=None, max_age_days=None)
+    keys = [f"{i:064x}" for i in range(count)]
+    for i, key in enumerate(keys):
+        asyncio.run(unbounded.save("Svc", key, container(str(i))))
+        os.utime(unbounded._path("Svc", key), (time.time() - (count - i) * 60,) * 2)
+    return keys
+
+
+def entries(cache):
+    return sorted(os.listdir(os.path.join(cache.cache_dir, "Svc")))
+
+
+def test_prune_keeps_most_recently_used_entries(tmp_path):
+    keys = save_entries(str(tmp_path), 5)
+    cache = StageCache(str(tmp_path), max_entries=3, max_age_days=None)
+
+    assert asyncio.run(cache.load("Svc", keys[0])) is not None  # попадание освежает запись
+    asyncio.run(cache.save("Svc", "f" * 64, container("new")))
+
+    kept = {name.split(".")[0] for name in entries(cache)}
+    assert kept == {keys[0], keys[4], "f" * 64}
+
+
+def test_prune_drops_entries_older_than_max_age(tmp_path):
+    keys = save_entries(str(tmp_path), 2)
+    cache = StageCache(str(tmp_path), max_entries=None, max_age_days=1)
+    os.utime(cache._path("Svc", keys[0]), (time.time() - 2 * 86400,) * 2)
+
+    assert cache.prune("Svc") == 1
+    assert entries(cache) == [os.path.basename(cache._path("Svc", keys[1]))]
+
+
+def test_prune_without_limits_and_missing_directory(tmp_path):
+    save_entries(str(tmp_path), 3)
+    cache = StageCache(str(tmp_path), max_entries=None, max_age_days=None)
+
+    assert cache.prune("Svc") == 0
+    assert cache.prune("Unknown") == 0
@@ -0,0 +1,124 @@
+import asyncio
+
+from models import Container, TelegramChannel, TelegramMessage
+from services.tg.crawl_scheduler import CrawlScheduler
+from streaming import ChunkStream
+
+
+def chunk(url: str, n_messages: int) -> Container:
+    messages = [TelegramMessage(text=f"{url} {i}") for i in range(n_messages)]
+    return Container(channels=[TelegramChannel(city="A", name=url, url=url, messages=messages)])
+
+
+def test_batches_merge_ready_chunks_up_to_limit():
+    async def scenario():
+        stream = ChunkStream(maxsize=10)
+        for i in range(5):
+            await stream.put(chunk(f"u{i}", 2))
+        await stream.close()
+        return [[c.url for c in batch.channels] async for batch in stream.batches(max_messages=4)]
+
+    assert asyncio.run(scenario()) == [["u0", "u1"], ["u2", "u3"], ["u4"]]
+
+
+def test_batches_do_not_wait_for_a_slow_producer():
+    async def scenario():
+        stream = ChunkStream()
+        received = []
+
+        async def consume():
+            async for batch in stream.batches(max_messages=100):
+                received.append([c.url for c in batch.channels])
+
+        consumer = asyncio.ensure_future(consume())
+        await stream.put(chunk("u0", 1))
+        await asyncio.sleep(0.01)
+        first = list(received)
+        await stream.put(chunk("u1", 1))
+        await stream.close()
+        await consumer
+        return first, received
+
+    first, received = asyncio.run(scenario())
+    assert first == [["u0"]]
+    assert received == [["u0"], ["u1"]]
+
+
+def test_batch_size_override():
+    async def scenario():
+        stream = ChunkStream(batch_messages=1)
+        await stream.put(chunk("u0", 1))
+        await stream.put(chunk("u1", 1))
+        await stream.close()
+        return [len(batch.channels) async for batch in stream.batches(max_messages=100)]
+
+    assert asyncio.run(scenario()) == [1, 1]
+
+
+def test_collect_returns_all_channels():
+    async def scenario():
+        stream = ChunkStream()
+        await stream.put(chunk("u0", 1))
+        await stream.put(chunk("u1", 0))
+        await stream.close()
+        return await stream.collect()
+
+    assert [c.url for c in asyncio.run(scenario()).channels] == ["u0", "u1"]
+
+
+def test_put_blocks_when_queue_is_full():
+    async def scenario():
+        stream = ChunkStream(maxsize=1)
+        await stream.put(chunk("u0", 1))
+        blocked = asyncio.ensure_future(stream.put(chunk("u1", 1)))
+        await asyncio.sleep(0.01)
+        was_blocked = not blocked.done()
+        await stream.__anext__()
+        await asyncio.wait_for(blocked, 1)
+        return was_blocked
+
+    assert asyncio.run(scenario())
+
+
+def test_scheduler_stream_yields_in_completion_order_and_keeps_errors():
+    async def items():
+        for delay in (0.05, 0.01, "boom"):
+            yield delay
+
+    async def worker(delay):
+        if delay == "boom":
+            raise RuntimeError("boom")
+        await asyncio.sleep(delay)
+        return delay * 2
+
+    async def scenario():
+        scheduler = CrawlScheduler(max_concurrency=3)
+        return [pair async for pair in scheduler.stream(items(), worker, describe=str)]
+
+    results = asyncio.run(scenario())
+    assert [item for item, _ in results] == ["boom", 0.01, 0.05]
+    assert isinstance(results[0][1], RuntimeError)
+    assert results[1][1] == 0.02
+
+
+def test_scheduler_stream_respects_concurrency():
+    active = peak = 0
+
+    async def items():
+        for i in range(8):
+            yield i
+
+    async def worker(i):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return i
+
+    async def scenario():
+        scheduler = CrawlScheduler(max_concurrency=2)
+        return sorted([result async for _, result in scheduler.stream(items(), worker)])
+
+    assert asyncio.run(scenario()) == list(range(8))
+    assert peak == 2
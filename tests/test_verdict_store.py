@@ -0,0 +1,40 @@
+from storage.verdict_store import VerdictStore
+
+
+def test_verdicts_are_keyed_by_prompt_version_and_model(tmp_path):
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite"))
+
+    store.put_many("ads", "v1", "flash", {"h1": 1, "h2": 0})
+
+    assert store.get_many("ads", "v1", "flash", ["h1", "h2", "h3"]) == {"h1": 1, "h2": 0}
+    assert store.get_many("ads", "v2", "flash", ["h1"]) == {}
+    assert store.get_many("ads", "v1", "pro", ["h1"]) == {}
+
+
+def test_invalidate_stale_drops_other_prompt_versions(tmp_path):
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite"))
+    store.put_many("ads", "v1", "flash", {"old": 1})
+    store.put_many("ads", "v2", "flash", {"new": 1})
+    store.put_many("other", "v1", "flash", {"kept": 0})
+
+    assert store.invalidate_stale("ads", "v2") == 1
+
+    assert store.get_many("ads", "v2", "flash", ["new"]) == {"new": 1}
+    assert store.get_many("other", "v1", "flash", ["kept"]) == {"kept": 0}
+
+
+def test_expired_verdicts_are_ignored_and_pruned(tmp_path):
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite"), ttl_days=1)
+    store.put_many("ads", "v1", "flash", {"h": 1})
+    store._execute("UPDATE verdicts SET created_at = created_at - 2 * 86400")
+
+    assert store.get_many("ads", "v1", "flash", ["h"]) == {}
+    assert store.invalidate_stale("ads", "v1") == 1
+
+
+def test_lookup_is_chunked(tmp_path):
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite"))
+    verdicts = {f"h{i}": i % 2 for i in range(VerdictStore._CHUNK * 2 + 7)}
+    store.put_many("ads", "v1", "flash", verdicts)
+
+    assert store.get_many("ads", "v1", "flash", verdicts) == verdicts
@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from telethon import types
+
+
+class FakeTelegramClient:
+    """
+    Минимальная замена TelegramClient для тестов TgParserService:
+    история каналов в памяти, запись всех запросов.
+    """
+
+    def __init__(self, history=None, users=None):
+        self.history = history or {}   # entity_id -> [сообщения]
+        self.users = users or {}       # sender_id -> объект пользователя
+        self.requests = []
+        self.entity_lookups = []
+        self.iter_calls = []
+        self.handlers = []
+        self.disconnected = None  # future, выставляется тестом режима реального времени
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        self.requests.append(request)
+
+    async def get_entity(self, what):
+        self.entity_lookups.append(what)
+        if isinstance(what, list):
+            return [self.users[sender_id] for sender_id in what]
+        return types.InputPeerChannel(channel_id=int(what.rsplit("_", 1)[-1]), access_hash=1)
+
+    async def iter_messages(self, entity, offset_date=None, reverse=False, min_id=0):
+        self.iter_calls.append((entity.channel_id, min_id))
+        for msg in self.history.get(entity.channel_id, []):
+            if msg.id > min_id:
+                yield msg
+
+    def add_event_handler(self, callback, event):
+        self.handlers.append(callback)
+
+    def remove_event_handler(self, callback, event):
+        self.handlers.remove(callback)
+
+
+def fake_message(msg_id, text, sender_id=1, date=None):
+    """Сообщение Telethon с полями, которые читает парсер."""
+
+    async def get_sender():
+        raise ConnectionError("no network in tests")
+
+    return SimpleNamespace(
+        id=msg_id, text=text, sender_id=sender_id, sender=None, get_sender=get_sender,
+        date=date or datetime.now(timezone.utc),
+    )
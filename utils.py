@@ -1,8 +1,11 @@
 import json
-import aiofiles
+import hashlib
+import unicodedata
+import asyncio
 from typing import Tuple
 
-from models import TelegramChannel, Container
+from models import Container
+from snapshot_codec import read_container
 
 def get_prompt_by_id(promt_path: str, prompt_id: str) -> Tuple[str, str]:
     """
@@ -28,18 +31,28 @@ def get_prompt_by_id(promt_path: str, prompt_id: str) -> Tuple[str, str]:
     raise ValueError(f"Prompt with id '{prompt_id}' not found in {promt_path}")
 
 
-async def load_channels(input_file: str) -> Container:
-    """Load a list of channels from a JSON file.
-
-    The JSON may contain serialized channel objects. This function reads the
-    file asynchronously and returns a Container of TelegramChannel objects.
+def normalize_text(text: str) -> str:
     """
-    async with aiofiles.open(input_file, "r", encoding="utf-8") as f:
-        raw = await f.read()
-    data = json.loads(raw)
+    Normalizes message text for hashing: unicode NFC form and collapsed whitespace.
+    Case and punctuation are preserved, because they matter for the models.
+    """
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
 
-    raw_channels = data.get("channels", [])
+def text_hash(*parts: str) -> str:
+    """Returns a stable sha256 hex digest of the given string parts."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
 
-    channels = [TelegramChannel.from_dict(item) for item in raw_channels]
 
-    return Container(channels=channels)
\ No newline at end of file
+async def load_channels(input_file: str) -> Container:
+    """Load a list of channels from a snapshot file.
+
+    Any snapshot format written by SessionManager (JSON, JSON Lines, gzip/zstd
+    compressed JSON Lines, msgpack) is accepted; the format is detected from the
+    file contents. Decoding runs in a worker thread.
+    """
+    return await asyncio.to_thread(read_container, input_file)